@@ -40,16 +40,44 @@ else:
 
 #utils
 from utils import buildRange
+from utils import prefixEnd
 
 # clients
 from greenclient import Client
 from secureclient import SecureClient
 from threadedclient import ThreadedClient
 
+# write combining and durability
+from combiner import WriteCombiner
+from durable import DurableWriter
+
+# clusters
+from cluster import Cluster
+from replication import ReplicatedCluster
+from erasure import ErasureCodedCluster
+
+# caching
+from cache import ReadCache
+from cache import NegativeCache
+from cache import VersionCache
+from sharedcache import SharedMemoryStore
+
+# receive buffers
+from bufferpool import BufferPool
+
+# compression
+from compression import Compressor
+from compression import CompressionPolicy
+from dictionary import DictionaryStore
+
+# small objects
+from packing import PackedStore
+
 # common
 from common import KeyRange
 from common import Entry
 from common import Peer
+from common import ReadCoalescing
 
 # exceptions
 from common import KineticMessageException
@@ -16,6 +16,7 @@
 
 #@author: Ignacio Corderi
 
+import copy
 import deprecated
 from common import Entry
 import common
@@ -27,15 +28,61 @@ import threading
 
 LOG = logging.getLogger(__name__)
 
+# reads that can share an in flight request, and the writes that detach them
+_COALESCED = (operations.Get, operations.GetMetadata, operations.GetVersion)
+_INVALIDATING = (operations.Put, operations.Delete)
+
+
+def _key(args, kwargs):
+    return args[0] if args else kwargs.get('key')
+
+
+def _params(args, kwargs):
+    # what a read asks for besides its key, None if it cannot be compared
+    params = (tuple(args[1:]), tuple(sorted((k, v) for k, v in kwargs.items() if k != 'key')))
+    try:
+        hash(params)
+    except TypeError:
+        return None
+    return params
+
+
+def _share(r, count, mode):
+    """
+    Returns the result of a shared read for each of count callers.
+    """
+    if not isinstance(r, Entry) or count == 1:
+        # nothing a caller can change under the others
+        return [r] * count
+    if isinstance(r.value, str):
+        value = r.value
+    elif mode == common.ReadCoalescing.READONLY:
+        # one immutable copy for everybody
+        value = str(r.value)
+    else:
+        # the first caller owns the value received, the rest get their own copy
+        value = getattr(r.value, 'view', r.value) # pooled buffers
+        return [r] + [Entry(r.key, bytearray(value), copy.copy(r.metadata))
+                      for _ in xrange(count - 1)]
+    # every caller gets its own entry, sharing the immutable value
+    return [Entry(r.key, value, copy.copy(r.metadata)) for _ in xrange(count)]
+
+
 class BaseAsync(deprecated.BlockingClient):
 
     def __init__(self, *args, **kwargs):
+        self.coalesce_reads = kwargs.pop('coalesce_reads', common.ReadCoalescing.NONE)
+        # optional compression.Compressor
+        self.compression = kwargs.pop('compression', None)
         super(BaseAsync, self).__init__(*args, socket_timeout=None, **kwargs)
         self.unhandledException = lambda e: LOG.warn("Unhandled client exception. " + str(e))
         self.faulted = False
         self.error = None
+        self.coalesced_reads = 0
         # private attributes
         self._pending = dict()
+        self._flights = dict()
+        self._unsent_sinks = dict() # id(header) -> (header, sink)
          # start background workers
         self._initialize()
 
@@ -73,6 +120,8 @@ class BaseAsync(deprecated.BlockingClient):
             except Exception as e2:
                 LOG.error("Unhandled exception on callers code when reporting internal error. {0}".format(e2))
         self._pending = {}
+        self._sinks.clear()
+        self._unsent_sinks.clear()
 
 
     def _async_recv(self):
@@ -95,6 +144,7 @@ class BaseAsync(deprecated.BlockingClient):
                     LOG.debug("Received message with ackSequence={0} on connection {1}.".format(seq,self))
                 onSuccess,_ = self._pending[seq]
                 del self._pending[seq]
+                self._sinks.pop(seq, None)
                 try:
                     self.dispatch(onSuccess, m, resp, value)
                 except Exception as e:
@@ -129,6 +179,28 @@ class BaseAsync(deprecated.BlockingClient):
         if d.error: raise d.error
         return d.result
 
+    def _wait_for(self, start):
+        """
+        Calls start(onSuccess, onError) and blocks until one of them is called.
+        """
+        done = threading.Event()
+        outcome = []
+
+        def innerSuccess(r):
+            outcome.append((r, None))
+            done.set()
+
+        def innerError(e):
+            outcome.append((None, e))
+            done.set()
+
+        start(innerSuccess, innerError)
+
+        done.wait()
+        r, e = outcome[0]
+        if e: raise e
+        return r
+
     ###
 
 
@@ -155,6 +227,10 @@ class BaseAsync(deprecated.BlockingClient):
         if not no_ack:
             # add callback to pending dictionary
             self._pending[command.header.sequence] = (innerSuccess, onError)
+            staged = self._unsent_sinks.pop(id(command), None) if self._unsent_sinks else None
+            if staged and staged[0] is command:
+                # the value of the response goes to the sink
+                self._sinks[command.header.sequence] = staged[1]
 
         # transmit
         self.network_send(command, value)
@@ -162,11 +238,86 @@ class BaseAsync(deprecated.BlockingClient):
 
     def _process(self, op, *args, **kwargs):
         if not self.isConnected: raise common.NotConnected("Must call connect() before sending operations.")
+        op.codec = self.compression
+        if self.coalesce_reads and type(op) in _COALESCED:
+            # blocking reads wait on the shared in flight request, call this
+            # class' implementation since subclass hooks already ran for op
+            return self._wait_for(lambda onSuccess, onError:
+                BaseAsync._processAsync(self, op, onSuccess, onError, *args, **kwargs))
+        if type(op) is operations.GetInto:
+            # the value must be received by the reader, not on the caller's read
+            return self._wait_for(lambda onSuccess, onError:
+                self._processAsync(op, onSuccess, onError, *args, **kwargs))
+        if type(op) in _INVALIDATING:
+            self._land(_key(args, kwargs))
         return super(BaseAsync, self)._process(op, *args, **kwargs)
 
 
+    def _land(self, key):
+        # readers arriving after a write must not get a value read before it,
+        # the callers already waiting still get the in flight result
+        for t in _COALESCED:
+            self._flights.pop((t, key), None)
+
+
+    def _coalesce(self, op, onSuccess, onError, args, kwargs):
+        """
+        Attaches the callbacks to the in flight read of the same type, key
+        and arguments (i.e. timeout, priority), or registers a new flight.
+        Returns the callbacks to send the request with, or None if it was
+        attached.
+        """
+        params = _params(args, kwargs)
+        if params is None:
+            return onSuccess, onError
+        flight = (type(op), _key(args, kwargs))
+        flights = self._flights.setdefault(flight, {})
+        waiters = flights.get(params)
+        if waiters is not None:
+            waiters.append((onSuccess, onError))
+            self.coalesced_reads += 1
+            return None
+
+        waiters = flights[params] = [(onSuccess, onError)]
+
+        def land():
+            flights = self._flights.get(flight)
+            if flights is not None and flights.get(params) is waiters:
+                del flights[params]
+                if not flights:
+                    del self._flights[flight]
+
+        def sharedSuccess(r):
+            land()
+            results = _share(r, len(waiters), self.coalesce_reads)
+            for (success, _), result in zip(waiters, results):
+                try:
+                    success(result)
+                except Exception as ex:
+                    self.unhandledException(ex)
+
+        def sharedError(e):
+            land()
+            for _, error in waiters:
+                try:
+                    error(e)
+                except Exception as ex:
+                    self.unhandledException(ex)
+
+        return sharedSuccess, sharedError
+
+
     def _processAsync(self, op, onSuccess, onError, *args, **kwargs):
         if not self.isConnected: raise common.NotConnected("Must call connect() before sending operations.")
+        op.codec = self.compression
+
+        if self.coalesce_reads and type(op) in _COALESCED:
+            callbacks = self._coalesce(op, onSuccess, onError, args, kwargs)
+            if not callbacks:
+                return
+            onSuccess, onError = callbacks
+        elif type(op) in _INVALIDATING:
+            self._land(_key(args, kwargs))
 
         def innerSuccess(m, header, value):
             onSuccess(op.parse(header, value))
@@ -185,7 +336,27 @@ class BaseAsync(deprecated.BlockingClient):
             send_no_ack = False
 
         header, value = op.build(*args, **kwargs)
-        self.sendAsync(header, value, innerSuccess, innerError, send_no_ack)
+        sink = getattr(op, 'sink', None)
+        if sink:
+            # bound to the sequence once the header gets one
+            self._unsent_sinks[id(header)] = (header, sink)
+            error = innerError
+
+            def innerError(e):
+                # i.e. failed fast, never sent
+                self._unstage(header)
+                error(e)
+        try:
+            self.sendAsync(header, value, innerSuccess, innerError, send_no_ack)
+        except:
+            if sink:
+                self._unstage(header)
+            raise
+
+    def _unstage(self, header):
+        staged = self._unsent_sinks.get(id(header))
+        if staged and staged[0] is header:
+            del self._unsent_sinks[id(header)]
 
 
     def putAsync(self, onSuccess, onError, *args, **kwargs):
@@ -197,6 +368,23 @@ class BaseAsync(deprecated.BlockingClient):
     def getMetadataAsync(self, onSuccess, onError, *args, **kwargs):
         self._processAsync(operations.GetMetadata(), onSuccess, onError, *args, **kwargs)
 
+    def get_into_async(self, onSuccess, onError, *args, **kwargs):
+        self._processAsync(operations.GetInto(), onSuccess, onError, *args, **kwargs)
+
+    def get_into(self, key, target, offset=None):
+        """
+        Reads the value of key straight from the socket into target at
+        offset. target is a writable buffer (bytearray, mmap, uint8 numpy
+        array...), offset 0 if None, or a file object or descriptor, its
+        current position if None; see :func:`~zero_copy.make_sink`. Other
+        requests stay pipelined, the reader moves on to the next response
+        once the value is written.
+
+        Returns the entry with the number of bytes written as value, or
+        None if key is not found.
+        """
+        return self._process(operations.GetInto(), key, target, offset)
+
     def deleteAsync(self, onSuccess, onError, *args, **kwargs):
         self._processAsync(operations.Delete(), onSuccess, onError, *args, **kwargs)
 
@@ -212,6 +400,15 @@ class BaseAsync(deprecated.BlockingClient):
     def getVersionAsync(self, onSuccess, onError, *args, **kwargs):
         self._processAsync(operations.GetVersion(), onSuccess, onError, *args, **kwargs)
 
+    def startBatchAsync(self, onSuccess, onError, *args, **kwargs):
+        self._processAsync(operations.StartBatch(), onSuccess, onError, *args, **kwargs)
+
+    def endBatchAsync(self, onSuccess, onError, *args, **kwargs):
+        self._processAsync(operations.EndBatch(), onSuccess, onError, *args, **kwargs)
+
+    def abortBatchAsync(self, onSuccess, onError, *args, **kwargs):
+        self._processAsync(operations.AbortBatch(), onSuccess, onError, *args, **kwargs)
+
     def flushAsync(self, onSuccess, onError, *args, **kwargs):
         self._processAsync(operations.Flush(), onSuccess, onError, *args, **kwargs)
 
@@ -67,7 +67,7 @@ class BaseClient(object):
                  socket_timeout=common.DEFAULT_SOCKET_TIMEOUT,
                  socket_address=None, socket_port=0,
                  defer_read=False,
-                 use_ssl=False, pin=None):
+                 use_ssl=False, pin=None, socket_path=None, buffer_pool=None):
         self.hostname = hostname
         self.port = port
         self.identity = identity
@@ -86,7 +86,11 @@ class BaseClient(object):
         self.wait_on_read = None
         self.use_ssl = use_ssl
         self.pin = pin
+        self.socket_path = socket_path
+        self.buffer_pool = buffer_pool
         self.on_unsolicited = None
+        # ackSequence -> sink receiving the value of that response
+        self._sinks = {}
 
     @property
     def socket(self):
@@ -108,20 +112,26 @@ class BaseClient(object):
         if self._socket:
             raise common.AlreadyConnected("Client is already connected.")
 
-        infos = socket.getaddrinfo(self.hostname, self.port, 0, 0, socket.SOL_TCP)
-        (family,_,_,_, sockaddr) = infos[0]
-        # Stage socket on a local variable first
-        s = self.build_socket(family)
-        if self.use_ssl:
-            s = self.wrap_secure_socket(s, ssl.PROTOCOL_TLSv1_2)
-
-        s.settimeout(self.connect_timeout)
-        if self.socket_address:
-            LOG.debug("Client local port address bound to " + self.socket_address)
-            s.bind((self.socket_address, self.socket_port))
-        # if connect fails, there is nothing to clean up
-        s.connect(sockaddr) # use first
-        s.setsockopt(ss.IPPROTO_TCP, ss.TCP_NODELAY, 1)
+        if self.socket_path:
+            # local proxy (see kinetic.proxy) instead of the device itself
+            s = self.build_socket(ss.AF_UNIX)
+            s.settimeout(self.connect_timeout)
+            s.connect(self.socket_path)
+        else:
+            infos = socket.getaddrinfo(self.hostname, self.port, 0, 0, socket.SOL_TCP)
+            (family,_,_,_, sockaddr) = infos[0]
+            # Stage socket on a local variable first
+            s = self.build_socket(family)
+            if self.use_ssl:
+                s = self.wrap_secure_socket(s, ssl.PROTOCOL_TLSv1_2)
+
+            s.settimeout(self.connect_timeout)
+            if self.socket_address:
+                LOG.debug("Client local port address bound to " + self.socket_address)
+                s.bind((self.socket_address, self.socket_port))
+            # if connect fails, there is nothing to clean up
+            s.connect(sockaddr) # use first
+            s.setsockopt(ss.IPPROTO_TCP, ss.TCP_NODELAY, 1)
 
         # We are connected now, update attributes
         self._socket = s
@@ -278,14 +288,30 @@ class BaseClient(object):
 
     def fast_read(self, toread):
         buf = bytearray(toread)
-        view = memoryview(buf)
+        self.read_into(memoryview(buf))
+        return buf
+
+    def read_into(self, view):
+        """
+        Fills the memoryview view from the socket.
+        """
+        toread = len(view)
         while toread:
             nbytes = self.socket.recv_into(view, toread)
             if nbytes == 0:
                 raise common.ServerDisconnect("Connection closed by peer")
             view = view[nbytes:]
             toread -= nbytes
-        return buf
+
+    def skip(self, toread):
+        """
+        Reads and discards toread bytes from the socket.
+        """
+        view = memoryview(bytearray(min(toread, self.chunk_size)))
+        while toread:
+            n = min(toread, len(view))
+            self.read_into(view[:n])
+            toread -= n
 
     def _recv_delimited_v2(self):
         # receive the leading 9 bytes
@@ -305,9 +331,23 @@ class BaseClient(object):
         # read proto message
         raw_proto = self.fast_read(proto_ln)
 
+        proto = messages.Message()
+        proto.ParseFromString(str(raw_proto))
+
         value = ''
         if value_ln > 0:
-            if self.defer_read:
+            sink = self._sinks and self._sinkFor(proto)
+            if sink:
+                # the value goes straight to its target
+                value = sink.receive(self, value_ln)
+            elif self.buffer_pool and value_ln >= self.buffer_pool.min_size:
+                value = self.buffer_pool.acquire(value_ln)
+                try:
+                    self.read_into(value.view)
+                except:
+                    value.release()
+                    raise
+            elif self.defer_read:
                 # let user handle the read from socket
                 value = common.DeferedValue(self.socket, value_ln)
                 self.wait_on_read = value
@@ -315,11 +355,13 @@ class BaseClient(object):
                 # normal code path, read value
                 value = self.fast_read(value_ln)
 
-        proto = messages.Message()
-        proto.ParseFromString(str(raw_proto))
-
         return (proto, value)
 
+    def _sinkFor(self, m):
+        cmd = messages.Command()
+        cmd.ParseFromString(m.commandBytes)
+        return self._sinks.get(cmd.header.ackSequence)
+
     def network_recv(self):
         """
         Receives a raw Kinetic message from the network.
@@ -389,5 +431,7 @@ class BaseClient(object):
     ### Object overrides ###
 
     def __str__(self):
+        if self.socket_path:
+            return self.socket_path
         return "{hostname}:{port}".format(hostname=self.hostname, port=self.port)
 
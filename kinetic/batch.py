@@ -17,6 +17,7 @@
 #@author: Paul Dardeau
 
 import common
+import eventlet
 import logging
 import operations
 
@@ -123,7 +124,7 @@ class Batch(object):
         try:
             self._client._process(operations.EndBatch(), *args, **kwargs)
             self._batch_completed = True
-        except BatchAbortedException:
+        except common.BatchAbortedException:
             self._batch_completed = True
             raise
 
@@ -158,3 +159,225 @@ class Batch(object):
         """
         return self._op_count
 
+
+
+class _DeviceBatch(object):
+
+    def __init__(self, batch_id):
+        self.batch_id = batch_id
+        self.op_count = 0
+        self.error = None
+        self.holding = True # one of the client's batch slots
+
+    def fail(self, e):
+        if not self.error:
+            self.error = e
+
+    def release(self, client):
+        if self.holding:
+            self.holding = False
+            client._batch_slots.release()
+
+
+def _ignore(*args): pass
+
+
+def _abandon(client, b):
+    # aborts the device batch of an AsyncBatch dropped while open
+    def release(*args):
+        b.release(client)
+    try:
+        client.abortBatchAsync(release, release, batch_id=b.batch_id)
+    except Exception as e:
+        LOG.debug('Aborting batch {0} failed. {1}'.format(b.batch_id, e))
+        release()
+
+
+class AsyncBatch(object):
+    """
+    Non-blocking counterpart of :class:`Batch`, obtained by calling
+    :func:`~greenclient.Client.begin_batch_async`.
+
+    Operations are pipelined to the device as they are added and 'commit'
+    and 'abort' return a :class:`~common.Future` instead of blocking.
+
+    A batch with more operations than the device accepts per batch
+    (limits.maxOperationCountPerBatch) is split automatically into several
+    device batches. Each device batch is committed as soon as it is full,
+    so atomicity is only guaranteed within a device batch. The client keeps
+    at most limits.maxBatchCountPerDevice device batches in flight; adding an
+    operation blocks while none are available.
+
+    Used in a with statement, the batch is committed when the block exits
+    (aborted if it raised). A batch dropped while still open is aborted.
+    """
+
+    def __init__(self, client, max_operations=None):
+        """
+        Initialize instance with Kinetic client.
+
+        Args:
+            client: the Kinetic client to use for batch operations.
+            max_operations: operations per device batch, defaults to the
+                device's limits.maxOperationCountPerBatch.
+        """
+        self._client = client
+        self._max_operations = max_operations or \
+            client.limits.maxOperationCountPerBatch
+        self._op_count = 0
+        self._batch_completed = False
+        self._current = None
+        self._futures = []
+
+    def _open(self):
+        self._client._batch_slots.acquire()
+        b = _DeviceBatch(self._client.next_batch_id())
+
+        def onError(e):
+            # no device batch to end, the slot is free again
+            b.fail(e)
+            b.release(self._client)
+
+        try:
+            self._client.startBatchAsync(_ignore, onError, batch_id=b.batch_id)
+        except:
+            b.release(self._client)
+            raise
+        return b
+
+    def _close(self, op, **kwargs):
+        b = self._current
+        self._current = None
+        future = common.Future()
+        if not b.holding:
+            future.set_exception(b.error)
+            return future
+
+        def onSuccess(r):
+            b.release(self._client)
+            if b.error:
+                future.set_exception(b.error)
+            else:
+                future.set_result(b.op_count)
+
+        def onError(e):
+            b.release(self._client)
+            future.set_exception(e)
+
+        try:
+            op(onSuccess, onError, batch_id=b.batch_id, **kwargs)
+        except Exception as e:
+            onError(e)
+        return future
+
+    def _add(self, op, args, kwargs):
+        if self._batch_completed:
+            raise common.BatchCompletedException()
+
+        if self._current and self._max_operations and \
+           self._current.op_count >= self._max_operations:
+            self._futures.append(self._close(self._client.endBatchAsync,
+                                 batch_op_count=self._current.op_count))
+        if not self._current:
+            self._current = self._open()
+
+        b = self._current
+        kwargs['batch_id'] = b.batch_id
+        kwargs['no_ack'] = True
+        self._client._processAsync(op, _ignore, b.fail, *args, **kwargs)
+        b.op_count += 1
+        self._op_count += 1
+
+    def put(self, *args, **kwargs):
+        """
+        Put an entry within the batch operation, same arguments as
+        :func:`~greenclient.Client.put`.
+
+        Raises:
+            BatchCompletedException: if the batch was committed or aborted.
+        """
+        self._add(operations.Put(), args, kwargs)
+
+    def delete(self, *args, **kwargs):
+        """
+        Delete an entry within the batch operation, same arguments as
+        :func:`~greenclient.Client.delete`.
+
+        Raises:
+            BatchCompletedException: if the batch was committed or aborted.
+        """
+        self._add(operations.Delete(), args, kwargs)
+
+    def commit(self):
+        """
+        Commit the remaining operations of the batch.
+
+        Returns a future that completes with the number of operations
+        committed once every device batch is committed, or fails with the
+        first error (e.g. BatchAbortedException) if any of them did not.
+        """
+        if self._batch_completed:
+            raise common.BatchCompletedException()
+
+        self._batch_completed = True
+        if self._current:
+            self._futures.append(self._close(self._client.endBatchAsync,
+                                 batch_op_count=self._current.op_count))
+        future = common.Future()
+
+        def done(f):
+            if f.exception():
+                future.set_exception(f.exception())
+            else:
+                future.set_result(sum(f.result()))
+
+        common.Future.all(self._futures).add_done_callback(done)
+        return future
+
+    def abort(self):
+        """
+        Abort the operations of the device batch still open.
+
+        Device batches already committed because the batch was split are not
+        affected. Returns a future that completes when the abort is done.
+        """
+        if self._batch_completed:
+            raise common.BatchCompletedException()
+
+        self._batch_completed = True
+        if self._current:
+            return self._close(self._client.abortBatchAsync)
+        future = common.Future()
+        future.set_result(0)
+        return future
+
+    def is_completed(self):
+        """
+        Return boolean indicating whether the batch is completed (either
+        committed or aborted)
+        """
+        return self._batch_completed
+
+    def __len__(self):
+        """
+        Return the number of operations that have been included in the batch.
+        """
+        return self._op_count
+
+    ### with statement support ###
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, t, v, tb):
+        if self._batch_completed:
+            return
+        if t is None:
+            self.commit().result()
+        else:
+            self.abort()
+
+    def __del__(self):
+        if not self._batch_completed and self._current:
+            # may run in the hub, which cannot wait for the socket
+            eventlet.spawn_n(_abandon, self._client, self._current)
@@ -0,0 +1,99 @@
+# Copyright 2013-2015 Seagate Technology LLC.
+#
+# This Source Code Form is subject to the terms of the Mozilla
+# Public License, v. 2.0. If a copy of the MPL was not
+# distributed with this file, You can obtain one at
+# https://mozilla.org/MP:/2.0/.
+#
+# This program is distributed in the hope that it will be useful,
+# but is provided AS-IS, WITHOUT ANY WARRANTY; including without
+# the implied warranty of MERCHANTABILITY, NON-INFRINGEMENT or
+# FITNESS FOR A PARTICULAR PURPOSE. See the Mozilla Public
+# License for more details.
+#
+# See www.openkinetic.org for more project information
+#
+
+# Compare-and-swap contention benchmark.
+# Several clients (one per worker) update the same few keys with
+# Client.casPut and the round trips (messages sent) per successful update
+# are reported, with and without a VersionCache on the clients.
+#
+#   python CasContention.py -H localhost -P 8123 -w 8 -k 1 -n 200
+
+import argparse
+import time
+import eventlet
+
+from kinetic import Client
+from kinetic import VersionCache
+
+
+class CountingClient(Client):
+
+    def __init__(self, *args, **kwargs):
+        super(CountingClient, self).__init__(*args, **kwargs)
+        self.round_trips = 0
+
+    def network_send(self, command, value):
+        self.round_trips += 1
+        return super(CountingClient, self).network_send(command, value)
+
+
+def run(args, use_cache):
+    clients = []
+    for _ in xrange(args.workers):
+        c = CountingClient(args.hostname, args.port,
+                           cache=VersionCache() if use_cache else None)
+        c.connect()
+        clients.append(c)
+
+    keys = ['benchmarks/cas/%d' % i for i in xrange(args.keys)]
+    stats = {'updates': 0, 'failures': 0}
+
+    def worker(i, c):
+        for n in xrange(args.updates):
+            try:
+                c.casPut(keys[n % len(keys)], 'worker %d update %d' % (i, n))
+                stats['updates'] += 1
+            except Exception:
+                stats['failures'] += 1
+
+    start = time.time()
+    pool = eventlet.greenpool.GreenPool(args.workers)
+    for i, c in enumerate(clients):
+        pool.spawn_n(worker, i, c)
+    pool.waitall()
+    elapsed = time.time() - start
+
+    round_trips = sum(c.round_trips for c in clients)
+    for k in keys:
+        clients[0].delete(k, force=True)
+    for c in clients:
+        c.close()
+
+    print '%-14s updates: %d failures: %d round trips/update: %.2f updates/s: %.0f' % (
+        'version cache' if use_cache else 'no cache',
+        stats['updates'], stats['failures'],
+        round_trips / float(max(1, stats['updates'])),
+        stats['updates'] / elapsed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='casPut contention benchmark')
+    parser.add_argument('-H', '--hostname', default='localhost')
+    parser.add_argument('-P', '--port', type=int, default=8123)
+    parser.add_argument('-w', '--workers', type=int, default=8,
+                        help='concurrent clients')
+    parser.add_argument('-k', '--keys', type=int, default=1,
+                        help='keys shared by the workers')
+    parser.add_argument('-n', '--updates', type=int, default=200,
+                        help='updates per worker')
+    args = parser.parse_args()
+
+    run(args, False)
+    run(args, True)
+
+
+if __name__ == '__main__':
+    main()
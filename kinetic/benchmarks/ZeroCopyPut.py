@@ -0,0 +1,92 @@
+# Copyright 2013-2015 Seagate Technology LLC.
+#
+# This Source Code Form is subject to the terms of the Mozilla
+# Public License, v. 2.0. If a copy of the MPL was not
+# distributed with this file, You can obtain one at
+# https://mozilla.org/MP:/2.0/.
+#
+# This program is distributed in the hope that it will be useful,
+# but is provided AS-IS, WITHOUT ANY WARRANTY; including without
+# the implied warranty of MERCHANTABILITY, NON-INFRINGEMENT or
+# FITNESS FOR A PARTICULAR PURPOSE. See the Mozilla Public
+# License for more details.
+#
+# See www.openkinetic.org for more project information
+#
+
+# File to device put benchmark.
+# The same file is uploaded in value sized pieces reading each piece into
+# Python (buffered) and with ZeroCopyValue (sendfile), with and without the
+# SHA1 tag, and the client's CPU seconds (user + system) per GiB sent are
+# reported. Pieces of zero_copy.THREADED_DIGEST_SIZE or more are hashed in
+# eventlet's thread pool, which is counted too.
+#
+#   python ZeroCopyPut.py -H localhost -P 8123 -s 256
+
+import argparse
+import os
+import resource
+import tempfile
+import time
+
+from kinetic import Client
+from kinetic import common
+from kinetic.zero_copy import ZeroCopyValue
+
+
+def cpu():
+    r = resource.getrusage(resource.RUSAGE_SELF)
+    return r.ru_utime + r.ru_stime
+
+
+def run(args, f, size, zero_copy, checksum=True):
+    c = Client(args.hostname, args.port)
+    c.connect()
+    chunk = common.MAX_VALUE_SIZE
+    keys = []
+
+    start, start_cpu = time.time(), cpu()
+    for i, offset in enumerate(xrange(0, size, chunk)):
+        length = min(chunk, size - offset)
+        key = 'benchmarks/zerocopy/%08d' % i
+        if zero_copy:
+            value = ZeroCopyValue(f, offset, length, checksum)
+        else:
+            f.seek(offset)
+            value = f.read(length)
+        c.putAsync(lambda _: None, lambda e: None, key, value, force=True)
+        keys.append(key)
+    c.wait()
+    elapsed, used = time.time() - start, cpu() - start_cpu
+
+    c.deleteMany(keys, force=True)
+    c.close()
+
+    gib = size / float(1 << 30)
+    name = ('zero copy' if checksum else 'no tag') if zero_copy else 'buffered'
+    print '%-10s %.1f MiB in %.2fs, %.0f MiB/s, %.2f CPU s/GiB' % (
+        name, size / float(1 << 20),
+        elapsed, size / float(1 << 20) / elapsed, used / gib)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='zero copy put benchmark')
+    parser.add_argument('-H', '--hostname', default='localhost')
+    parser.add_argument('-P', '--port', type=int, default=8123)
+    parser.add_argument('-s', '--size', type=int, default=256,
+                        help='MiB to upload')
+    args = parser.parse_args()
+
+    size = args.size << 20
+    with tempfile.TemporaryFile() as f:
+        block = os.urandom(1 << 20)
+        for _ in xrange(args.size):
+            f.write(block)
+        f.flush()
+        run(args, f, size, False)
+        run(args, f, size, True)
+        run(args, f, size, True, False)
+
+
+if __name__ == '__main__':
+    main()
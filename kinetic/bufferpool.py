@@ -0,0 +1,163 @@
+# Copyright 2013-2015 Seagate Technology LLC.
+#
+# This Source Code Form is subject to the terms of the Mozilla
+# Public License, v. 2.0. If a copy of the MPL was not
+# distributed with this file, You can obtain one at
+# https://mozilla.org/MP:/2.0/.
+#
+# This program is distributed in the hope that it will be useful,
+# but is provided AS-IS, WITHOUT ANY WARRANTY; including without
+# the implied warranty of MERCHANTABILITY, NON-INFRINGEMENT or
+# FITNESS FOR A PARTICULAR PURPOSE. See the Mozilla Public
+# License for more details.
+#
+# See www.openkinetic.org for more project information
+#
+
+import threading
+
+DEFAULT_MIN_SIZE = 4*1024
+DEFAULT_MAX_BYTES = 64*1024*1024
+
+
+class PooledBuffer(object):
+    """
+    Value received into a block of a :class:`BufferPool`.
+
+    view is a memoryview of the value. release() gives the block back to
+    the pool (also on leaving a with statement), the view must not be used
+    after that since the block is reused by the next values. Buffers never
+    released are simply garbage collected.
+    """
+
+    def __init__(self, pool, block, size):
+        self._pool = pool
+        self._block = block
+        self.view = memoryview(block)[:size]
+
+    def release(self):
+        if self._block is not None:
+            self.view = None
+            block, self._block = self._block, None
+            self._pool._release(block)
+
+    @property
+    def released(self):
+        return self._block is None
+
+    def tobytes(self):
+        return self.view.tobytes()
+
+    def __len__(self):
+        return len(self.view)
+
+    def __getitem__(self, i):
+        return self.view[i]
+
+    def __str__(self):
+        return self.view.tobytes()
+
+    def __eq__(self, other):
+        if isinstance(other, PooledBuffer):
+            other = other.view
+        return self.view == other
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, t, v, tb):
+        self.release()
+
+
+class BufferPool(object):
+    """
+    Size classed pool of receive buffers, set on a client with the
+    buffer_pool argument so values of min_size bytes or more are received
+    into reused blocks instead of a new bytearray each, and returned as
+    :class:`PooledBuffer`.
+
+    Blocks are sized in powers of two from min_size, a value gets the
+    smallest class that fits it. Released blocks are kept up to max_bytes
+    in total, the rest are left to the garbage collector.
+
+    Counters: allocations (new blocks), reuses, releases, dropped (released
+    blocks not kept), see :func:`stats`.
+    """
+
+    def __init__(self, min_size=DEFAULT_MIN_SIZE, max_bytes=DEFAULT_MAX_BYTES):
+        self.min_size = min_size
+        self.max_bytes = max_bytes
+        self.allocations = 0
+        self.reuses = 0
+        self.releases = 0
+        self.dropped = 0
+        self.allocated_bytes = 0
+        self.pooled_bytes = 0
+        self._free = {} # class size -> blocks
+        self._lock = threading.Lock() # released by other threads (ThreadedClient)
+
+    def sizeClass(self, size):
+        c = self.min_size
+        while c < size:
+            c <<= 1
+        return c
+
+    def acquire(self, size):
+        """
+        Returns a :class:`PooledBuffer` of size bytes.
+        """
+        c = self.sizeClass(size)
+        with self._lock:
+            free = self._free.get(c)
+            if free:
+                block = free.pop()
+                self.pooled_bytes -= c
+                self.reuses += 1
+            else:
+                block = None
+                self.allocations += 1
+                self.allocated_bytes += c
+        if block is None:
+            block = bytearray(c)
+        return PooledBuffer(self, block, size)
+
+    def _release(self, block):
+        c = len(block)
+        with self._lock:
+            self.releases += 1
+            if self.pooled_bytes + c > self.max_bytes:
+                self.dropped += 1
+                self.allocated_bytes -= c
+                return
+            self._free.setdefault(c, []).append(block)
+            self.pooled_bytes += c
+
+    def clear(self):
+        """
+        Drops every pooled block.
+        """
+        with self._lock:
+            self.allocated_bytes -= self.pooled_bytes
+            self.pooled_bytes = 0
+            self._free = {}
+
+    def stats(self):
+        """
+        Returns the allocator counters, the bytes of the blocks allocated
+        and not dropped, pooled or in use (never released ones included),
+        and the idle blocks of every size class.
+        """
+        with self._lock:
+            return {
+                'allocations': self.allocations,
+                'reuses': self.reuses,
+                'releases': self.releases,
+                'dropped': self.dropped,
+                'allocated_bytes': self.allocated_bytes,
+                'pooled_bytes': self.pooled_bytes,
+                'in_use_bytes': self.allocated_bytes - self.pooled_bytes,
+                'free_blocks': dict((c, len(b)) for c, b in self._free.iteritems() if b),
+            }
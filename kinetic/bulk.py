@@ -0,0 +1,134 @@
+# Copyright 2013-2015 Seagate Technology LLC.
+#
+# This Source Code Form is subject to the terms of the Mozilla
+# Public License, v. 2.0. If a copy of the MPL was not
+# distributed with this file, You can obtain one at
+# https://mozilla.org/MP:/2.0/.
+#
+# This program is distributed in the hope that it will be useful,
+# but is provided AS-IS, WITHOUT ANY WARRANTY; including without
+# the implied warranty of MERCHANTABILITY, NON-INFRINGEMENT or
+# FITNESS FOR A PARTICULAR PURPOSE. See the Mozilla Public
+# License for more details.
+#
+# See www.openkinetic.org for more project information
+#
+
+# Multi-key operations over one or more Client connections.
+#
+# Every function takes a list of connected clients (requests are spread
+# round robin among them), or an object routing each key to its client with
+# clientFor(key) (i.e. a cluster.Cluster; clusters that are not routable,
+# like a replication.ReplicatedCluster, take every request themselves), and
+# an iterable of keys, or (key, value) pairs for putMany. At most `window`
+# requests are outstanding at any time, so the iterable can be arbitrarily
+# long. Results come back in input order:
+#   - as a list (default)
+#   - as an OrderedDict of key -> result with as_dict=True
+#   - as a generator of (key, result) pairs with stream=True
+# A key that fails has the exception as its result instead of aborting the
+# whole call.
+
+import collections
+import logging
+import eventlet
+from eventlet.queue import Queue
+
+import common
+
+LOG = logging.getLogger(__name__)
+
+DEFAULT_WINDOW = 64
+
+_END = object()
+
+
+def _stream(clients, method, items, split, window, kwargs):
+    q = Queue(window)
+    if hasattr(clients, 'clientFor') and not getattr(clients, 'routable', True):
+        route = lambda i, key: clients
+    elif hasattr(clients, 'clientFor'):
+        route = lambda i, key: clients.clientFor(key)
+    else:
+        route = lambda i, key: clients[i % len(clients)]
+
+    def produce():
+        error = None
+        try:
+            for i, item in enumerate(items):
+                key, args = split(item)
+                fn = getattr(route(i, key), method)
+                f = common.Future()
+                try:
+                    fn(f.set_result, f.set_exception, *args, **kwargs)
+                except Exception as e:
+                    f.set_exception(e)
+                q.put((key, f))
+        except Exception as e:
+            error = e
+        q.put((_END, error))
+
+    producer = eventlet.spawn(produce)
+    try:
+        while True:
+            key, f = q.get()
+            if key is _END:
+                if f: raise f
+                return
+            yield key, (f.exception() or f.result())
+    finally:
+        producer.kill()
+
+
+def _collect(pairs, as_dict, stream):
+    if stream:
+        return pairs
+    elif as_dict:
+        return collections.OrderedDict(pairs)
+    else:
+        return [r for _, r in pairs]
+
+
+def _key(key):
+    return key, (key,)
+
+
+def _pair(item):
+    key, value = item
+    return key, (key, value)
+
+
+def getMany(clients, keys, window=DEFAULT_WINDOW, as_dict=False, stream=False, **kwargs):
+    """
+    Gets the entries for keys, None for the ones not found.
+    """
+    return _collect(_stream(clients, 'getAsync', keys, _key, window, kwargs), as_dict, stream)
+
+
+def putMany(clients, items, window=DEFAULT_WINDOW, as_dict=False, stream=False, **kwargs):
+    """
+    Puts (key, value) pairs, extra arguments are passed to every put.
+    """
+    return _collect(_stream(clients, 'putAsync', items, _pair, window, kwargs), as_dict, stream)
+
+
+def deleteMany(clients, keys, window=DEFAULT_WINDOW, as_dict=False, stream=False, **kwargs):
+    """
+    Deletes keys, the result for each is True if it was deleted and False
+    if it was not found. Extra arguments are passed to every delete.
+    """
+    return _collect(_stream(clients, 'deleteAsync', keys, _key, window, kwargs), as_dict, stream)
+
+
+def versionMany(clients, keys, window=DEFAULT_WINDOW, as_dict=False, stream=False, **kwargs):
+    """
+    Gets the versions of keys, None for the ones not found.
+    """
+    return _collect(_stream(clients, 'getVersionAsync', keys, _key, window, kwargs), as_dict, stream)
+
+
+def metadataMany(clients, keys, window=DEFAULT_WINDOW, as_dict=False, stream=False, **kwargs):
+    """
+    Gets the metadata of keys, None for the ones not found.
+    """
+    return _collect(_stream(clients, 'getMetadataAsync', keys, _key, window, kwargs), as_dict, stream)
@@ -0,0 +1,423 @@
+# Copyright 2013-2015 Seagate Technology LLC.
+#
+# This Source Code Form is subject to the terms of the Mozilla
+# Public License, v. 2.0. If a copy of the MPL was not
+# distributed with this file, You can obtain one at
+# https://mozilla.org/MP:/2.0/.
+#
+# This program is distributed in the hope that it will be useful,
+# but is provided AS-IS, WITHOUT ANY WARRANTY; including without
+# the implied warranty of MERCHANTABILITY, NON-INFRINGEMENT or
+# FITNESS FOR A PARTICULAR PURPOSE. See the Mozilla Public
+# License for more details.
+#
+# See www.openkinetic.org for more project information
+#
+
+import collections
+import hashlib
+import logging
+import math
+import struct
+import time
+
+from common import Entry
+from common import EntryMetadata
+import kinetic_pb2 as messages
+import operations
+
+LOG = logging.getLogger(__name__)
+
+DEFAULT_MAX_BYTES = 64*1024*1024
+DEFAULT_NEGATIVE_TTL = 1 # seconds
+DEFAULT_MAX_NEGATIVE_ENTRIES = 100000
+DEFAULT_BLOOM_CAPACITY = 1000000
+DEFAULT_BLOOM_ERROR_RATE = 0.01
+DEFAULT_MAX_VERSION_ENTRIES = 100000
+
+
+class LRUStore(object):
+    """
+    In process storage for :class:`ReadCache`, evicts the least recently
+    used entries once max_bytes of keys and values are stored.
+
+    Other storages can be plugged into a ReadCache as long as they provide
+    lookup, store, invalidate and clear.
+    """
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries = collections.OrderedDict()
+
+    def lookup(self, key):
+        """
+        Returns (entry, timestamp) or None if the key is not stored.
+        """
+        item = self._entries.pop(key, None)
+        if item:
+            self._entries[key] = item
+        return item
+
+    def store(self, key, entry, timestamp):
+        self.invalidate(key)
+        n = len(key) + len(entry.value)
+        if n > self.max_bytes:
+            return
+        self._entries[key] = (entry, timestamp)
+        self.size += n
+        while self.size > self.max_bytes:
+            k, (e, _) = self._entries.popitem(last=False)
+            self.size -= len(k) + len(e.value)
+
+    def invalidate(self, key):
+        item = self._entries.pop(key, None)
+        if item:
+            self.size -= len(key) + len(item[0].value)
+
+    def clear(self):
+        self._entries.clear()
+        self.size = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+
+def _validatable(metadata):
+    # without a version or an integrity tag there is nothing to compare
+    return bool(metadata.version or metadata.algorithm)
+
+
+def _same(a, b):
+    return a.version == b.version and a.tag == b.tag and a.algorithm == b.algorithm
+
+
+class ReadCache(object):
+    """
+    Client side value cache, set it on :class:`~greenclient.Client` with
+    the cache argument or attribute.
+
+    Reads through get/getAsync are served from the cache after a metadata
+    only GET confirms the version and tag of the cached entry still match
+    the device, so a hit costs a round trip but no value transfer. Entries
+    younger than revalidate_after seconds are returned without asking the
+    device. Only entries with a version or an integrity tag are cached.
+
+    The cache is kept current by the client's own gets, puts and deletes.
+    Cached values are immutable strings shared by all readers.
+
+    Counters: hits, misses, revalidations and invalidations.
+    """
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES, revalidate_after=0, store=None):
+        self.store = LRUStore(max_bytes) if store is None else store
+        self.revalidate_after = revalidate_after
+        self.hits = 0
+        self.misses = 0
+        self.revalidations = 0
+        self.invalidations = 0
+
+    def update(self, key, value, metadata):
+        # deferred or pooled values are not ours to keep
+        if not isinstance(value, (str, bytearray)) or not _validatable(metadata):
+            self.invalidate(key)
+        else:
+            self.store.store(key, Entry(key, str(value), metadata), time.time())
+
+    def invalidate(self, key):
+        self.invalidations += 1
+        self.store.invalidate(key)
+
+    def clear(self):
+        self.store.clear()
+
+    def _fresh(self, key):
+        item = self.store.lookup(key)
+        if not item:
+            self.misses += 1
+            return None, None
+        entry, timestamp = item
+        if time.time() - timestamp < self.revalidate_after:
+            self.hits += 1
+            return entry, None
+        self.revalidations += 1
+        return None, entry
+
+    def _validated(self, key, entry, current):
+        if current and _same(entry.metadata, current.metadata):
+            self.hits += 1
+            self.store.store(key, entry, time.time())
+            return True
+        self.misses += 1
+        self.invalidate(key)
+        return False
+
+    def get(self, client, key, fetch):
+        """
+        Returns the entry for key, calling fetch() on a miss.
+        """
+        entry, stale = self._fresh(key)
+        if entry:
+            return entry
+        if stale and self._validated(key, stale, client.getMetadata(key)):
+            return stale
+        return fetch()
+
+    def getAsync(self, client, key, fetch, onSuccess, onError):
+        """
+        Async version of get, fetch is called with (onSuccess, onError).
+        """
+        entry, stale = self._fresh(key)
+        if entry:
+            onSuccess(entry)
+        elif stale:
+            def validated(current):
+                if self._validated(key, stale, current):
+                    onSuccess(stale)
+                else:
+                    fetch(onSuccess, onError)
+            client.getMetadataAsync(validated, onError, key)
+        else:
+            fetch(onSuccess, onError)
+
+    def observe(self, op, result):
+        """
+        Updates the cache with the outcome of an operation, result is an
+        exception if the operation failed.
+        """
+        m = op.m
+        if m is None or m.header.HasField('batchID'):
+            # batch operations are only applied if the batch commits
+            if m is not None and m.body.keyValue.key:
+                self.invalidate(m.body.keyValue.key)
+            return
+
+        kv = m.body.keyValue
+        if isinstance(op, operations.Put):
+            if isinstance(result, Exception):
+                self.invalidate(kv.key)
+            else:
+                self.update(kv.key, op.value, EntryMetadata(kv.newVersion, kv.tag, kv.algorithm))
+        elif isinstance(op, operations.Delete):
+            self.invalidate(kv.key)
+        elif isinstance(op, operations.Get) and not kv.metadataOnly:
+            if isinstance(result, Entry):
+                self.update(result.key, result.value, result.metadata)
+            elif result is None and m.header.messageType == messages.Command.GET:
+                self.invalidate(kv.key)
+
+
+class BloomFilter(object):
+    """
+    Probabilistic set of keys: a key that was added is always found, a key
+    that was not is found with probability error_rate once capacity keys
+    have been added.
+    """
+
+    def __init__(self, capacity=DEFAULT_BLOOM_CAPACITY, error_rate=DEFAULT_BLOOM_ERROR_RATE):
+        self.size = int(math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, int(round(self.size / float(capacity) * math.log(2))))
+        self.count = 0
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, key):
+        # double hashing, two 64 bit hashes out of one digest
+        h1, h2 = struct.unpack_from('>QQ', hashlib.md5(key).digest())
+        return [(h1 + i * h2) % self.size for i in xrange(self.hashes)]
+
+    def add(self, key):
+        for p in self._positions(key):
+            self._bits[p >> 3] |= 1 << (p & 7)
+        self.count += 1
+
+    def __contains__(self, key):
+        for p in self._positions(key):
+            if not self._bits[p >> 3] & (1 << (p & 7)):
+                return False
+        return True
+
+
+class NegativeCache(object):
+    """
+    Answers reads for keys known to be missing without asking the device.
+    Set it on :class:`~greenclient.Client` like a :class:`ReadCache`; an
+    inner cache (i.e. a ReadCache) handles the keys that are not missing.
+
+    A key is known to be missing for ttl seconds after a read found nothing
+    or this client deleted it, until this client writes it.
+
+    Optionally, sweep() loads the keys of a range into a
+    :class:`BloomFilter` that is kept current by this client's own writes.
+    Reads for keys in that range that are not in the filter are answered
+    locally; error_rate is the fraction of missing keys that still go to
+    the device. Keys written by other clients after the sweep are reported
+    as missing, so the filter is only accurate while this client is the
+    only writer of the range (or until the next sweep).
+
+    Counters: hits (answered by the TTL entries) and bloom_hits.
+    """
+
+    def __init__(self, ttl=DEFAULT_NEGATIVE_TTL, max_entries=DEFAULT_MAX_NEGATIVE_ENTRIES,
+                 inner=None):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.inner = inner
+        self.bloom = None
+        self.hits = 0
+        self.bloom_hits = 0
+        self._missing = collections.OrderedDict()
+        self._range = None
+
+    def sweep(self, client, startKey=None, endKey=None, capacity=DEFAULT_BLOOM_CAPACITY,
+              error_rate=DEFAULT_BLOOM_ERROR_RATE):
+        """
+        Builds the Bloom filter with the keys from startKey to endKey
+        (inclusive, None means unbounded) listed with getKeyRange.
+        """
+        bloom = BloomFilter(capacity, error_rate)
+        page_size = client.limits.maxKeyRangeCount or 200
+        start, inclusive = startKey, True
+        while True:
+            keys = client.getKeyRange(start, endKey, inclusive, True, page_size)
+            for k in keys:
+                bloom.add(k)
+            if len(keys) < page_size:
+                break
+            start, inclusive = keys[-1], False
+        if bloom.count > capacity:
+            LOG.warn("Bloom filter over capacity ({0} keys), the error rate will be higher than {1}.".format(bloom.count, error_rate))
+        self.bloom = bloom
+        self._range = (startKey or '', endKey)
+
+    def missing(self, key):
+        """
+        Returns True if the key is known to be missing.
+        """
+        expires = self._missing.get(key)
+        if expires:
+            if expires > time.time():
+                self.hits += 1
+                return True
+            del self._missing[key]
+        if self.bloom and self._range[0] <= key and \
+           (self._range[1] is None or key <= self._range[1]) and \
+           key not in self.bloom:
+            self.bloom_hits += 1
+            return True
+        return False
+
+    def _remember(self, key):
+        self._missing.pop(key, None)
+        self._missing[key] = time.time() + self.ttl
+        while len(self._missing) > self.max_entries:
+            self._missing.popitem(last=False)
+
+    def _forget(self, key):
+        self._missing.pop(key, None)
+        if self.bloom:
+            self.bloom.add(key)
+
+    def get(self, client, key, fetch):
+        if self.missing(key):
+            return None
+        if self.inner:
+            return self.inner.get(client, key, fetch)
+        return fetch()
+
+    def getAsync(self, client, key, fetch, onSuccess, onError):
+        if self.missing(key):
+            onSuccess(None)
+        elif self.inner:
+            self.inner.getAsync(client, key, fetch, onSuccess, onError)
+        else:
+            fetch(onSuccess, onError)
+
+    def observe(self, op, result):
+        m = op.m
+        if m is not None:
+            key = m.body.keyValue.key
+            if m.header.HasField('batchID') or isinstance(op, operations.Put):
+                # written, or maybe written if the batch commits
+                self._forget(key)
+            elif isinstance(op, operations.Delete):
+                if not isinstance(result, Exception):
+                    self._remember(key)
+            elif result is None and (isinstance(op, operations.GetVersion) or
+                 m.header.messageType == messages.Command.GET):
+                self._remember(key)
+        if self.inner:
+            self.inner.observe(op, result)
+
+
+class VersionCache(object):
+    """
+    Remembers the last version seen for each key, from this client's gets,
+    getVersions and puts, so :func:`~greenclient.Client.casPut` can issue a
+    compare-and-swap put without asking the device for the version first.
+    Set it on :class:`~greenclient.Client` like a :class:`ReadCache`; an
+    inner cache handles the reads.
+
+    Counters: hits and misses of version lookups.
+    """
+
+    def __init__(self, max_entries=DEFAULT_MAX_VERSION_ENTRIES, inner=None):
+        self.max_entries = max_entries
+        self.inner = inner
+        self.hits = 0
+        self.misses = 0
+        self._versions = collections.OrderedDict()
+
+    def version(self, key):
+        """
+        Returns the last version seen for key, or None if unknown.
+        """
+        version = self._versions.pop(key, None)
+        if version is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._versions[key] = version
+        return version
+
+    def remember(self, key, version):
+        self._versions.pop(key, None)
+        self._versions[key] = version or ''
+        while len(self._versions) > self.max_entries:
+            self._versions.popitem(last=False)
+
+    def forget(self, key):
+        self._versions.pop(key, None)
+
+    def get(self, client, key, fetch):
+        if self.inner:
+            return self.inner.get(client, key, fetch)
+        return fetch()
+
+    def getAsync(self, client, key, fetch, onSuccess, onError):
+        if self.inner:
+            self.inner.getAsync(client, key, fetch, onSuccess, onError)
+        else:
+            fetch(onSuccess, onError)
+
+    def observe(self, op, result):
+        m = op.m
+        if m is not None:
+            kv = m.body.keyValue
+            if m.header.HasField('batchID') or isinstance(result, Exception):
+                self.forget(kv.key)
+            elif isinstance(op, operations.Put):
+                self.remember(kv.key, kv.newVersion)
+            elif isinstance(op, operations.GetVersion):
+                if result is None:
+                    self.forget(kv.key)
+                else:
+                    self.remember(kv.key, result)
+            elif isinstance(op, operations.Get):
+                if isinstance(result, Entry):
+                    self.remember(result.key, result.metadata.version)
+                elif m.header.messageType == messages.Command.GET:
+                    self.forget(kv.key)
+            elif isinstance(op, operations.Delete):
+                self.forget(kv.key)
+        if self.inner:
+            self.inner.observe(op, result)
@@ -0,0 +1,331 @@
+# Copyright 2013-2015 Seagate Technology LLC.
+#
+# This Source Code Form is subject to the terms of the Mozilla
+# Public License, v. 2.0. If a copy of the MPL was not
+# distributed with this file, You can obtain one at
+# https://mozilla.org/MP:/2.0/.
+#
+# This program is distributed in the hope that it will be useful,
+# but is provided AS-IS, WITHOUT ANY WARRANTY; including without
+# the implied warranty of MERCHANTABILITY, NON-INFRINGEMENT or
+# FITNESS FOR A PARTICULAR PURPOSE. See the Mozilla Public
+# License for more details.
+#
+# See www.openkinetic.org for more project information
+#
+
+import bisect
+import hashlib
+import heapq
+import logging
+import struct
+
+import bulk
+import common
+from greenclient import Client
+
+LOG = logging.getLogger(__name__)
+
+DEFAULT_VNODES = 160
+DEFAULT_PAGE_SIZE = 200
+
+
+def _hash(s):
+    return struct.unpack_from('>Q', hashlib.md5(s).digest())[0]
+
+
+class HashRing(object):
+    """
+    Consistent hashing of keys to nodes.
+
+    Every node is placed vnodes * weight times on the ring and a key belongs
+    to the first node found going clockwise from the key's hash. Adding or
+    removing a node only moves the keys of that node.
+    """
+
+    def __init__(self, vnodes=DEFAULT_VNODES):
+        self.vnodes = vnodes
+        self.weights = {}
+        self._points = []
+        self._nodes = []
+
+    def add(self, node, weight=1):
+        self.weights[node] = weight
+        self._build()
+
+    def remove(self, node):
+        del self.weights[node]
+        self._build()
+
+    def _build(self):
+        ring = sorted((_hash('%s#%d' % (node, i)), node)
+                      for node, weight in self.weights.iteritems()
+                      for i in xrange(int(round(self.vnodes * weight))))
+        self._points = [p for p, _ in ring]
+        self._nodes = [n for _, n in ring]
+
+    def lookup(self, key):
+        """
+        Returns the node key belongs to.
+        """
+        if not self._points:
+            raise common.KineticClientException("No nodes in the ring.")
+        i = bisect.bisect(self._points, _hash(key)) % len(self._points)
+        return self._nodes[i]
+
+    def preferenceList(self, key, count):
+        """
+        Returns up to count distinct nodes for key, the node it belongs to
+        first and then the next ones going clockwise.
+        """
+        if not self._points:
+            raise common.KineticClientException("No nodes in the ring.")
+        count = min(count, len(self.weights))
+        start = bisect.bisect(self._points, _hash(key))
+        nodes = []
+        for j in xrange(len(self._nodes)):
+            node = self._nodes[(start + j) % len(self._nodes)]
+            if node not in nodes:
+                nodes.append(node)
+                if len(nodes) == count:
+                    break
+        return nodes
+
+    def __contains__(self, node):
+        return node in self.weights
+
+    def __len__(self):
+        return len(self.weights)
+
+
+def _drive(d):
+    # 'host:port', (host, port) or (host, port, weight)
+    if isinstance(d, basestring):
+        host, _, port = d.rpartition(':')
+        return host, int(port), 1
+    if len(d) == 2:
+        return d[0], d[1], 1
+    return tuple(d)
+
+
+class Cluster(object):
+    """
+    Spreads keys over many devices with consistent hashing, holding one
+    :class:`~greenclient.Client` per device.
+
+    Single key operations go to the device owning the key, range operations
+    are sent to every device and merged. Drives are named 'host:port'.
+    """
+
+    # a key lives on the one device clientFor returns, so callers may send
+    # requests (and batches) for it to that client directly
+    routable = True
+
+    def __init__(self, drives=(), vnodes=DEFAULT_VNODES, **kwargs):
+        """
+        Args:
+            drives: 'host:port' strings, (host, port) or (host, port, weight)
+                tuples.
+            vnodes: points on the ring per unit of weight.
+            kwargs: passed to every :class:`~greenclient.Client`.
+        """
+        self.ring = HashRing(vnodes)
+        self.clients = {}
+        self._kwargs = kwargs
+        self._connected = False
+        for d in drives:
+            self.addDrive(*_drive(d))
+
+    def addDrive(self, hostname, port, weight=1):
+        """
+        Adds a device, connecting to it if the cluster is connected.
+        Keys are not moved, see :func:`rebalance`. Returns the drive name.
+        """
+        name = '%s:%d' % (hostname, port)
+        if name in self.clients:
+            raise common.KineticClientException("Drive {0} already in the cluster.".format(name))
+        c = Client(hostname, port, **self._kwargs)
+        if self._connected:
+            c.connect()
+        self.clients[name] = c
+        self.ring.add(name, weight)
+        return name
+
+    def removeDrive(self, name):
+        """
+        Removes a device and closes its connection, its keys are not moved.
+        """
+        self.ring.remove(name)
+        c = self.clients.pop(name)
+        if c.isConnected:
+            c.close()
+
+    def connect(self):
+        for c in self.clients.values():
+            c.connect()
+        self._connected = True
+
+    def close(self):
+        self._connected = False
+        for c in self.clients.values():
+            if c.isConnected:
+                c.close()
+
+    def clientFor(self, key):
+        """
+        Returns the client of the device key belongs to.
+        """
+        return self.clients[self.ring.lookup(key)]
+
+    ### single key operations ###
+
+    def put(self, key, *args, **kwargs):
+        return self.clientFor(key).put(key, *args, **kwargs)
+
+    def get(self, key, *args, **kwargs):
+        return self.clientFor(key).get(key, *args, **kwargs)
+
+    def getMetadata(self, key, *args, **kwargs):
+        return self.clientFor(key).getMetadata(key, *args, **kwargs)
+
+    def getVersion(self, key, *args, **kwargs):
+        return self.clientFor(key).getVersion(key, *args, **kwargs)
+
+    def delete(self, key, *args, **kwargs):
+        return self.clientFor(key).delete(key, *args, **kwargs)
+
+    def putAsync(self, onSuccess, onError, key, *args, **kwargs):
+        self.clientFor(key).putAsync(onSuccess, onError, key, *args, **kwargs)
+
+    def getAsync(self, onSuccess, onError, key, *args, **kwargs):
+        self.clientFor(key).getAsync(onSuccess, onError, key, *args, **kwargs)
+
+    def getMetadataAsync(self, onSuccess, onError, key, *args, **kwargs):
+        self.clientFor(key).getMetadataAsync(onSuccess, onError, key, *args, **kwargs)
+
+    def getVersionAsync(self, onSuccess, onError, key, *args, **kwargs):
+        self.clientFor(key).getVersionAsync(onSuccess, onError, key, *args, **kwargs)
+
+    def deleteAsync(self, onSuccess, onError, key, *args, **kwargs):
+        self.clientFor(key).deleteAsync(onSuccess, onError, key, *args, **kwargs)
+
+    ### multi key operations ###
+
+    def getMany(self, keys, **kwargs):
+        """
+        See :func:`~bulk.getMany`, each key is read from its device.
+        """
+        return bulk.getMany(self, keys, **kwargs)
+
+    def putMany(self, items, **kwargs):
+        """
+        See :func:`~bulk.putMany`, each pair is written to its device.
+        """
+        return bulk.putMany(self, items, **kwargs)
+
+    def deleteMany(self, keys, **kwargs):
+        """
+        See :func:`~bulk.deleteMany`, each key is deleted from its device.
+        """
+        return bulk.deleteMany(self, keys, **kwargs)
+
+    def versionMany(self, keys, **kwargs):
+        """
+        See :func:`~bulk.versionMany`, each key is checked on its device.
+        """
+        return bulk.versionMany(self, keys, **kwargs)
+
+    ### range operations ###
+
+    def getKeyRange(self, startKey=None, endKey=None, startKeyInclusive=True,
+                    endKeyInclusive=True, maxReturned=DEFAULT_PAGE_SIZE, reverse=False):
+        """
+        Same as :func:`~greenclient.Client.getKeyRange` over every device,
+        the first maxReturned keys of all of them in order.
+        """
+        futures = []
+        for c in self.clients.values():
+            f = common.Future()
+            c.getKeyRangeAsync(f.set_result, f.set_exception, startKey, endKey,
+                               startKeyInclusive, endKeyInclusive, maxReturned, reverse)
+            futures.append(f)
+        keys = set()
+        for f in futures:
+            keys.update(f.result())
+        # the same key can be on several devices (see replication)
+        return sorted(keys, reverse=reverse)[:maxReturned]
+
+    def getRange(self, startKey, endKey, startKeyInclusive=True, endKeyInclusive=True,
+                 prefetch=64):
+        """
+        Iterates the entries in the range of every device in key order. A key
+        on several devices (i.e. left behind by :func:`rebalance`) is read
+        from the device it belongs to.
+        """
+        def tagged(i, name, entries):
+            for e in entries:
+                if e is not None: # deleted meanwhile
+                    yield e.key, self.ring.lookup(e.key) != name, i, e
+
+        ranges = [tagged(i, name, c.getRange(startKey, endKey, startKeyInclusive,
+                                             endKeyInclusive, prefetch))
+                  for i, (name, c) in enumerate(self.clients.items())]
+        last = None
+        for key, _, _, e in heapq.merge(*ranges):
+            if key != last:
+                yield e
+            last = key
+
+    def rebalance(self, startKey=None, endKey=None, page_size=DEFAULT_PAGE_SIZE):
+        """
+        Moves the keys in the range that are not on the device they belong to
+        (i.e. after adding or removing drives), keeping their versions.
+        Keys written to their new device meanwhile, or changed on the old one,
+        are skipped (and left on the old device). Returns the number of keys
+        moved.
+        """
+        moved = 0
+        for name, c in self.clients.items():
+            start, inclusive = startKey, True
+            while True:
+                keys = c.getKeyRange(start, endKey, inclusive, True, page_size)
+                for k in keys:
+                    owner = self.ring.lookup(k)
+                    if owner != name and self._move(k, c, self.clients[owner]):
+                        moved += 1
+                if len(keys) < page_size:
+                    break
+                start, inclusive = keys[-1], False
+        return moved
+
+    def _move(self, key, source, target):
+        entry = source.get(key)
+        if entry is None:
+            return False
+        m = entry.metadata
+        try:
+            # only creates it, a write since the membership change wins
+            target.put(key, entry.value, version='', new_version=m.version or '')
+        except common.KineticMessageException as e:
+            if e.code != 'VERSION_MISMATCH':
+                raise
+            LOG.warn("Not moving {0} to {1}, written meanwhile.".format(repr(key), target))
+            return False
+        try:
+            source.delete(key, version=m.version or '')
+        except common.KineticMessageException as e:
+            if e.code != 'VERSION_MISMATCH':
+                raise
+            LOG.warn("Not removing {0} from {1}, written meanwhile.".format(repr(key), source))
+            return False
+        LOG.debug("Moved {0} from {1} to {2}".format(key, source, target))
+        return True
+
+    ### with statement support ###
+
+    def __enter__(self):
+        self.connect()
+        return self
+
+    def __exit__(self, t, v, tb):
+        self.close()
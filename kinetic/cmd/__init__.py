@@ -74,7 +74,7 @@ getr_parser.add_argument('end', help='the end of key range', nargs='?')
 
 # deleter
 deleter_parser = command_parsers.add_parser(
-    'deleter', help='get keys from start to end')
+    'deleter', help='delete keys from start to end')
 deleter_parser.add_argument('start', help='the start of key range')
 deleter_parser.add_argument('end', help='the end of key range', nargs='?')
 
@@ -257,12 +257,19 @@ class Cmd(cmd.Cmd, object):
 
     @add_parser(deleter_parser)
     def do_deleter(self, args):
-        def on_success(m): pass
-        def on_error(ex): pass
-        keys = self._list(args)
-        for k in keys:
-            self.client.deleteAsync(on_success, on_error, k, force=True)
-        self.client.wait()
+        if not args.end:
+            args.end = args.start + '\xff'
+
+        def on_progress(deleted, failed):
+            if args.verbose:
+                print >> sys.stderr, 'deleted: %s failed: %s' % (deleted, failed)
+
+        _, failed = self.client.deleteRange(args.start, args.end,
+                                            onProgress=on_progress)
+        for key, e in failed.iteritems():
+            print >> sys.stderr, 'failed to delete %s: %s' % (key, e)
+        if failed:
+            return 1
 
 
 def handle_loop(**options):
@@ -0,0 +1,194 @@
+# Copyright 2013-2015 Seagate Technology LLC.
+#
+# This Source Code Form is subject to the terms of the Mozilla
+# Public License, v. 2.0. If a copy of the MPL was not
+# distributed with this file, You can obtain one at
+# https://mozilla.org/MP:/2.0/.
+#
+# This program is distributed in the hope that it will be useful,
+# but is provided AS-IS, WITHOUT ANY WARRANTY; including without
+# the implied warranty of MERCHANTABILITY, NON-INFRINGEMENT or
+# FITNESS FOR A PARTICULAR PURPOSE. See the Mozilla Public
+# License for more details.
+#
+# See www.openkinetic.org for more project information
+#
+
+import collections
+import logging
+import eventlet
+
+import common
+import operations
+
+LOG = logging.getLogger(__name__)
+
+DEFAULT_MAX_DELAY = 0.005 # seconds
+DEFAULT_MAX_OPERATIONS = 15
+DEFAULT_MAX_BYTES = 4*common.MAX_VALUE_SIZE
+
+
+class _Write(object):
+
+    def __init__(self, op, args, kwargs, size):
+        self.op = op
+        self.args = args
+        self.kwargs = kwargs
+        self.size = size
+        self.futures = []
+
+    def set_result(self, result):
+        for f in self.futures:
+            f.set_result(result)
+
+    def set_exception(self, e):
+        for f in self.futures:
+            f.set_exception(e)
+
+
+class WriteCombiner(object):
+    """
+    Group commit layer for a :class:`~greenclient.Client`.
+
+    Puts and deletes are collected for up to max_delay seconds, or until
+    max_operations writes or max_bytes of values are waiting, and are then
+    committed together as one START_BATCH/END_BATCH group. Every call returns
+    a :class:`~common.Future` that completes when its group commits.
+
+    Writes to the same key within a window collapse to the last one; the
+    futures of the superseded writes complete with the result of the write
+    that replaced them. If a group is aborted by the device, its writes are
+    retried one by one so only the offending callers see an error.
+    """
+
+    def __init__(self, client, max_delay=DEFAULT_MAX_DELAY, max_operations=None,
+                 max_bytes=DEFAULT_MAX_BYTES):
+        """
+        Args:
+            client: a connected :class:`~greenclient.Client`.
+            max_delay: seconds a write may wait for its group to fill.
+            max_operations: writes per group, capped (and by default set) to
+                the device's limits.maxOperationCountPerBatch.
+            max_bytes: value bytes per group.
+        """
+        limit = client.limits.maxOperationCountPerBatch
+        if max_operations and limit:
+            max_operations = min(max_operations, limit)
+        self.client = client
+        self.max_delay = max_delay
+        self.max_operations = max_operations or limit or DEFAULT_MAX_OPERATIONS
+        self.max_bytes = max_bytes
+        self._writes = collections.OrderedDict()
+        self._bytes = 0
+        self._timer = None
+
+    def put(self, key, data, **kwargs):
+        """
+        Queues a put, accepts the same arguments as
+        :func:`~greenclient.Client.put`. Returns a future.
+        """
+        return self._add(key, operations.Put, (key, data), kwargs,
+                         len(data) if data else 0)
+
+    def delete(self, key, **kwargs):
+        """
+        Queues a delete, accepts the same arguments as
+        :func:`~greenclient.Client.delete`. Returns a future that completes
+        with True if the key was deleted.
+        """
+        return self._add(key, operations.Delete, (key,), kwargs, 0)
+
+    def _add(self, key, op, args, kwargs, size):
+        w = _Write(op, args, kwargs, size)
+        previous = self._writes.pop(key, None)
+        if previous:
+            self._bytes -= previous.size
+            w.futures.extend(previous.futures)
+        future = common.Future()
+        w.futures.append(future)
+
+        self._writes[key] = w
+        self._bytes += size
+
+        if len(self._writes) >= self.max_operations or self._bytes >= self.max_bytes:
+            self.flush()
+        elif not self._timer:
+            self._timer = eventlet.spawn_after(self.max_delay, self.flush)
+        return future
+
+    def flush(self):
+        """
+        Commits the writes waiting right away.
+        Returns a future that completes when they are done.
+        """
+        if self._timer:
+            self._timer.cancel()
+            self._timer = None
+
+        writes = self._writes.values()
+        self._writes = collections.OrderedDict()
+        self._bytes = 0
+
+        if not writes:
+            done = common.Future()
+            done.set_result(None)
+            return done
+
+        b = self.client.begin_batch_async(max_operations=len(writes))
+        batched = []
+        for w in writes:
+            try:
+                if w.op is operations.Put:
+                    b.put(*w.args, **w.kwargs)
+                else:
+                    b.delete(*w.args, **w.kwargs)
+                batched.append(w)
+            except Exception as e:
+                # rejected before reaching the device (i.e. key too big)
+                w.set_exception(e)
+
+        done = common.Future()
+
+        def committed(f):
+            if f.exception():
+                LOG.warn("Group commit of {0} writes failed, retrying one by one. {1}".format(len(batched), f.exception()))
+                self._replay(batched, done)
+            else:
+                for w in batched:
+                    w.set_result(None if w.op is operations.Put else True)
+                done.set_result(None)
+
+        b.commit().add_done_callback(committed)
+        return done
+
+    def _replay(self, writes, done):
+        futures = []
+        for w in writes:
+            f = common.Future()
+            futures.append(f)
+
+            def onSuccess(r, w=w, f=f):
+                w.set_result(r)
+                f.set_result(r)
+
+            def onError(e, w=w, f=f):
+                w.set_exception(e)
+                f.set_result(None)
+
+            self.client._processAsync(w.op(), onSuccess, onError, *w.args, **w.kwargs)
+
+        common.Future.all(futures).add_done_callback(lambda _: done.set_result(None))
+
+    def close(self):
+        """
+        Commits the writes waiting and waits for them to complete.
+        """
+        self.flush().result()
+
+    ### with statement support ###
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, t, v, tb):
+        self.close()
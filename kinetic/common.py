@@ -49,6 +49,80 @@ class DeferedValue():
         self._evt.wait()
 
 
+class Future(object):
+    """
+    Result of an operation that completes in the background.
+    """
+
+    def __init__(self):
+        self._evt = eventlet.event.Event()
+        self._result = None
+        self._exception = None
+        self._callbacks = []
+
+    def done(self):
+        return self._evt.ready()
+
+    def result(self):
+        """
+        Waits for the operation to complete and returns its result, or
+        raises the exception it failed with.
+        """
+        self._evt.wait()
+        if self._exception:
+            raise self._exception
+        return self._result
+
+    def exception(self):
+        self._evt.wait()
+        return self._exception
+
+    def add_done_callback(self, fn):
+        if self.done():
+            fn(self)
+        else:
+            self._callbacks.append(fn)
+
+    def set_result(self, result):
+        self._result = result
+        self._complete()
+
+    def set_exception(self, e):
+        self._exception = e
+        self._complete()
+
+    def _complete(self):
+        self._evt.send()
+        callbacks, self._callbacks = self._callbacks, []
+        for fn in callbacks:
+            fn(self)
+
+    @staticmethod
+    def all(futures):
+        """
+        Returns a future that completes when all futures complete, with the
+        list of their results, or with the first exception found.
+        """
+        combined = Future()
+        futures = list(futures)
+        remaining = [len(futures)]
+
+        def complete(_):
+            remaining[0] -= 1
+            if remaining[0] == 0:
+                for f in futures:
+                    if f.exception():
+                        combined.set_exception(f.exception())
+                        return
+                combined.set_result([f.result() for f in futures])
+
+        if not futures:
+            combined.set_result([])
+        for f in futures:
+            f.add_done_callback(complete)
+        return combined
+
+
 class Entry(object):
 
     #RPC: Note, you could build this as a class method, if you wanted the fromMessage to build
@@ -180,6 +254,12 @@ class BatchCompletedException(KineticClientException):
     def __init__(self):
         super(BatchCompletedException, self).__init__('batch completed. no more operations are permitted within this batch.')
 
+class ReplicaConflictException(KineticClientException):
+    def __init__(self, key, versions):
+        super(ReplicaConflictException, self).__init__('replicas of {0} disagree on its version.'.format(repr(key)))
+        self.key = key
+        self.versions = versions
+
 class HmacAlgorithms:
     INVALID_HMAC_ALGORITHM = -1 # Must come first, so default is invalid
     HmacSHA1 = 1 # this is the default
@@ -250,6 +330,12 @@ class Synchronization:
     FLUSH = 3
 
 
+class ReadCoalescing:
+    NONE = 0 # every read is sent
+    COPY = 1 # concurrent reads share a request, each caller gets its own value
+    READONLY = 2 # concurrent reads share a request and an immutable value
+
+
 class IntegrityAlgorithms:
     SHA1 = 1
     SHA2 = 2
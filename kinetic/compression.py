@@ -0,0 +1,282 @@
+# Copyright 2013-2015 Seagate Technology LLC.
+#
+# This Source Code Form is subject to the terms of the Mozilla
+# Public License, v. 2.0. If a copy of the MPL was not
+# distributed with this file, You can obtain one at
+# https://mozilla.org/MP:/2.0/.
+#
+# This program is distributed in the hope that it will be useful,
+# but is provided AS-IS, WITHOUT ANY WARRANTY; including without
+# the implied warranty of MERCHANTABILITY, NON-INFRINGEMENT or
+# FITNESS FOR A PARTICULAR PURPOSE. See the Mozilla Public
+# License for more details.
+#
+# See www.openkinetic.org for more project information
+#
+
+import bz2
+import collections
+import struct
+import time
+import zlib
+
+try:
+    import lzma
+except ImportError:
+    try:
+        from backports import lzma
+    except ImportError:
+        lzma = None
+
+import common
+from dictionary import RESERVED_PREFIX
+
+# Values written through a Compressor start with MAGIC and the codec id,
+# uncompressed ones included, so reads know how to decode them. Values
+# without the header (i.e. written by other clients, or uncompressed ones
+# with no room left for it) are returned as is.
+MAGIC = '\xfeKZ'
+_HEADER = struct.Struct('>3sB')
+_DICT_ID = struct.Struct('>H')
+
+NONE = 0
+ZLIB = 1
+BZ2 = 2
+LZMA = 3
+DICT = 4 # zlib with a dictionary.DictionaryStore
+
+DEFAULT_MIN_SIZE = 256
+DEFAULT_DICT_MIN_SIZE = 32
+DEFAULT_SAMPLE_SIZE = 4096
+DEFAULT_MIN_RATIO = 1.1
+
+
+def _zlib(level):
+    return (lambda data: zlib.compress(data, level if level is not None else 6),
+            zlib.decompress)
+
+
+def _bz2(level):
+    return (lambda data: bz2.compress(data, level if level is not None else 9),
+            bz2.decompress)
+
+
+def _lzma(level):
+    return (lambda data: lzma.compress(data, preset=level if level is not None else 6),
+            lzma.decompress)
+
+
+# name -> (codec id, factory of the (compress, decompress) functions)
+CODECS = {'zlib': (ZLIB, _zlib), 'bz2': (BZ2, _bz2)}
+if lzma is not None:
+    CODECS['lzma'] = (LZMA, _lzma)
+
+_NAMES = dict((i, name) for name, (i, _) in CODECS.iteritems())
+_NAMES[DICT] = 'zdict'
+_DECOMPRESS = dict((i, factory(None)[1]) for i, factory in CODECS.itervalues())
+
+
+class CompressionPolicy(object):
+    """
+    How values are compressed: codec ('zlib', 'bz2' or 'lzma' if available,
+    None to store them uncompressed) at level (the codec default if None).
+    Codec 'zdict' compresses small values with zlib and the current
+    version of dictionary, a :class:`~dictionary.DictionaryStore`, values
+    are stored uncompressed until it has one.
+
+    Values under min_size bytes (256, 32 for 'zdict') are not compressed.
+    Larger ones are first
+    tried on their first sample_size bytes and only compressed if that
+    sample shrinks at least min_ratio times (original / compressed), a
+    value is also kept uncompressed if compressing it does not save space.
+    """
+
+    def __init__(self, codec='zlib', level=None, min_size=None,
+                 sample_size=DEFAULT_SAMPLE_SIZE, min_ratio=DEFAULT_MIN_RATIO, dictionary=None):
+        if codec == 'zdict':
+            if dictionary is None:
+                raise ValueError("Codec zdict needs a dictionary.")
+        elif codec is not None and codec not in CODECS:
+            raise ValueError("Unknown or unavailable codec {0}.".format(codec))
+        self.codec = codec
+        self.level = level
+        self.min_size = min_size if min_size is not None else \
+            DEFAULT_DICT_MIN_SIZE if codec == 'zdict' else DEFAULT_MIN_SIZE
+        self.sample_size = sample_size
+        self.min_ratio = min_ratio
+        self.dictionary = dictionary
+        if codec == 'zdict':
+            self.id = DICT
+            self.compress = self._compressWithDictionary
+        elif codec is not None:
+            self.id, factory = CODECS[codec]
+            self.compress = factory(level)[0]
+        else:
+            self.id = NONE
+
+    def _compressWithDictionary(self, value):
+        compressed = self.dictionary.compress(value)
+        if compressed is None:
+            return None
+        return _DICT_ID.pack(self.dictionary.id) + compressed
+
+
+class CodecStats(object):
+    """
+    Counters of a codec: values compressed, skipped (stored uncompressed
+    by the policy), decoded, bytes in and out of compression and the CPU
+    seconds spent compressing (sampling included) and decompressing.
+    """
+
+    def __init__(self):
+        self.compressed = 0
+        self.skipped = 0
+        self.decoded = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.compress_time = 0.0
+        self.decompress_time = 0.0
+
+    @property
+    def ratio(self):
+        """
+        Original / stored size of the values compressed.
+        """
+        return float(self.bytes_in) / self.bytes_out if self.bytes_out else 1.0
+
+    def __repr__(self):
+        return 'CodecStats(compressed={0}, skipped={1}, ratio={2:.2f}, compress_time={3:.3f}, ' \
+               'decompress_time={4:.3f})'.format(self.compressed, self.skipped, self.ratio,
+                                                 self.compress_time, self.decompress_time)
+
+
+class Compressor(object):
+    """
+    Value codec layer set on a client with the compression argument: puts
+    of strings and bytearrays are stored encoded with the policy of their
+    key, gets (get, getNext, getPrevious) return them decoded.
+
+    policy applies to every key, prefixes maps key prefixes to the policy
+    of their keys (the longest matching prefix wins). Values compressed
+    with a dictionary are read with the store of its id (from its name)
+    among the policies and dictionaries (stores no policy writes with
+    anymore).
+    stats holds the :class:`CodecStats` of every codec name ('none' for
+    values stored uncompressed). Values of reserved keys (i.e. the
+    dictionaries) are stored and read as is, without the header.
+
+    The SHA1 tag of a compressed value is that of the original value, so
+    tags compare with the data as given (i.e. largeobject.updateLarge).
+
+    Streamed values (i.e. :class:`~zero_copy.ZeroCopyValue`) are stored
+    as given and get_into receives values as stored.
+    """
+
+    def __init__(self, policy=None, prefixes=None, dictionaries=()):
+        self.policy = policy or CompressionPolicy()
+        self.prefixes = sorted((prefixes or {}).items(), key=lambda p: len(p[0]), reverse=True)
+        self.stats = collections.defaultdict(CodecStats)
+        self.dictionaries = {} # id -> store
+        stores = list(dictionaries) + [p.dictionary for p in [self.policy] + [p for _, p in self.prefixes]
+                                       if p.dictionary is not None]
+        for d in stores:
+            if self.dictionaries.setdefault(d.id, d).name != d.name:
+                raise ValueError("Dictionaries {0} and {1} have the same id.".format(
+                                 d.name, self.dictionaries[d.id].name))
+
+    def policyFor(self, key):
+        if key.startswith(RESERVED_PREFIX):
+            return _UNCOMPRESSED
+        for prefix, policy in self.prefixes:
+            if key.startswith(prefix):
+                return policy
+        return self.policy
+
+    def encode(self, key, value):
+        """
+        Returns value as stored for key.
+        """
+        policy = self.policyFor(key)
+        value = str(value)
+        if policy is _UNCOMPRESSED:
+            return value
+        if policy.id == NONE:
+            return self._raw(value)
+
+        stats = self.stats[policy.codec]
+        if len(value) < policy.min_size:
+            stats.skipped += 1
+            return self._raw(value)
+
+        start = time.clock()
+        try:
+            if len(value) > policy.sample_size:
+                sample = policy.compress(value[:policy.sample_size])
+                if sample is None or policy.sample_size < len(sample) * policy.min_ratio:
+                    stats.skipped += 1
+                    return self._raw(value)
+            compressed = policy.compress(value)
+        finally:
+            stats.compress_time += time.clock() - start
+
+        if compressed is None or len(compressed) + _HEADER.size >= len(value):
+            stats.skipped += 1
+            return self._raw(value)
+        stats.compressed += 1
+        stats.bytes_in += len(value)
+        stats.bytes_out += len(compressed)
+        return _HEADER.pack(MAGIC, policy.id) + compressed
+
+    def _raw(self, value):
+        stats = self.stats['none']
+        stats.bytes_in += len(value)
+        stats.bytes_out += len(value)
+        if len(value) + _HEADER.size <= common.MAX_VALUE_SIZE:
+            return _HEADER.pack(MAGIC, NONE) + value
+        # stored without the header, which reads could not tell apart
+        # from a value starting like one
+        if value[:len(MAGIC)] == MAGIC:
+            raise common.KineticClientException(
+                "Value of {0} bytes starts like an encoded one, too large to store.".format(len(value)))
+        return value
+
+    def decode(self, value, key=None):
+        """
+        Returns the original of a stored value (of key, if known).
+        """
+        if len(value) < _HEADER.size or value[:len(MAGIC)] != MAGIC or \
+           key is not None and key.startswith(RESERVED_PREFIX):
+            return value
+        value = str(value)
+        codec = _HEADER.unpack_from(value)[1]
+        data = value[_HEADER.size:]
+        if codec == NONE:
+            return data
+        if codec == DICT:
+            return self._decodeWithDictionary(data)
+        if codec not in _DECOMPRESS:
+            raise common.KineticClientException(
+                "Value compressed with unknown or unavailable codec {0}.".format(codec))
+        stats = self.stats[_NAMES[codec]]
+        start = time.clock()
+        try:
+            return _DECOMPRESS[codec](data)
+        finally:
+            stats.decoded += 1
+            stats.decompress_time += time.clock() - start
+
+    def _decodeWithDictionary(self, data):
+        i, = _DICT_ID.unpack_from(data)
+        store = self.dictionaries.get(i)
+        if store is None:
+            raise common.KineticClientException("Value compressed with unknown dictionary {0}.".format(i))
+        stats = self.stats['zdict']
+        start = time.clock()
+        try:
+            return store.decompress(data[_DICT_ID.size:])
+        finally:
+            stats.decoded += 1
+            stats.decompress_time += time.clock() - start
+
+
+_UNCOMPRESSED = CompressionPolicy(None)
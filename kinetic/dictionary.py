@@ -0,0 +1,229 @@
+# Copyright 2013-2015 Seagate Technology LLC.
+#
+# This Source Code Form is subject to the terms of the Mozilla
+# Public License, v. 2.0. If a copy of the MPL was not
+# distributed with this file, You can obtain one at
+# https://mozilla.org/MP:/2.0/.
+#
+# This program is distributed in the hope that it will be useful,
+# but is provided AS-IS, WITHOUT ANY WARRANTY; including without
+# the implied warranty of MERCHANTABILITY, NON-INFRINGEMENT or
+# FITNESS FOR A PARTICULAR PURPOSE. See the Mozilla Public
+# License for more details.
+#
+# See www.openkinetic.org for more project information
+#
+
+import collections
+import heapq
+import logging
+import struct
+import zlib
+
+import common
+
+LOG = logging.getLogger(__name__)
+
+# keys under the reserved prefix are never compressed by a Compressor
+RESERVED_PREFIX = '\x00kinetic/'
+DICTIONARY_PREFIX = RESERVED_PREFIX + 'dictionaries/'
+
+DEFAULT_DICTIONARY_SIZE = 16*1024
+MAX_DICTIONARY_SIZE = 32*1024 # the deflate window
+DEFAULT_SEGMENT_SIZE = 128
+DEFAULT_GRAM_SIZE = 8
+PUBLISH_RETRIES = 5
+PAGE_SIZE = 200
+
+_VERSION = struct.Struct('>H')
+MAX_VERSION = 0xffff
+
+
+def train(samples, size=DEFAULT_DICTIONARY_SIZE, segment_size=DEFAULT_SEGMENT_SIZE,
+          gram_size=DEFAULT_GRAM_SIZE):
+    """
+    Returns a dictionary of up to size bytes for values like samples.
+
+    Samples are cut in segment_size pieces, each scored by how many
+    samples share its gram_size byte substrings, and the best pieces are
+    taken greedily, a substring only counting for the first piece that
+    holds it. The best pieces go last since deflate encodes the closest
+    matches in fewer bits.
+    """
+    if size > MAX_DICTIONARY_SIZE:
+        raise ValueError("Dictionaries are limited to {0} bytes.".format(MAX_DICTIONARY_SIZE))
+    samples = [str(s) for s in samples]
+    d = gram_size
+
+    def grams(s):
+        return set(s[i:i + d] for i in xrange(len(s) - d + 1))
+
+    # samples holding every substring
+    shared = collections.defaultdict(int)
+    for s in samples:
+        for g in grams(s):
+            shared[g] += 1
+
+    segments = [s[i:i + segment_size] for s in samples
+                for i in xrange(0, max(len(s) - d, 0) + 1, max(segment_size // 2, 1))]
+
+    def score(segment):
+        return sum(shared[g] for g in grams(segment) if shared[g] > 1)
+
+    # lazy greedy, scores only go down as substrings are taken
+    heap = [(-score(s), i) for i, s in enumerate(segments)]
+    heapq.heapify(heap)
+    chosen = []
+    total = 0
+    while heap and total < size:
+        _, i = heapq.heappop(heap)
+        s = score(segments[i])
+        if s <= 0:
+            continue
+        if heap and s < -heap[0][0]:
+            heapq.heappush(heap, (-s, i))
+            continue
+        chosen.append(segments[i])
+        total += len(segments[i])
+        for g in grams(segments[i]):
+            shared[g] = 0
+    return ''.join(reversed(chosen))[-size:]
+
+
+class _Primed(object):
+    # raw deflate streams that went through the dictionary, copied for
+    # every value (Python 2 zlib has no zdict)
+
+    def __init__(self, dictionary, level):
+        self.dictionary = dictionary
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+        primer = self._compressor.compress(dictionary) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+        self._decompressor = zlib.decompressobj(-15)
+        self._decompressor.decompress(primer)
+
+    def compress(self, value):
+        c = self._compressor.copy()
+        return c.compress(value) + c.flush()
+
+    def decompress(self, data):
+        d = self._decompressor.copy()
+        return d.decompress(data) + d.flush()
+
+
+class DictionaryStore(object):
+    """
+    Versioned compression dictionaries named name, kept on the device
+    under reserved keys through client, for the 'zdict' codec of a
+    :class:`~compression.CompressionPolicy`.
+
+    :func:`publish` (or :func:`train`) stores a new version that becomes
+    the current one, values remember the version they were compressed with
+    so every version stays readable. Versions are read when first needed,
+    :func:`load` reads them upfront and picks up versions published by
+    other clients. With a ThreadedClient without pool, responses are
+    decoded on the reader so versions must be loaded upfront.
+    """
+
+    def __init__(self, client, name, level=6):
+        self.client = client
+        self.name = name
+        # stored with the values instead of the name
+        self.id = zlib.crc32(name) & 0xffff
+        self.level = level
+        self.current = None # version used to compress
+        self._versions = {}
+
+    def key(self, version):
+        return '%s%s/%08d' % (DICTIONARY_PREFIX, self.name, version)
+
+    def _prefix(self):
+        return '%s%s/' % (DICTIONARY_PREFIX, self.name)
+
+    def versions(self):
+        """
+        Returns the versions stored on the device.
+        """
+        prefix = self._prefix()
+        versions = []
+        start, inclusive = prefix, True
+        while True:
+            keys = self.client.getKeyRange(start, prefix + '\xff', inclusive, True, PAGE_SIZE)
+            # skips the dictionaries named after this one and a '/'
+            versions.extend(int(k[len(prefix):]) for k in keys if k[len(prefix):].isdigit())
+            if len(keys) < PAGE_SIZE:
+                return versions
+            start, inclusive = keys[-1], False
+
+    def load(self):
+        """
+        Reads every version not known yet, the latest becomes current.
+        """
+        versions = self.versions()
+        for v in versions:
+            if v not in self._versions:
+                self._fetch(v)
+        if versions:
+            self.current = max(max(versions), self.current)
+        return self.current
+
+    def _fetch(self, version):
+        entry = self.client.get(self.key(version))
+        if entry is None:
+            raise common.KineticClientException(
+                "Dictionary {0} version {1} not found.".format(self.name, version))
+        primed = self._versions[version] = _Primed(str(entry.value), self.level)
+        return primed
+
+    def dictionary(self, version):
+        """
+        Returns the dictionary of version.
+        """
+        primed = self._versions.get(version) or self._fetch(version)
+        return primed.dictionary
+
+    def publish(self, dictionary):
+        """
+        Stores dictionary as the next version and makes it current.
+        Returns the version.
+        """
+        if len(dictionary) > MAX_DICTIONARY_SIZE:
+            raise ValueError("Dictionaries are limited to {0} bytes.".format(MAX_DICTIONARY_SIZE))
+        for attempt in xrange(PUBLISH_RETRIES):
+            version = max(self.versions() or [0]) + 1
+            if version > MAX_VERSION:
+                raise common.KineticClientException(
+                    "Dictionary {0} has too many versions.".format(self.name))
+            try:
+                # only creates the key, concurrent publishers retry
+                self.client.put(self.key(version), dictionary, version='', new_version='1')
+            except common.KineticMessageException as e:
+                if e.code != 'VERSION_MISMATCH':
+                    raise
+                continue
+            self._versions[version] = _Primed(str(dictionary), self.level)
+            self.current = version
+            LOG.debug("Published dictionary {0} version {1}.".format(self.name, version))
+            return version
+        raise common.KineticClientException(
+            "Could not publish dictionary {0}, too many concurrent versions.".format(self.name))
+
+    def train(self, samples, size=DEFAULT_DICTIONARY_SIZE, **kwargs):
+        """
+        Trains a dictionary from samples (see :func:`train`) and publishes
+        it. Returns the version.
+        """
+        return self.publish(train(samples, size, **kwargs))
+
+    def compress(self, value):
+        """
+        Returns the version and value compressed, None without dictionary.
+        """
+        if self.current is None:
+            return None
+        primed = self._versions.get(self.current) or self._fetch(self.current)
+        return _VERSION.pack(self.current) + primed.compress(value)
+
+    def decompress(self, data):
+        version, = _VERSION.unpack_from(data)
+        primed = self._versions.get(version) or self._fetch(version)
+        return primed.decompress(data[_VERSION.size:])
@@ -0,0 +1,165 @@
+# Copyright 2013-2015 Seagate Technology LLC.
+#
+# This Source Code Form is subject to the terms of the Mozilla
+# Public License, v. 2.0. If a copy of the MPL was not
+# distributed with this file, You can obtain one at
+# https://mozilla.org/MP:/2.0/.
+#
+# This program is distributed in the hope that it will be useful,
+# but is provided AS-IS, WITHOUT ANY WARRANTY; including without
+# the implied warranty of MERCHANTABILITY, NON-INFRINGEMENT or
+# FITNESS FOR A PARTICULAR PURPOSE. See the Mozilla Public
+# License for more details.
+#
+# See www.openkinetic.org for more project information
+#
+
+import logging
+import eventlet
+
+import common
+
+LOG = logging.getLogger(__name__)
+
+DEFAULT_MAX_DELAY = 0.01 # seconds
+DEFAULT_MAX_OPERATIONS = 64
+
+
+class DurableWriter(object):
+    """
+    Durable writes at close to WRITEBACK cost for a :class:`~greenclient.Client`.
+
+    Puts and deletes are sent with WRITEBACK synchronization (unless the
+    caller passes another one) and, once acknowledged, wait for a
+    FLUSHALLDATA. A single flush is issued for all the writes waiting, every
+    max_delay seconds or as soon as max_operations writes are waiting,
+    whichever comes first. The future returned for each
+    write completes only when a flush sent after the write was acknowledged
+    completes, so a successful result means the write is durable.
+    """
+
+    def __init__(self, client, max_delay=DEFAULT_MAX_DELAY,
+                 max_operations=DEFAULT_MAX_OPERATIONS):
+        """
+        Args:
+            client: a connected :class:`~greenclient.Client`.
+            max_delay: seconds an acknowledged write may wait for a flush.
+            max_operations: acknowledged writes that trigger a flush.
+        """
+        self.client = client
+        self.max_delay = max_delay
+        self.max_operations = max_operations
+        self.writes = 0
+        self.flushes = 0
+        self._acked = []
+        self._outstanding = set()
+        self._flushing = False
+        self._closing = False
+        self._timer = None
+
+    def put(self, key, data, **kwargs):
+        """
+        Sends a put, accepts the same arguments as
+        :func:`~greenclient.Client.put`. Returns a future that completes
+        once the value is durable.
+        """
+        return self._send(self.client.putAsync, (key, data), kwargs)
+
+    def delete(self, key, **kwargs):
+        """
+        Sends a delete, accepts the same arguments as
+        :func:`~greenclient.Client.delete`. Returns a future that completes
+        with True, or False if the key was not found, once the delete is
+        durable.
+        """
+        return self._send(self.client.deleteAsync, (key,), kwargs)
+
+    def _send(self, fn, args, kwargs):
+        kwargs.setdefault('synchronization', common.Synchronization.WRITEBACK)
+        future = common.Future()
+        self._outstanding.add(future)
+        future.add_done_callback(self._outstanding.discard)
+
+        def onSuccess(r):
+            self._acked.append((future, r))
+            self._schedule()
+
+        try:
+            fn(onSuccess, future.set_exception, *args, **kwargs)
+        except:
+            self._outstanding.discard(future)
+            raise
+        self.writes += 1
+        return future
+
+    def _schedule(self):
+        # only one automatic flush at a time, the writes acknowledged
+        # meanwhile are covered by the next one
+        if self._flushing or not self._acked:
+            return
+        if self._closing or len(self._acked) >= self.max_operations:
+            self.flush()
+        elif not self._timer:
+            self._timer = eventlet.spawn_after(self.max_delay, self._expired)
+
+    def _expired(self):
+        self._timer = None
+        if not self._flushing:
+            self.flush()
+
+    def flush(self):
+        """
+        Flushes the writes acknowledged so far right away.
+        Returns a future that completes when the flush does.
+        """
+        if self._timer:
+            self._timer.cancel()
+            self._timer = None
+
+        covered, self._acked = self._acked, []
+        done = common.Future()
+        if not covered:
+            done.set_result(None)
+            return done
+
+        self._flushing = True
+
+        def onSuccess(_):
+            self._flushing = False
+            for f, r in covered:
+                f.set_result(r)
+            done.set_result(None)
+            self._schedule()
+
+        def onError(e):
+            self._flushing = False
+            LOG.warn("Flush covering {0} writes failed. {1}".format(len(covered), e))
+            for f, _ in covered:
+                f.set_exception(e)
+            done.set_exception(e)
+            self._schedule()
+
+        self.client.flushAsync(onSuccess, onError)
+        self.flushes += 1
+        return done
+
+    def close(self):
+        """
+        Waits until every write sent is durable or failed, flushing as soon
+        as writes are acknowledged.
+        """
+        self._closing = True
+        try:
+            self._schedule()
+            for f in list(self._outstanding):
+                f.exception()
+        finally:
+            self._closing = False
+
+    ### with statement support ###
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, t, v, tb):
+        self.close()
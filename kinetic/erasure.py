@@ -0,0 +1,390 @@
+# Copyright 2013-2015 Seagate Technology LLC.
+#
+# This Source Code Form is subject to the terms of the Mozilla
+# Public License, v. 2.0. If a copy of the MPL was not
+# distributed with this file, You can obtain one at
+# https://mozilla.org/MP:/2.0/.
+#
+# This program is distributed in the hope that it will be useful,
+# but is provided AS-IS, WITHOUT ANY WARRANTY; including without
+# the implied warranty of MERCHANTABILITY, NON-INFRINGEMENT or
+# FITNESS FOR A PARTICULAR PURPOSE. See the Mozilla Public
+# License for more details.
+#
+# See www.openkinetic.org for more project information
+#
+
+import binascii
+import collections
+import logging
+import struct
+import uuid
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+import common
+from cluster import DEFAULT_PAGE_SIZE
+from cluster import DEFAULT_VNODES
+from replication import ReplicatedCluster
+
+LOG = logging.getLogger(__name__)
+
+DEFAULT_DATA_FRAGMENTS = 4
+DEFAULT_PARITY_FRAGMENTS = 2
+
+# GF(256) with the polynomial x^8 + x^4 + x^3 + x^2 + 1
+_EXP = [0] * 512
+_LOG = [0] * 256
+_x = 1
+for _i in xrange(255):
+    _EXP[_i] = _x
+    _LOG[_x] = _i
+    _x <<= 1
+    if _x & 0x100:
+        _x ^= 0x11d
+for _i in xrange(255, 512):
+    _EXP[_i] = _EXP[_i - 255]
+
+
+def _mul(a, b):
+    if a == 0 or b == 0:
+        return 0
+    return _EXP[_LOG[a] + _LOG[b]]
+
+
+def _inv(a):
+    if a == 0:
+        raise ZeroDivisionError("0 has no inverse in GF(256)")
+    return _EXP[255 - _LOG[a]]
+
+
+def _invert(matrix):
+    # Gauss-Jordan elimination, matrix is a square list of lists
+    n = len(matrix)
+    a = [list(row) + [int(i == j) for j in xrange(n)] for i, row in enumerate(matrix)]
+    for col in xrange(n):
+        pivot = next(r for r in xrange(col, n) if a[r][col])
+        a[col], a[pivot] = a[pivot], a[col]
+        f = _inv(a[col][col])
+        a[col] = [_mul(f, x) for x in a[col]]
+        for r in xrange(n):
+            if r != col and a[r][col]:
+                f = a[r][col]
+                a[r] = [x ^ _mul(f, y) for x, y in zip(a[r], a[col])]
+    return [row[n:] for row in a]
+
+
+_tables = {}
+
+def _table(c):
+    # multiplication by c as a str.translate table
+    t = _tables.get(c)
+    if t is None:
+        t = _tables[c] = ''.join(chr(_mul(c, x)) for x in xrange(256))
+    return t
+
+
+def _combine(row, shards, size):
+    """
+    Returns sum(row[i] * shards[i]) over GF(256), every shard of size bytes.
+    """
+    if numpy is not None:
+        acc = numpy.zeros(size, numpy.uint8)
+        for c, s in zip(row, shards):
+            if c:
+                acc ^= _NP_TABLES[c][numpy.frombuffer(s, numpy.uint8)]
+        return acc.tostring()
+    if size == 0:
+        return ''
+    # translate multiplies a whole shard at once, long integers xor them
+    acc = 0
+    for c, s in zip(row, shards):
+        if c:
+            acc ^= int(binascii.hexlify(s.translate(_table(c))), 16)
+    return binascii.unhexlify('%0*x' % (2 * size, acc))
+
+
+if numpy is not None:
+    _NP_TABLES = numpy.array([[_mul(c, x) for x in xrange(256)] for c in xrange(256)],
+                             numpy.uint8)
+
+
+class ReedSolomon(object):
+    """
+    Systematic Reed-Solomon code over GF(256): k data fragments (the value
+    split in k) plus m parity fragments, any k of them rebuild the value.
+
+    Parity rows come from a Cauchy matrix, so every k x k submatrix of the
+    encoding matrix is invertible. Uses NumPy if installed.
+    """
+
+    def __init__(self, k, m):
+        if k < 1 or m < 0 or k + m > 256:
+            raise ValueError("Invalid code {0}+{1}.".format(k, m))
+        self.k = k
+        self.m = m
+        self.parity = [[_inv((k + i) ^ j) for j in xrange(k)] for i in xrange(m)]
+
+    def _row(self, index):
+        if index < self.k:
+            return [int(j == index) for j in xrange(self.k)]
+        return self.parity[index - self.k]
+
+    def fragmentSize(self, length):
+        return -(-length // self.k)
+
+    def encode(self, data):
+        """
+        Returns the k + m fragments of data.
+        """
+        size = self.fragmentSize(len(data))
+        data = data + '\0' * (size * self.k - len(data))
+        shards = [data[i * size:(i + 1) * size] for i in xrange(self.k)]
+        return shards + [_combine(row, shards, size) for row in self.parity]
+
+    def decode(self, fragments, length):
+        """
+        Rebuilds the value of length bytes from a dict of at least k
+        fragment index -> fragment.
+        """
+        if len(fragments) < self.k:
+            raise ValueError("{0} fragments needed, {1} given.".format(self.k, len(fragments)))
+        size = self.fragmentSize(length)
+        if all(i in fragments for i in xrange(self.k)):
+            shards = [fragments[i] for i in xrange(self.k)]
+        else:
+            indexes = sorted(fragments)[:self.k]
+            available = [fragments[i] for i in indexes]
+            decoding = _invert([self._row(i) for i in indexes])
+            shards = [fragments[i] if i in fragments else _combine(decoding[i], available, size)
+                      for i in xrange(self.k)]
+        return ''.join(shards)[:length]
+
+
+# fragment index, data fragments, parity fragments, value length
+_HEADER = struct.Struct('>BBBQ')
+
+
+def _parse(value):
+    # values can be read as bytearray
+    index, k, m, length = _HEADER.unpack_from(value)
+    return index, k, m, length, str(buffer(value, _HEADER.size))
+
+
+class ErasureCodedCluster(ReplicatedCluster):
+    """
+    :class:`~replication.ReplicatedCluster` storing every value as
+    Reed-Solomon fragments instead of full copies.
+
+    A value is split in data_fragments pieces plus parity_fragments parity
+    pieces, each stored with the same key on a distinct device of the key's
+    preference list, so up to parity_fragments devices can be lost for
+    (data_fragments + parity_fragments) / data_fragments times the raw
+    capacity. Every fragment starts with a small header (its index, the code
+    and the value length) and all fragments of a write share its dbVersion.
+
+    Reads fetch the data fragments in parallel and only read the parity
+    fragments when some are missing, failed or belong to another version.
+    Counter: degraded_reads (reads that needed parity).
+    """
+
+    def __init__(self, drives=(), data_fragments=DEFAULT_DATA_FRAGMENTS,
+                 parity_fragments=DEFAULT_PARITY_FRAGMENTS, write_quorum=None,
+                 vnodes=DEFAULT_VNODES, **kwargs):
+        """
+        Args:
+            drives: see :class:`~cluster.Cluster`.
+            data_fragments: fragments the value is split in.
+            parity_fragments: parity fragments, devices that can be lost.
+            write_quorum: fragments a write waits for, one more than
+                data_fragments by default.
+            vnodes: see :class:`~cluster.Cluster`.
+            kwargs: see :class:`~replication.ReplicatedCluster`.
+        """
+        self.codec = ReedSolomon(data_fragments, parity_fragments)
+        fragments = data_fragments + parity_fragments
+        super(ErasureCodedCluster, self).__init__(
+            drives, fragments, write_quorum or min(data_fragments + 1, fragments),
+            vnodes, **kwargs)
+        self.degraded_reads = 0
+
+    def _fragmentsFor(self, key):
+        names = self.replicasFor(key)
+        if len(names) < self.replicas:
+            raise common.KineticClientException(
+                "{0} drives needed, {1} available.".format(self.replicas, len(names)))
+        return names
+
+    ### writes ###
+
+    def putAsync(self, onSuccess, onError, key, data, version='', new_version=None, **kwargs):
+        names = self._fragmentsFor(key)
+        if hasattr(data, 'read'):
+            # values sent from files are encoded in memory
+            data = data.read()
+        k, m = self.codec.k, self.codec.m
+        values = dict((name, (_HEADER.pack(i, k, m, len(data)) + f,))
+                      for i, (name, f) in enumerate(zip(names, self.codec.encode(data))))
+        new_version = new_version or uuid.uuid4().hex
+        # repairs are conditional even when the write is not
+        repair_kwargs = dict(kwargs, new_version=new_version)
+        repair_kwargs.pop('force', None)
+        kwargs = dict(kwargs, version=version, new_version=new_version)
+
+        def written(f):
+            if f.exception():
+                onError(f.exception())
+            else:
+                onSuccess(None)
+
+        self._replicate('putAsync', key, values.get, kwargs, repair_kwargs).add_done_callback(written)
+
+    ### reads ###
+
+    def _gather(self, onSuccess, onError, key, names):
+        """
+        Reads the fragments of key from names, data fragments first, and
+        decodes the value of the version with at least k fragments.
+        """
+        k = self.codec.k
+        fragments = collections.defaultdict(dict) # version -> index -> (value, length)
+        state = {'missing': 0, 'error': None, 'pending': list(names)}
+
+        def complete():
+            versions = sorted(fragments.items(), key=lambda item: len(item[1]), reverse=True)
+            if versions and len(versions[0][1]) >= k:
+                version, fs = versions[0]
+                if not all(i in fs for i in xrange(k)):
+                    self.degraded_reads += 1
+                length = fs.values()[0][1]
+                try:
+                    value = self.codec.decode(dict((i, v) for i, (v, _) in fs.items()), length)
+                except Exception as e:
+                    onError(e)
+                    return
+                onSuccess(common.Entry(key, value, common.EntryMetadata(version=version)))
+                return True
+            if not fragments and state['error'] is None:
+                onSuccess(None) # no data fragment, not found
+                return True
+            if state['pending']:
+                return False
+            else:
+                onError(state['error'] or common.KineticClientException(
+                    "Not enough fragments of {0} to decode it.".format(repr(key))))
+            return True
+
+        def read(batch):
+            futures = [self._send(n, 'getAsync', key) for n in batch]
+
+            def landed(_):
+                for f in futures:
+                    e = f.exception()
+                    if e is not None:
+                        state['error'] = e
+                    elif f.result() is None:
+                        state['missing'] += 1
+                    else:
+                        entry = f.result()
+                        index, code_k, code_m, length, value = _parse(entry.value)
+                        if (code_k, code_m) == (self.codec.k, self.codec.m):
+                            fragments[entry.metadata.version][index] = (value, length)
+                if not complete():
+                    read(next_batch())
+
+            common.Future.all(futures).add_done_callback(landed)
+
+        def next_batch():
+            # one read per fragment still needed by the most complete version
+            have = max(len(fs) for fs in fragments.values()) if fragments else 0
+            batch = state['pending'][:max(k - have, 1)]
+            del state['pending'][:len(batch)]
+            return batch
+
+        read(next_batch())
+
+    def getAsync(self, onSuccess, onError, key, consistent=False):
+        # fragments are always checked against each other, consistent is
+        # accepted for compatibility
+        try:
+            names = self._fragmentsFor(key)
+        except Exception as e:
+            onError(e)
+            return
+        self._gather(onSuccess, onError, key, names)
+
+    def getMetadataAsync(self, onSuccess, onError, key):
+        def stripped(m):
+            # the tag is the one of a fragment
+            onSuccess(m and common.EntryMetadata(version=m.version))
+
+        super(ErasureCodedCluster, self).getMetadataAsync(stripped, onError, key)
+
+    def get(self, key, consistent=False):
+        return self._wait(self.getAsync, key)
+
+    ### range operations ###
+
+    def rebalance(self, startKey=None, endKey=None, page_size=DEFAULT_PAGE_SIZE):
+        """
+        Rewrites the values whose fragments are not on the devices they
+        belong to (i.e. after adding or removing drives), keeping their
+        versions, and removes fragments from the devices that no longer hold
+        any. Both only replace the version read, so a value written
+        meanwhile is left alone. Returns the number of values rewritten and
+        fragments removed.
+        """
+        return super(ErasureCodedCluster, self).rebalance(startKey, endKey, page_size)
+
+    def _place(self, key, name, source):
+        owners = self.replicasFor(key)
+        entry = source.get(key)
+        if entry is None or (name in owners and _parse(entry.value)[0] == owners.index(name)):
+            return 0
+        version = entry.metadata.version or ''
+        held = [self.clients[o].getVersion(key) for o in owners]
+        changes = 0
+        # the fragments of the other owners are checked when their devices
+        # are scanned, so only a misplaced source needs a rewrite
+        if name in owners or any(v != version for v in held):
+            # decoded from every device since fragments are not where expected
+            obj = self._wait(self._gather, key, self._fastest(self.clients.keys()))
+            if obj is None:
+                return 0
+            if (obj.metadata.version or '') != version:
+                LOG.debug("Not rewriting {0}, written meanwhile.".format(repr(key)))
+            elif self._rewrite(key, owners, held, obj):
+                changes += 1
+        if name not in owners:
+            try:
+                source.delete(key, version=version)
+            except common.KineticMessageException as e:
+                if e.code != 'VERSION_MISMATCH':
+                    raise
+                LOG.warn("Not removing {0} from {1}, written meanwhile.".format(repr(key), name))
+                return changes
+            changes += 1
+        return changes
+
+    def _rewrite(self, key, owners, held, obj):
+        version = obj.metadata.version or ''
+        k, m = self.codec.k, self.codec.m
+        fragments = self.codec.encode(obj.value)
+        written = False
+        for i, (o, f, current) in enumerate(zip(owners, fragments, held)):
+            if current is not None and current != version:
+                continue
+            try:
+                # only replaces the version read, a write since wins
+                self.clients[o].put(key, _HEADER.pack(i, k, m, len(obj.value)) + f,
+                                    version=current or '', new_version=version)
+            except common.KineticMessageException as e:
+                if e.code != 'VERSION_MISMATCH':
+                    raise
+                LOG.debug("Not rewriting {0} on {1}, written meanwhile.".format(repr(key), o))
+                continue
+            written = True
+        return written
@@ -17,6 +17,8 @@
 #@author: Ignacio Corderi
 
 import logging
+import random
+import uuid
 import eventlet
 from eventlet.queue import Queue
 
@@ -24,17 +26,26 @@ from eventlet.green import socket
 from eventlet.green.ssl import GreenSSLSocket
 
 import baseasync
+import batch
+import bulk
+import cache
 import common
+import operations
 
 LOG = logging.getLogger(__name__)
 
 DEFAULT_POOL_SIZE = 100
 DEFAULT_MAX_QUEUE_SIZE = 20
 MAX_PENDING = 10
+MAX_BATCHES_IN_FLIGHT = 4
+CAS_RETRIES = 5
+CAS_BACKOFF = 0.005 # seconds
 
 class Client(baseasync.BaseAsync):
 
     def __init__(self, *args, **kwargs):
+        # optional cache.ReadCache
+        self.cache = kwargs.pop('cache', None)
         super(Client, self).__init__(*args, **kwargs)
         self.pool = eventlet.greenpool.GreenPool(DEFAULT_POOL_SIZE)
         self.reader_thread = None
@@ -52,6 +63,8 @@ class Client(baseasync.BaseAsync):
     def connect(self):
         super(Client, self).connect()
         self.closing = False
+        self._batch_slots = eventlet.semaphore.Semaphore(
+            self.limits.maxBatchCountPerDevice or MAX_BATCHES_IN_FLIGHT)
         self.reader_thread = eventlet.greenthread.spawn(self._reader_run)
         self.writer_thread = eventlet.greenthread.spawn(self._writer_run)
 
@@ -120,6 +133,247 @@ class Client(baseasync.BaseAsync):
         if d.error: raise d.error
         return d.result
 
+    def _wait_for(self, start):
+        done = eventlet.event.Event()
+
+        def innerSuccess(r):
+            done.send((r, None))
+
+        def innerError(e):
+            done.send((None, e))
+
+        start(innerSuccess, innerError)
+
+        r, e = done.wait()
+        if e: raise e
+        return r
+
+    def send_no_ack(self, header, value):
+        # go through the writer so no_ack messages (i.e. batch operations)
+        # are never interleaved on the socket with queued messages
+        self.sendAsync(header, value, None, None, no_ack=True)
+
+    def _process(self, op, *args, **kwargs):
+        if not self.cache:
+            return super(Client, self)._process(op, *args, **kwargs)
+
+        def fetch():
+            try:
+                r = super(Client, self)._process(op, *args, **kwargs)
+            except Exception as e:
+                self.cache.observe(op, e)
+                raise
+            self.cache.observe(op, r)
+            return r
+
+        if type(op) is operations.Get:
+            key = args[0] if args else kwargs['key']
+            return self.cache.get(self, key, fetch)
+        return fetch()
+
+    def _processAsync(self, op, onSuccess, onError, *args, **kwargs):
+        if not self.cache:
+            return super(Client, self)._processAsync(op, onSuccess, onError, *args, **kwargs)
+
+        if 'batch_id' in kwargs:
+            # no response, the cache is invalidated when sent
+            super(Client, self)._processAsync(op, onSuccess, onError, *args, **kwargs)
+            self.cache.observe(op, None)
+            return
+
+        def fetch(onSuccess, onError):
+            def observedSuccess(r):
+                self.cache.observe(op, r)
+                onSuccess(r)
+
+            def observedError(e):
+                self.cache.observe(op, e)
+                onError(e)
+
+            super(Client, self)._processAsync(op, observedSuccess, observedError, *args, **kwargs)
+
+        if type(op) is operations.Get:
+            key = args[0] if args else kwargs['key']
+            self.cache.getAsync(self, key, fetch, onSuccess, onError)
+        else:
+            fetch(onSuccess, onError)
+
+    def _versions(self):
+        c = self.cache
+        while c and not isinstance(c, cache.VersionCache):
+            c = getattr(c, 'inner', None)
+        return c
+
+    def casPut(self, key, data, new_version=None, retries=CAS_RETRIES,
+               backoff=CAS_BACKOFF, **kwargs):
+        """
+        Compare-and-swap put without tracking versions.
+
+        The put is conditioned on the last version of key this client has
+        seen, remembered by a :class:`~cache.VersionCache` on the client's
+        cache, so it takes a single round trip when the version is known
+        (getVersion is used otherwise). data can also be a function that
+        gets the current entry (None if missing) and returns the value; the
+        entry is read with get, so the put is conditioned on what the
+        function saw.
+
+        On VERSION_MISMATCH the version is refreshed and the put retried up
+        to retries times, sleeping a random time up to backoff seconds,
+        doubled on each retry.
+
+        Returns the new version, new_version or a random one if not given.
+        """
+        versions = self._versions()
+        attempt = 0
+        while True:
+            if callable(data):
+                entry = self.get(key)
+                version = entry.metadata.version if entry else ''
+                value = data(entry)
+            else:
+                version = versions.version(key) if versions else None
+                if version is None:
+                    version = self.getVersion(key) or ''
+                value = data
+
+            next_version = new_version or uuid.uuid4().hex
+            try:
+                self.put(key, value, version=version, new_version=next_version, **kwargs)
+                return next_version
+            except common.KineticMessageException as e:
+                if e.code != 'VERSION_MISMATCH' or attempt >= retries:
+                    raise
+            eventlet.sleep(random.uniform(0, backoff * 2 ** attempt))
+            attempt += 1
+
+    def begin_batch_async(self, max_operations=None):
+        """
+        Starts a non-blocking batch, see :class:`~batch.AsyncBatch`.
+
+        Batches larger than max_operations (by default the device's
+        limits.maxOperationCountPerBatch) are split automatically.
+        """
+        if not self.isConnected: raise common.NotConnected("Must call connect() before sending operations.")
+        return batch.AsyncBatch(self, max_operations)
+
+    def getMany(self, keys, **kwargs):
+        """
+        Gets many keys pipelining the requests, see :func:`~bulk.getMany`.
+        """
+        return bulk.getMany([self], keys, **kwargs)
+
+    def putMany(self, items, **kwargs):
+        """
+        Puts many (key, value) pairs pipelining the requests,
+        see :func:`~bulk.putMany`.
+        """
+        return bulk.putMany([self], items, **kwargs)
+
+    def deleteMany(self, keys, **kwargs):
+        """
+        Deletes many keys pipelining the requests, see :func:`~bulk.deleteMany`.
+        """
+        return bulk.deleteMany([self], keys, **kwargs)
+
+    def versionMany(self, keys, **kwargs):
+        """
+        Gets the versions of many keys pipelining the requests,
+        see :func:`~bulk.versionMany`.
+        """
+        return bulk.versionMany([self], keys, **kwargs)
+
+    def deleteRange(self, startKey=None, endKey=None, startKeyInclusive=True,
+                    endKeyInclusive=True, force=True, batch_size=None,
+                    max_batches=None, onProgress=None):
+        """
+        Deletes all the keys in a range.
+
+        Keys are streamed from the device one getKeyRange page at a time and
+        their deletes are grouped in batches of at most
+        limits.maxOperationCountPerBatch operations, keeping up to
+        max_batches batches in flight. When a batch is aborted its keys are
+        deleted one by one so failures can be reported per key. Devices that
+        do not support batches get pipelined individual deletes instead.
+
+        onProgress, if set, is called with (deleted, failed) counts every
+        time a group of keys is done.
+
+        Returns a tuple (deleted, failed) where deleted is the number of keys
+        removed and failed is a dictionary of key -> exception.
+        """
+        page_size = self.limits.maxKeyRangeCount or 200
+        use_batches = self.limits.maxOperationCountPerBatch > 0 and \
+                      self.limits.maxBatchCountPerDevice > 0
+        if use_batches:
+            batch_size = min(batch_size or self.limits.maxOperationCountPerBatch,
+                             self.limits.maxOperationCountPerBatch)
+            max_batches = max_batches or min(MAX_BATCHES_IN_FLIGHT,
+                                             self.limits.maxBatchCountPerDevice)
+        else:
+            batch_size = batch_size or page_size
+            max_batches = max_batches or 1
+
+        class Dummy : pass
+        d = Dummy()
+        d.deleted = 0
+        d.failed = {}
+
+        def run(keys):
+            if use_batches:
+                try:
+                    b = self.begin_batch_async(max_operations=len(keys))
+                    for k in keys:
+                        b.delete(k, force=force)
+                    b.commit().result()
+                    d.deleted += len(keys)
+                except Exception as e:
+                    LOG.warn("Batch delete of {0} keys failed, retrying one by one. {1}".format(len(keys), e))
+                    self._deleteEach(keys, force, d)
+            else:
+                self._deleteEach(keys, force, d)
+            if onProgress:
+                onProgress(d.deleted, len(d.failed))
+
+        pool = eventlet.greenpool.GreenPool(max_batches)
+        try:
+            while True:
+                keys = self.getKeyRange(startKey, endKey, startKeyInclusive,
+                                        endKeyInclusive, page_size)
+                for i in xrange(0, len(keys), batch_size):
+                    # blocks while max_batches are already in flight
+                    pool.spawn_n(run, keys[i:i + batch_size])
+                if len(keys) < page_size:
+                    break
+                startKey = keys[-1]
+                startKeyInclusive = False
+        finally:
+            pool.waitall()
+
+        return d.deleted, d.failed
+
+    def _deleteEach(self, keys, force, d):
+        done = eventlet.event.Event()
+        remaining = [len(keys)]
+
+        def complete():
+            remaining[0] -= 1
+            if remaining[0] == 0:
+                done.send()
+
+        for k in keys:
+            def onSuccess(deleted):
+                if deleted: d.deleted += 1
+                complete()
+
+            def onError(e, k=k):
+                d.failed[k] = e
+                complete()
+
+            self.deleteAsync(onSuccess, onError, k, force=force)
+
+        if keys:
+            done.wait()
+
     def _writer_run(self):
         while self.isConnected and not self.faulted:
             try:
@@ -127,6 +381,9 @@ class Client(baseasync.BaseAsync):
                     eventlet.sleep(0)
                 (header, value, onSuccess, onError, no_ack) = self.queue.get()
                 super(Client, self).sendAsync(header, value, onSuccess, onError, no_ack)
+                if no_ack:
+                    # there won't be a response for the reader to account for
+                    self.queue.task_done()
             except common.ConnectionFaulted: pass
             except common.ConnectionClosed: pass
             except Exception as ex:
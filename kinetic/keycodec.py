@@ -0,0 +1,263 @@
+# Copyright 2013-2015 Seagate Technology LLC.
+#
+# This Source Code Form is subject to the terms of the Mozilla
+# Public License, v. 2.0. If a copy of the MPL was not
+# distributed with this file, You can obtain one at
+# https://mozilla.org/MP:/2.0/.
+#
+# This program is distributed in the hope that it will be useful,
+# but is provided AS-IS, WITHOUT ANY WARRANTY; including without
+# the implied warranty of MERCHANTABILITY, NON-INFRINGEMENT or
+# FITNESS FOR A PARTICULAR PURPOSE. See the Mozilla Public
+# License for more details.
+#
+# See www.openkinetic.org for more project information
+#
+
+import datetime
+import struct
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from common import KeyRange
+
+# Order preserving encoding of tuples: keys compare (as bytes, like the
+# device does) the way their tuples compare element by element, elements
+# of different types being ordered by type code.
+#
+#   None        0x00
+#   str         0x01, the bytes with 0x00 escaped as 0x00 0xFF, then 0x00
+#   unicode     0x02, UTF-8 escaped the same way, then 0x00
+#   int, long   0x14 for zero, 0x14 + n then n big endian bytes for
+#               positive ones, 0x14 - n then the one's complement for
+#               negative ones (up to 8 bytes)
+#   datetime    0x40, then microseconds since the epoch (UTC, naive values
+#               taken as UTC) as 8 big endian bytes offset by 2**63
+#
+# No type code is 0xFF, so keys of tuples extending t are between pack(t)
+# and pack(t) + '\xff'.
+NULL = 0x00
+BYTES = 0x01
+STRING = 0x02
+INT_ZERO = 0x14
+TIMESTAMP = 0x40
+
+MAX_INT_BYTES = 8
+
+_Q = struct.Struct('>Q')
+_EPOCH = datetime.datetime(1970, 1, 1)
+_OFFSET = 1 << 63
+
+
+def _escape(value):
+    return value.replace('\x00', '\x00\xff') + '\x00'
+
+
+def _encodeBytes(value):
+    return '\x01' + _escape(value)
+
+
+def _encodeString(value):
+    return '\x02' + _escape(value.encode('utf-8'))
+
+
+def _encodeInt(value):
+    if value == 0:
+        return '\x14'
+    if value > 0:
+        n = (value.bit_length() + 7) // 8
+        if n > MAX_INT_BYTES:
+            raise ValueError("Integer {0} does not fit {1} bytes.".format(value, MAX_INT_BYTES))
+        return chr(INT_ZERO + n) + _Q.pack(value)[-n:]
+    n = ((-value).bit_length() + 7) // 8
+    if n > MAX_INT_BYTES:
+        raise ValueError("Integer {0} does not fit {1} bytes.".format(value, MAX_INT_BYTES))
+    # last n bytes of the 64 bit one's complement
+    return chr(INT_ZERO - n) + _Q.pack(~(-value) & 0xffffffffffffffff)[-n:]
+
+
+def _encodeTimestamp(value):
+    offset = value.utcoffset()
+    if offset is not None:
+        value = value.replace(tzinfo=None) - offset
+    d = value - _EPOCH
+    micros = (d.days * 86400 + d.seconds) * 1000000 + d.microseconds
+    return '\x40' + _Q.pack(micros + _OFFSET)
+
+
+def _encodeNull(value):
+    return '\x00'
+
+
+_ENCODERS = {
+    type(None): _encodeNull,
+    str: _encodeBytes,
+    unicode: _encodeString,
+    int: _encodeInt,
+    long: _encodeInt,
+    bool: _encodeInt,
+    datetime.datetime: _encodeTimestamp,
+}
+
+
+def _encoder(value):
+    try:
+        return _ENCODERS[type(value)]
+    except KeyError:
+        for t, encoder in _ENCODERS.iteritems():
+            if isinstance(value, t):
+                return encoder
+        raise TypeError("Cannot encode {0} in a key.".format(type(value).__name__))
+
+
+def pack(t, prefix=''):
+    """
+    Returns the key of tuple t, after prefix.
+    """
+    return prefix + ''.join([_encoder(v)(v) for v in t])
+
+
+def _decodeEscaped(key, pos):
+    start = pos
+    while True:
+        end = key.find('\x00', pos)
+        if end < 0:
+            raise ValueError("Unterminated element at {0}.".format(start))
+        if key[end + 1:end + 2] != '\xff':
+            break
+        pos = end + 2
+    return key[start:end].replace('\x00\xff', '\x00'), end + 1
+
+
+def _decode(key, pos):
+    code = ord(key[pos])
+    pos += 1
+    if code == BYTES:
+        return _decodeEscaped(key, pos)
+    if code == STRING:
+        value, pos = _decodeEscaped(key, pos)
+        return value.decode('utf-8'), pos
+    if INT_ZERO - MAX_INT_BYTES <= code <= INT_ZERO + MAX_INT_BYTES:
+        n = code - INT_ZERO
+        if n >= 0:
+            return _Q.unpack('\x00' * (8 - n) + key[pos:pos + n])[0], pos + n
+        n = -n
+        return _Q.unpack('\x00' * (8 - n) + key[pos:pos + n])[0] - ((1 << 8 * n) - 1), pos + n
+    if code == TIMESTAMP:
+        micros = _Q.unpack_from(key, pos)[0] - _OFFSET
+        return _EPOCH + datetime.timedelta(microseconds=micros), pos + 8
+    if code == NULL:
+        return None, pos
+    raise ValueError("Unknown type code 0x{0:02x} at {1}.".format(code, pos - 1))
+
+
+def unpack(key, prefix=''):
+    """
+    Returns the tuple of key, which must start with prefix.
+    """
+    key = str(key)
+    if not key.startswith(prefix):
+        raise ValueError("Key does not start with the prefix.")
+    pos = len(prefix)
+    values = []
+    while pos < len(key):
+        value, pos = _decode(key, pos)
+        values.append(value)
+    return tuple(values)
+
+
+def tupleRange(t=(), prefix=''):
+    """
+    Returns the :class:`~common.KeyRange` of the keys of t and of every
+    tuple starting with t.
+    """
+    start = pack(t, prefix)
+    return KeyRange(start, start + '\xff', True, False)
+
+
+### bulk ###
+
+def _encodeColumn(values):
+    if len(set(map(type, values))) == 1:
+        return map(_encoder(values[0]), values)
+    return [_encoder(v)(v) for v in values]
+
+
+def _columnData(values):
+    # a column encoded as one string and the length of every element
+    types = set(map(type, values))
+    if types == set([str]):
+        data = ''.join(values)
+        if '\x00' not in data:
+            return '\x01' + '\x00\x01'.join(values) + '\x00', \
+                numpy.fromiter(map(len, values), numpy.int64, len(values)) + 2
+    elif types <= set([int, long]):
+        try:
+            return _intColumnData(numpy.array(values, numpy.int64))
+        except OverflowError:
+            pass
+    parts = _encodeColumn(values)
+    return ''.join(parts), numpy.fromiter(map(len, parts), numpy.int64, len(parts))
+
+
+def _intColumnData(a):
+    negative = a < 0
+    magnitude = numpy.where(negative, -a, a).astype(numpy.uint64)
+    length = numpy.zeros(len(a), numpy.int64)
+    for i in xrange(MAX_INT_BYTES):
+        length += magnitude >= numpy.uint64(1 << 8 * i)
+    rows = numpy.empty((len(a), 1 + MAX_INT_BYTES), numpy.uint8)
+    rows[:, 0] = INT_ZERO + numpy.where(negative, -length, length)
+    rows[:, 1:] = numpy.where(negative, ~magnitude, magnitude).astype('>u8') \
+        .view(numpy.uint8).reshape(len(a), MAX_INT_BYTES)
+    # the type code and the last length bytes of every row
+    keep = numpy.arange(1 + MAX_INT_BYTES) >= (1 + MAX_INT_BYTES - length)[:, None]
+    keep[:, 0] = True
+    return rows[keep].tostring(), length + 1
+
+
+def _packColumns(columns, prefix):
+    # every column encoded as a whole, then their bytes gathered row by row
+    data = [_columnData(c) for c in columns]
+    src = numpy.frombuffer(''.join(d for d, _ in data), numpy.uint8)
+    lengths = numpy.column_stack([l for _, l in data])
+    offsets = numpy.cumsum([0] + [len(d) for d, _ in data[:-1]])
+    starts = numpy.column_stack([o + numpy.cumsum(l) - l for o, (_, l) in zip(offsets, data)])
+    lengths, starts = lengths.ravel(), starts.ravel()
+    total = int(lengths.sum())
+    # for every byte of the keys, where it comes from
+    index = numpy.arange(total) + numpy.repeat(starts - (numpy.cumsum(lengths) - lengths), lengths)
+    keys = src[index].tostring()
+    ends = numpy.cumsum(lengths.reshape(-1, len(columns)).sum(axis=1)).tolist()
+    return [prefix + keys[s:e] for s, e in zip([0] + ends[:-1], ends)]
+
+
+def packMany(rows, prefix=''):
+    """
+    Returns the keys of rows (tuples), after prefix, like :func:`pack`.
+    Rows of the same length are encoded column by column, with NumPy
+    (when installed) turning whole columns of integers or of strings
+    without NUL bytes into keys at once.
+    """
+    rows = list(rows)
+    if not rows:
+        return []
+    width = len(rows[0])
+    if any(len(r) != width for r in rows):
+        return [pack(r, prefix) for r in rows]
+    if width == 0:
+        return [prefix] * len(rows)
+    columns = [list(c) for c in zip(*rows)]
+    if numpy is not None:
+        return _packColumns(columns, prefix)
+    return [prefix + ''.join(parts) for parts in zip(*map(_encodeColumn, columns))]
+
+
+def unpackMany(keys, prefix=''):
+    """
+    Returns the tuples of keys, which must start with prefix.
+    """
+    return [unpack(k, prefix) for k in keys]
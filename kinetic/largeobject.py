@@ -0,0 +1,433 @@
+# Copyright 2013-2015 Seagate Technology LLC.
+#
+# This Source Code Form is subject to the terms of the Mozilla
+# Public License, v. 2.0. If a copy of the MPL was not
+# distributed with this file, You can obtain one at
+# https://mozilla.org/MP:/2.0/.
+#
+# This program is distributed in the hope that it will be useful,
+# but is provided AS-IS, WITHOUT ANY WARRANTY; including without
+# the implied warranty of MERCHANTABILITY, NON-INFRINGEMENT or
+# FITNESS FOR A PARTICULAR PURPOSE. See the Mozilla Public
+# License for more details.
+#
+# See www.openkinetic.org for more project information
+#
+
+# Objects larger than a value, stored as chunks plus a manifest.
+#
+# The object is split in chunk_size pieces stored under derived keys
+# (key/_chunks/<generation>/<index>) and the manifest, describing the
+# object, is stored under the object's key once every chunk is written.
+# Readers only see an object after its manifest is committed and every put
+# uses a new generation, so replacing an object never mixes chunks of two
+# versions; the chunks of the previous generation are removed afterwards.
+#
+# updateLarge only rewrites the chunks whose SHA1 differs from the tag the
+# device keeps for them, under a new generation recorded per chunk in the
+# manifest (overrides), so chunks are never rewritten in place and readers
+# of the previous manifest keep reading the previous object. Small updates
+# are written in a single batch with the manifest; otherwise the changed
+# chunks are written first and committed by the manifest. The chunks they
+# replace are removed once the manifest is committed.
+#
+# Like bulk, every function takes a list of connected clients (chunks are
+# spread round robin among them) or an object routing keys with
+# clientFor(key) (i.e. a cluster.Cluster). Clusters that are not routable
+# (i.e. a replication.ReplicatedCluster) get every request themselves and
+# never take batches. At most `window` chunk requests are outstanding at
+# any time.
+
+import hashlib
+import itertools
+import json
+import logging
+import mmap
+import os
+import stat
+import uuid
+
+import bulk
+import common
+import zero_copy
+
+LOG = logging.getLogger(__name__)
+
+DEFAULT_CHUNK_SIZE = common.MAX_VALUE_SIZE
+MANIFEST_MAGIC = 'KLO1'
+
+
+class Manifest(object):
+    """
+    Describes a chunked object: its size, chunk size and the generation
+    naming its chunks, overrides maps the index of chunks rewritten by
+    :func:`updateLarge` to their generation. version is the dbVersion of
+    the manifest read.
+    """
+
+    def __init__(self, size, chunk_size, generation, overrides=None, version=None):
+        self.size = size
+        self.chunk_size = chunk_size
+        self.generation = generation
+        self.overrides = overrides or {}
+        self.version = version
+
+    @property
+    def chunks(self):
+        return -(-self.size // self.chunk_size)
+
+    def chunkKey(self, key, index):
+        return '%s/_chunks/%s/%08d' % (key, self.overrides.get(index, self.generation), index)
+
+    def chunkKeys(self, key):
+        return [self.chunkKey(key, i) for i in xrange(self.chunks)]
+
+    def serialize(self):
+        d = {'size': self.size, 'chunk_size': self.chunk_size, 'generation': self.generation}
+        if self.overrides:
+            d['overrides'] = dict((str(i), g) for i, g in self.overrides.items())
+        return MANIFEST_MAGIC + json.dumps(d)
+
+    @staticmethod
+    def parse(value):
+        value = str(value)
+        if not value.startswith(MANIFEST_MAGIC):
+            raise common.KineticClientException("Not a large object manifest.")
+        d = json.loads(value[len(MANIFEST_MAGIC):])
+        overrides = dict((int(i), str(g)) for i, g in d.get('overrides', {}).items())
+        return Manifest(d['size'], d['chunk_size'], str(d['generation']), overrides)
+
+
+def _targets(clients):
+    if hasattr(clients, 'clientFor') and not getattr(clients, 'routable', True):
+        return [clients]
+    return clients
+
+
+def _clientFor(clients, key):
+    if hasattr(clients, 'clientFor'):
+        return clients.clientFor(key)
+    return clients[0]
+
+
+def _read(source, chunk_size):
+    # str, bytearray, or file like objects (files, sockets, mmap)
+    if hasattr(source, 'read'):
+        while True:
+            data = source.read(chunk_size)
+            if not data:
+                return
+            yield data
+    else:
+        for i in xrange(0, len(source), chunk_size):
+            yield source[i:i + chunk_size]
+
+
+def _values(source, chunk_size):
+    # regular files are sent with sendfile and hashed over a memory map,
+    # a few chunks ahead in parallel, without reading them into Python
+    if not hasattr(source, 'fileno') or not hasattr(source, 'tell'):
+        return _read(source, chunk_size)
+    try:
+        st = os.fstat(source.fileno())
+    except (AttributeError, IOError, OSError): # i.e. StringIO
+        return _read(source, chunk_size)
+    if not stat.S_ISREG(st.st_mode):
+        return _read(source, chunk_size)
+    return _fileValues(source, st.st_size, chunk_size)
+
+
+def _fileValues(f, size, chunk_size):
+    if hasattr(f, 'flush'):
+        f.flush()
+    start = f.tell()
+    values = (zero_copy.ZeroCopyValue(f.fileno(), offset, min(chunk_size, size - offset))
+              for offset in xrange(start, size, chunk_size))
+    for value in zero_copy.prehash(values):
+        yield value
+    f.seek(size)
+
+
+def _check(results):
+    for key, r in results:
+        if isinstance(r, Exception):
+            raise r
+        yield key, r
+
+
+def _drain(results, written, errors):
+    # waits for every chunk put, so none is still being written when the
+    # ones written are removed on failure
+    for key, r in results:
+        if isinstance(r, Exception):
+            errors.append(r)
+        else:
+            written.append(key)
+    if errors:
+        raise errors[0]
+
+
+def getManifest(clients, key):
+    """
+    Returns the :class:`Manifest` of the object at key, None if not found.
+    """
+    clients = _targets(clients)
+    entry = _clientFor(clients, key).get(key)
+    if entry is None:
+        return None
+    manifest = Manifest.parse(entry.value)
+    manifest.version = entry.metadata.version
+    return manifest
+
+
+def putLarge(clients, key, source, chunk_size=DEFAULT_CHUNK_SIZE, window=bulk.DEFAULT_WINDOW,
+             version='', new_version='', **kwargs):
+    """
+    Stores source (a string or a file like object) chunked, chunks are
+    uploaded in parallel and the manifest is committed last with version
+    and new_version. On failure the chunks written are removed. Extra
+    arguments are passed to every chunk put. Chunks of regular files are
+    sent as :class:`~zero_copy.ZeroCopyValue`. Returns the :class:`Manifest`.
+    """
+    clients = _targets(clients)
+    if chunk_size > common.MAX_VALUE_SIZE:
+        raise common.KineticClientException("Chunks exceed maximum size of {0} bytes.".format(common.MAX_VALUE_SIZE))
+    previous = getManifest(clients, key)
+    manifest = Manifest(0, chunk_size, uuid.uuid4().hex)
+    written, errors = [], []
+
+    def chunks():
+        for i, data in enumerate(_values(source, chunk_size)):
+            if errors:
+                return
+            manifest.size += len(data)
+            yield manifest.chunkKey(key, i), data
+
+    try:
+        _drain(bulk.putMany(clients, chunks(), window, stream=True, **kwargs), written, errors)
+        _clientFor(clients, key).put(key, manifest.serialize(), version=version,
+                                     new_version=new_version)
+    except:
+        LOG.debug("Upload of {0} failed, removing {1} chunks.".format(repr(key), len(written)))
+        list(bulk.deleteMany(clients, written, window, stream=True, force=True))
+        raise
+
+    if previous is not None:
+        list(bulk.deleteMany(clients, previous.chunkKeys(key), window, stream=True, force=True))
+    return manifest
+
+
+def _unchanged(entry, data):
+    # entry is the metadata read of the chunk, None or an exception
+    return isinstance(entry, common.Entry) and \
+        entry.metadata.algorithm == common.IntegrityAlgorithms.SHA1 and \
+        entry.metadata.tag == hashlib.sha1(data).digest()
+
+
+def _batchClient(clients, keys):
+    # the client all keys go to if it takes batches
+    if hasattr(clients, 'clientFor'):
+        targets = set(clients.clientFor(k) for k in keys)
+        if len(targets) != 1:
+            return None
+        client = targets.pop()
+    else:
+        client = clients[0]
+    limits = getattr(client, 'limits', None)
+    if not hasattr(client, 'begin_batch') or not limits or \
+       not limits.maxOperationCountPerBatch or not limits.maxBatchCountPerDevice:
+        return None
+    return client
+
+
+def updateLarge(clients, key, source, chunk_size=DEFAULT_CHUNK_SIZE, window=bulk.DEFAULT_WINDOW,
+                version=None, new_version='', **kwargs):
+    """
+    Replaces the object at key with source (a string or a file like object),
+    only writing the chunks that changed and the manifest. Chunks are
+    compared at fixed offsets, so data inserted or removed rewrites every
+    following chunk. The manifest is written with version (by default the
+    version read) and new_version. Changed chunks are written under new
+    keys, in one device batch with the manifest when they fit (the update
+    is then atomic), otherwise first and committed by the manifest as with
+    :func:`putLarge`. A missing object is
+    written with :func:`putLarge` in chunk_size chunks, existing objects
+    keep their chunk size. Returns the number of chunks written.
+    """
+    clients = _targets(clients)
+    old = getManifest(clients, key)
+    if old is None:
+        return putLarge(clients, key, source, chunk_size, window, version=version or '',
+                        new_version=new_version, **kwargs).chunks
+    if version is None:
+        version = old.version or ''
+    oldKeys = old.chunkKeys(key)
+    metadata = bulk.metadataMany(clients, oldKeys, window)
+    new = Manifest(0, old.chunk_size, old.generation, dict(old.overrides))
+
+    def changed():
+        for i, data in enumerate(_read(source, old.chunk_size)):
+            new.size += len(data)
+            if i >= len(metadata) or not _unchanged(metadata[i], data):
+                yield i, data
+
+    client = _batchClient(clients, [key])
+    limit = client.limits.maxOperationCountPerBatch if client else 0
+    items = changed()
+    pending = list(itertools.islice(items, limit))
+    if len(pending) < limit:
+        # every chunk compared and few enough changes for one batch
+        generation = uuid.uuid4().hex
+        staged = Manifest(new.size, new.chunk_size, new.generation, dict(new.overrides))
+        for i, _ in pending:
+            staged.overrides[i] = generation
+        writes = [staged.chunkKey(key, i) for i, _ in pending]
+        if len(writes) + 1 <= limit and _batchClient(clients, writes + [key]) is client:
+            superseded = [oldKeys[i] for i, _ in pending if i < len(oldKeys)] + \
+                oldKeys[staged.chunks:]
+            _settle(staged, generation)
+            b = client.begin_batch()
+            try:
+                for k, (_, data) in zip(writes, pending):
+                    b.put(k, data, **kwargs)
+                b.put(key, staged.serialize(), version=version, new_version=new_version)
+            except:
+                b.abort()
+                raise
+            b.commit()
+            list(bulk.deleteMany(clients, superseded, window, stream=True, force=True))
+            return len(pending)
+    return _rewrite(clients, key, old, new, itertools.chain(pending, items), window,
+                    version, new_version, kwargs)
+
+
+def _settle(manifest, generation):
+    # drops the overrides past the end or naming the base generation, and
+    # makes generation the base one when it names every chunk
+    manifest.overrides = dict((i, g) for i, g in manifest.overrides.items()
+                              if i < manifest.chunks and g != manifest.generation)
+    if len(manifest.overrides) == manifest.chunks and \
+       set(manifest.overrides.values()) == set([generation]):
+        manifest.generation, manifest.overrides = generation, {}
+
+
+def _rewrite(clients, key, old, new, items, window, version, new_version, kwargs):
+    generation = uuid.uuid4().hex
+    oldKeys = old.chunkKeys(key)
+    superseded = []
+    written, errors = [], []
+
+    def chunks():
+        for i, data in items:
+            if errors:
+                return
+            if i < len(oldKeys):
+                superseded.append(oldKeys[i])
+            new.overrides[i] = generation
+            yield new.chunkKey(key, i), data
+
+    try:
+        _drain(bulk.putMany(clients, chunks(), window, stream=True, **kwargs), written, errors)
+        superseded.extend(oldKeys[new.chunks:])
+        _settle(new, generation)
+        _clientFor(clients, key).put(key, new.serialize(), version=version,
+                                     new_version=new_version)
+    except:
+        LOG.debug("Update of {0} failed, removing {1} chunks.".format(repr(key), len(written)))
+        list(bulk.deleteMany(clients, written, window, stream=True, force=True))
+        raise
+
+    list(bulk.deleteMany(clients, superseded, window, stream=True, force=True))
+    return len(written)
+
+
+def iterLarge(clients, key, window=bulk.DEFAULT_WINDOW):
+    """
+    Iterates the chunks of the object at key in order, fetching them in
+    parallel. Yields nothing if not found.
+    """
+    clients = _targets(clients)
+    manifest = getManifest(clients, key)
+    if manifest is None:
+        return
+    for k, entry in _check(bulk.getMany(clients, manifest.chunkKeys(key), window, stream=True)):
+        if entry is None:
+            raise common.KineticClientException("Chunk {0} of {1} not found.".format(repr(k), repr(key)))
+        yield entry.value
+
+
+def getLarge(clients, key, window=bulk.DEFAULT_WINDOW):
+    """
+    Returns the object at key, None if not found.
+    """
+    clients = _targets(clients)
+    manifest = getManifest(clients, key)
+    if manifest is None:
+        return None
+    buf = bytearray(manifest.size)
+    _into(clients, key, manifest, buf, 0, window)
+    return str(buf)
+
+
+def getLargeInto(clients, key, target, offset=0, window=bulk.DEFAULT_WINDOW):
+    """
+    Writes the object at key into target at offset as chunks arrive.
+    target can be a bytearray, an mmap, a file descriptor or a file like
+    object. Returns the size of the object, None if not found.
+    """
+    clients = _targets(clients)
+    manifest = getManifest(clients, key)
+    if manifest is None:
+        return None
+    _into(clients, key, manifest, target, offset, window)
+    return manifest.size
+
+
+def _into(clients, key, manifest, target, offset, window):
+    if isinstance(target, (bytearray, mmap.mmap)):
+        if len(target) < offset + manifest.size:
+            raise ValueError("Target too small for {0} bytes at {1}.".format(manifest.size, offset))
+
+    if isinstance(target, bytearray):
+        def write(data):
+            target[write.pos:write.pos + len(data)] = data
+            write.pos += len(data)
+
+        write.pos = offset
+    elif isinstance(target, (int, long)):
+        os.lseek(target, offset, os.SEEK_SET)
+
+        def write(data):
+            pos = 0
+            while pos < len(data):
+                pos += os.write(target, buffer(data, pos))
+    elif isinstance(target, mmap.mmap):
+        target.seek(offset)
+        write = lambda data: target.write(buffer(data))
+    else:
+        if offset:
+            target.seek(offset)
+        write = target.write
+
+    for k, entry in _check(bulk.getMany(clients, manifest.chunkKeys(key), window, stream=True)):
+        if entry is None:
+            raise common.KineticClientException("Chunk {0} of {1} not found.".format(repr(k), repr(key)))
+        write(entry.value)
+
+
+def deleteLarge(clients, key, window=bulk.DEFAULT_WINDOW, version=None, force=False):
+    """
+    Deletes the manifest, with version (by default the version read), then
+    the chunks, of the object at key. Returns True if it was deleted and
+    False if it was not found.
+    """
+    clients = _targets(clients)
+    manifest = getManifest(clients, key)
+    if manifest is None:
+        return False
+    if version is None:
+        version = manifest.version or ''
+    if not _clientFor(clients, key).delete(key, version=version, force=force):
+        return False
+    list(bulk.deleteMany(clients, manifest.chunkKeys(key), window, stream=True, force=True))
+    return True
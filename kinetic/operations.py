@@ -21,6 +21,7 @@ from common import EntryMetadata
 from common import KineticMessageException
 import common
 import kinetic_pb2 as messages
+import zero_copy
 import logging
 import hashlib
 
@@ -54,7 +55,12 @@ def _buildMessage(m, messageType, key, data=None, version='', new_version='',
             m.body.keyValue.tag = hashlib.sha1(data).digest()
             m.body.keyValue.algorithm = common.IntegrityAlgorithms.SHA1
         else:
-            m.body.keyValue.tag = 'l337'
+            # values sent from files can hash them without reading them
+            integrity = data.integrity() if hasattr(data, 'integrity') else None
+            if integrity:
+                m.body.keyValue.tag, m.body.keyValue.algorithm = integrity
+            else:
+                m.body.keyValue.tag = 'l337'
 
     if (messageType == messages.Command.PUT or messageType == messages.Command.DELETE) and synchronization == None:
         synchronization = common.Synchronization.WRITEBACK
@@ -75,6 +81,7 @@ class BaseOperation(object):
 
     def __init__(self):
         self.m = None
+        self.codec = None # compression.Compressor of the client
 
     def _build(): pass
 
@@ -120,6 +127,13 @@ class Noop(BaseOperation):
 class Put(BaseOperation):
 
     def _build(self, key, data, version="", new_version="", **kwargs):
+        self.value = data
+        if self.codec and isinstance(data, (str, bytearray)):
+            if not (kwargs.get('tag') and kwargs.get('algorithm')):
+                # tagged as the caller's value, not as stored
+                kwargs.update(tag=hashlib.sha1(data).digest(),
+                              algorithm=common.IntegrityAlgorithms.SHA1)
+            data = self.codec.encode(key, data)
         return _buildMessage(self.m, messages.Command.PUT, key, data, version, new_version, **kwargs)
 
 
@@ -129,7 +143,31 @@ class Get(BaseOperation):
         return _buildMessage(self.m, messages.Command.GET, key)
 
     def parse(self, m, value):
-        return Entry.fromResponse(m, value)
+        entry = Entry.fromResponse(m, value)
+        if entry and self.codec:
+            entry.value = self.codec.decode(entry.value, entry.key)
+        return entry
+
+    def onError(self, e):
+        if isinstance(e,KineticMessageException):
+            if e.code and e.code == 'NOT_FOUND':
+                return None
+        raise e
+
+
+class GetInto(BaseOperation):
+
+    def _build(self, key, target, offset=None):
+        # the client hands the value of the response to the sink
+        self.sink = zero_copy.make_sink(target, offset)
+        return _buildMessage(self.m, messages.Command.GET, key)
+
+    def parse(self, m, value):
+        if isinstance(value, Exception):
+            # the sink could not take the value
+            raise value
+        # the value was written to the target, value is its length
+        return Entry.fromResponse(m, value or 0)
 
     def onError(self, e):
         if isinstance(e,KineticMessageException):
@@ -326,7 +364,7 @@ class EndBatch(BaseOperation):
     def onError(self, e):
         if isinstance(e,common.KineticException):
             if e.code and e.code == 'INVALID_BATCH':
-                return common.BatchAbortedException(e.value)
+                raise common.BatchAbortedException(e.value)
         raise e
 
 class AbortBatch(BaseOperation):
@@ -0,0 +1,437 @@
+# Copyright 2013-2015 Seagate Technology LLC.
+#
+# This Source Code Form is subject to the terms of the Mozilla
+# Public License, v. 2.0. If a copy of the MPL was not
+# distributed with this file, You can obtain one at
+# https://mozilla.org/MP:/2.0/.
+#
+# This program is distributed in the hope that it will be useful,
+# but is provided AS-IS, WITHOUT ANY WARRANTY; including without
+# the implied warranty of MERCHANTABILITY, NON-INFRINGEMENT or
+# FITNESS FOR A PARTICULAR PURPOSE. See the Mozilla Public
+# License for more details.
+#
+# See www.openkinetic.org for more project information
+#
+
+import collections
+import logging
+import struct
+
+import eventlet
+
+import common
+
+LOG = logging.getLogger(__name__)
+
+DEFAULT_PACK_SIZE = 64*1024
+DEFAULT_MIN_LIVE_RATIO = 0.5
+DEFAULT_CACHED_PACKS = 16
+PAGE_SIZE = 200
+
+PUT = 1
+DELETE = 2
+
+# entry type, key length, offset, length, then the key
+_ENTRY = struct.Struct('>BHII')
+# entries, entries bytes, magic
+_FOOTER = struct.Struct('>II4s')
+MAGIC = 'KPK1'
+
+
+# Small objects packed into shared values.
+#
+# Objects are appended to an open pack kept in memory, written under
+# <prefix>packs/<sequence> when it is full or on flush. A pack holds the
+# objects' bytes followed by its entries, (key, offset, length) for every
+# object and a tombstone for every delete, so the index of every object is
+# rebuilt by replaying the packs in sequence order (load). Packs are never
+# rewritten; objects replaced or deleted leave dead bytes behind, and packs
+# whose live bytes fall under min_live_ratio are compacted: their live
+# objects (and tombstones still hiding older copies) are appended to the
+# open pack and, once that is written, the old pack is deleted. Tombstones
+# count as their entry's bytes, and die once no pack holds an older copy of
+# their key.
+
+
+def _parse(data):
+    """
+    Returns the entries of a pack, (type, key, offset, length) tuples.
+    """
+    count, size, magic = _FOOTER.unpack_from(data, len(data) - _FOOTER.size)
+    if magic != MAGIC:
+        raise common.KineticClientException("Value is not a pack.")
+    pos = len(data) - _FOOTER.size - size
+    entries = []
+    for _ in xrange(count):
+        t, n, offset, length = _ENTRY.unpack_from(data, pos)
+        pos += _ENTRY.size
+        entries.append((t, str(data[pos:pos + n]), offset, length))
+        pos += n
+    return entries
+
+
+class _Pack(object):
+
+    def __init__(self, seq):
+        self.seq = seq
+        self.size = 0 # object and tombstone bytes
+        self.live = 0 # bytes of objects the index points to and of
+                      # tombstones still hiding older copies
+        self.written = False
+
+    @property
+    def ratio(self):
+        return float(self.live) / self.size if self.size else 0.0
+
+
+class _OpenPack(_Pack):
+
+    def __init__(self, seq):
+        super(_OpenPack, self).__init__(seq)
+        self.data = bytearray()
+        self.entries = []
+        self.entries_size = 0
+
+    def append(self, t, key, value=''):
+        offset = len(self.data)
+        self.data.extend(value)
+        self.entries.append((t, key, offset, len(value)))
+        self.entries_size += _ENTRY.size + len(key)
+        return offset
+
+    def fits(self, key, value, pack_size):
+        return len(self.data) + len(value) + self.entries_size + \
+            _ENTRY.size + len(key) + _FOOTER.size <= pack_size
+
+    def serialize(self):
+        out = bytearray(self.data)
+        for t, key, offset, length in self.entries:
+            out.extend(_ENTRY.pack(t, len(key), offset, length))
+            out.extend(key)
+        out.extend(_FOOTER.pack(len(self.entries), self.entries_size, MAGIC))
+        return str(out)
+
+
+class PackedStore(object):
+    """
+    put/get/delete facade storing small objects packed together in shared
+    values under prefix on client, so many objects cost one key and one
+    operation on the device. See the module comment for the layout.
+
+    Puts and deletes are buffered in the open pack and written when it
+    reaches pack_size or on :func:`flush` (also when leaving a with
+    statement); gets see them right away. Reads fetch the whole pack and
+    keep the last cached_packs in memory, so pack_size trades read
+    amplification for fewer keys. Objects over max_object_size (a quarter
+    of pack_size by default) belong on the client directly.
+
+    The index lives in memory, :func:`load` rebuilds it from the packs on
+    the device. One store writes to a prefix at a time: writing a pack
+    another writer created fails.
+
+    Packs whose live bytes fall under min_live_ratio are compacted in the
+    background after a flush if autocompact, or with :func:`compact`.
+    Counters: packs_written, packs_read, compactions.
+    """
+
+    def __init__(self, client, prefix, pack_size=DEFAULT_PACK_SIZE, max_object_size=None,
+                 min_live_ratio=DEFAULT_MIN_LIVE_RATIO, cached_packs=DEFAULT_CACHED_PACKS,
+                 autocompact=True):
+        if pack_size > common.MAX_VALUE_SIZE:
+            raise common.KineticClientException("Packs exceed maximum size of {0} bytes.".format(common.MAX_VALUE_SIZE))
+        self.client = client
+        self.prefix = prefix
+        self.pack_size = pack_size
+        self.max_object_size = max_object_size or pack_size // 4
+        self.min_live_ratio = min_live_ratio
+        self.cached_packs = cached_packs
+        self.autocompact = autocompact
+        self.packs_written = 0
+        self.packs_read = 0
+        self.compactions = 0
+        self.index = {} # key -> (seq, offset, length)
+        self._tombstones = {} # deleted key -> seq of its tombstone
+        self._stale = {} # key -> seqs of packs holding copies it replaced
+        self._packs = {} # seq -> _Pack
+        self._cache = collections.OrderedDict() # seq -> pack value
+        self._unwritten = {} # seq -> _OpenPack to write
+        self._open = self._newPack(1)
+        self._compacting = False
+
+    def packKey(self, seq):
+        return '%spacks/%016x' % (self.prefix, seq)
+
+    def _newPack(self, seq):
+        pack = self._packs[seq] = _OpenPack(seq)
+        return pack
+
+    ### objects ###
+
+    def put(self, key, value):
+        if len(value) > self.max_object_size:
+            raise common.KineticClientException(
+                "Object exceeds maximum size of {0} bytes.".format(self.max_object_size))
+        self._reserve(key, value)
+        self._forget(key)
+        self._dropTombstone(key)
+        self._appendObject(key, value)
+
+    def get(self, key):
+        """
+        Returns the :class:`~common.Entry` of key (value only), None if
+        not found.
+        """
+        location = self.index.get(key)
+        if location is None:
+            return None
+        seq, offset, length = location
+        data = self._data(seq)
+        return common.Entry(key, str(buffer(data, offset, length)))
+
+    def delete(self, key):
+        """
+        Returns True if key was found and deleted.
+        """
+        if key not in self.index:
+            return False
+        self._reserve(key, '')
+        self._forget(key)
+        self._appendTombstone(key)
+        return True
+
+    def __contains__(self, key):
+        return key in self.index
+
+    def __len__(self):
+        return len(self.index)
+
+    def keys(self):
+        return self.index.keys()
+
+    def _reserve(self, key, value):
+        # flushing yields, others may fill the next pack meanwhile
+        while not self._open.fits(key, value, self.pack_size):
+            self.flush()
+
+    def _forget(self, key):
+        location = self.index.pop(key, None)
+        if location is not None:
+            self._packs[location[0]].live -= location[2]
+            self._stale.setdefault(key, set()).add(location[0])
+            return location
+
+    def _unstale(self, key, seq):
+        # seq is gone, the tombstone of key dies with its last older copy
+        seqs = self._stale.get(key)
+        if seqs is None:
+            return
+        seqs.discard(seq)
+        if not seqs:
+            del self._stale[key]
+            self._dropTombstone(key)
+
+    def _appendObject(self, key, value):
+        pack = self._open
+        offset = pack.append(PUT, key, value)
+        pack.size += len(value)
+        pack.live += len(value)
+        self.index[key] = (pack.seq, offset, len(value))
+
+    def _appendTombstone(self, key):
+        pack = self._open
+        pack.append(DELETE, key)
+        pack.size += _ENTRY.size + len(key)
+        pack.live += _ENTRY.size + len(key)
+        self._dropTombstone(key)
+        self._tombstones[key] = pack.seq
+
+    def _dropTombstone(self, key):
+        seq = self._tombstones.pop(key, None)
+        if seq in self._packs:
+            self._packs[seq].live -= _ENTRY.size + len(key)
+
+    def _data(self, seq):
+        pack = self._packs[seq]
+        if isinstance(pack, _OpenPack):
+            return pack.data
+        data = self._cache.pop(seq, None)
+        if data is None:
+            data = self._read(seq)
+        self._remember(seq, data)
+        return data
+
+    def _remember(self, seq, data):
+        self._cache[seq] = data
+        while len(self._cache) > self.cached_packs:
+            self._cache.popitem(last=False)
+
+    def _read(self, seq):
+        entry = self.client.get(self.packKey(seq))
+        if entry is None:
+            raise common.KineticClientException("Pack {0} not found.".format(self.packKey(seq)))
+        self.packs_read += 1
+        return str(entry.value)
+
+    ### packs ###
+
+    def flush(self):
+        """
+        Writes the open pack, and packs whose write failed before.
+        """
+        pack = self._open
+        if pack.entries:
+            self._open = self._newPack(pack.seq + 1)
+            self._unwritten[pack.seq] = pack
+        for seq in sorted(self._unwritten):
+            pack = self._unwritten.pop(seq, None)
+            if pack is not None:
+                self._write(pack)
+        if self.autocompact and not self._compacting and self.sparse():
+            self._compacting = True
+            eventlet.spawn_n(self._backgroundCompact)
+
+    def _write(self, pack):
+        value = pack.serialize()
+        try:
+            # creates the key, fails if another writer did
+            self.client.put(self.packKey(pack.seq), value, version='', new_version='1')
+        except:
+            # still readable from memory, retried on the next flush
+            self._unwritten[pack.seq] = pack
+            raise
+        # from now on read like any other pack
+        written = _Pack(pack.seq)
+        written.size, written.live = pack.size, pack.live
+        written.written = True
+        self._packs[pack.seq] = written
+        self._remember(pack.seq, value)
+        self.packs_written += 1
+
+    def sparse(self):
+        """
+        Returns the written packs that compaction would rewrite.
+        """
+        return sorted(p.seq for p in self._packs.values() if p.written and
+                      (not p.live or p.ratio < self.min_live_ratio))
+
+    def _backgroundCompact(self):
+        try:
+            self.compact()
+        except Exception as e:
+            LOG.warn("Compaction of {0} failed. {1}".format(self.prefix, e))
+        finally:
+            self._compacting = False
+
+    def compact(self):
+        """
+        Moves the live objects of sparse packs to the open pack, writes it
+        and deletes the sparse packs, again while that leaves other packs
+        sparse. Returns the number of packs deleted.
+        """
+        compacting, self._compacting = self._compacting, True
+        try:
+            return self._compact()
+        finally:
+            self._compacting = compacting
+
+    def _compact(self):
+        # packs deleted kill the tombstones hiding their copies, so other
+        # packs become sparse; packs written meanwhile wait for next time
+        first = self._open.seq
+        deleted = 0
+        seqs = self.sparse()
+        while seqs:
+            self._compactRound(seqs)
+            deleted += len(seqs)
+            seqs = [seq for seq in self.sparse() if seq < first]
+        return deleted
+
+    def _compactRound(self, seqs):
+        entries = {}
+        for seq in seqs:
+            data = self._data(seq)
+            entries[seq] = _parse(data)
+            for t, key, offset, length in entries[seq]:
+                # reserving may flush, so the entry is checked once done in
+                # case the key was put or deleted meanwhile
+                if t == PUT and self.index.get(key) == (seq, offset, length):
+                    value = data[offset:offset + length]
+                    self._reserve(key, value)
+                    if self.index.get(key) == (seq, offset, length):
+                        self._forget(key)
+                        self._appendObject(key, value)
+                elif t == DELETE and self._tombstones.get(key) == seq:
+                    if not self._stale.get(key, set()) - set(seqs):
+                        # the older copies go with the packs compacted
+                        self._dropTombstone(key)
+                        continue
+                    self._reserve(key, '')
+                    if self._tombstones.get(key) == seq:
+                        self._appendTombstone(key)
+        self.flush()
+        for seq in seqs:
+            self.client.delete(self.packKey(seq), force=True)
+            del self._packs[seq]
+            self._cache.pop(seq, None)
+            for t, key, _, _ in entries[seq]:
+                if t == PUT:
+                    self._unstale(key, seq)
+            self.compactions += 1
+
+    def load(self):
+        """
+        Rebuilds the index from the packs on the device, dropping anything
+        not flushed. Returns the number of objects.
+        """
+        self.index = {}
+        self._tombstones = {}
+        self._stale = {}
+        self._packs = {}
+        self._unwritten = {}
+        self._cache.clear()
+        last = 0
+        for key in self._packKeys():
+            seq = int(key[len(self.prefix) + len('packs/'):], 16)
+            data = self._read(seq)
+            pack = self._packs[seq] = _Pack(seq)
+            pack.written = True
+            for t, k, offset, length in _parse(data):
+                if t == PUT:
+                    self._forget(k)
+                    self._dropTombstone(k)
+                    pack.size += length
+                    pack.live += length
+                    self.index[k] = (seq, offset, length)
+                else:
+                    self._forget(k)
+                    self._dropTombstone(k)
+                    self._tombstones[k] = seq
+                    pack.size += _ENTRY.size + len(k)
+                    pack.live += _ENTRY.size + len(k)
+            self._remember(seq, data)
+            last = seq
+        for k in [k for k in self._tombstones if k not in self._stale]:
+            # hides nothing left on the device
+            self._dropTombstone(k)
+        self._open = self._newPack(last + 1)
+        return len(self.index)
+
+    def _packKeys(self):
+        start, inclusive = self.prefix + 'packs/', True
+        end = self.prefix + 'packs/\xff'
+        while True:
+            keys = self.client.getKeyRange(start, end, inclusive, True, PAGE_SIZE)
+            for k in keys:
+                yield k
+            if len(keys) < PAGE_SIZE:
+                return
+            start, inclusive = keys[-1], False
+
+    ### with statement support ###
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, t, v, tb):
+        self.flush()
@@ -0,0 +1,443 @@
+# Copyright 2013-2015 Seagate Technology LLC.
+#
+# This Source Code Form is subject to the terms of the Mozilla
+# Public License, v. 2.0. If a copy of the MPL was not
+# distributed with this file, You can obtain one at
+# https://mozilla.org/MP:/2.0/.
+#
+# This program is distributed in the hope that it will be useful,
+# but is provided AS-IS, WITHOUT ANY WARRANTY; including without
+# the implied warranty of MERCHANTABILITY, NON-INFRINGEMENT or
+# FITNESS FOR A PARTICULAR PURPOSE. See the Mozilla Public
+# License for more details.
+#
+# See www.openkinetic.org for more project information
+#
+
+# Local proxy sharing a few device connections among many processes.
+#
+# Clients connect to a UNIX socket (BaseClient's socket_path argument) and
+# speak the regular Kinetic framing. Every request is verified with the
+# client's credentials, given a sequence (and batch id) of one of the pooled
+# device connections and signed again with the proxy's credentials. Responses
+# get the client's sequence back and are signed with the client's secret.
+#
+#   kinetic-proxy -H drive -P 8123 -s /var/run/kinetic/drive.sock -c 4
+
+import argparse
+import errno
+import itertools
+import logging
+import os
+import socket
+import struct
+import eventlet
+from eventlet.green import socket as greensocket
+
+from baseclient import BaseClient
+from baseclient import calculate_hmac
+import common
+import kinetic_pb2 as messages
+
+LOG = logging.getLogger(__name__)
+
+DEFAULT_CONNECTIONS = 4
+DEFAULT_BACKLOG = 128
+
+_FRAME = struct.Struct('>Bii')
+
+# batched writes are never answered by the device
+_NO_ACK = (messages.Command.PUT, messages.Command.DELETE)
+_BATCH_END = (messages.Command.END_BATCH, messages.Command.ABORT_BATCH)
+
+
+def _recv_exactly(s, n):
+    buf = bytearray(n)
+    view = memoryview(buf)
+    while n:
+        nbytes = s.recv_into(view, n)
+        if nbytes == 0:
+            raise common.ServerDisconnect("Connection closed by peer")
+        view = view[nbytes:]
+        n -= nbytes
+    return buf
+
+
+def _recv_frame(s):
+    magic, proto_ln, value_ln = _FRAME.unpack(str(_recv_exactly(s, _FRAME.size)))
+    if magic != ord('F'):
+        raise common.KineticClientException("Invalid Magic Value!")
+    m = messages.Message()
+    m.ParseFromString(str(_recv_exactly(s, proto_ln)))
+    value = _recv_exactly(s, value_ln) if value_ln > 0 else ''
+    return m, value
+
+
+def _send_frame(s, m, value):
+    out = m.SerializeToString()
+    s.sendall(_FRAME.pack(ord('F'), len(out), len(value) if value else 0) + out)
+    if value:
+        s.sendall(value)
+
+
+def _status(code, message):
+    cmd = messages.Command()
+    cmd.status.code = code
+    cmd.status.statusMessage = message
+    return cmd
+
+
+class _Upstream(BaseClient):
+    """
+    Pooled device connection, forwards already parsed commands.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(_Upstream, self).__init__(*args, **kwargs)
+        self._pending = {}
+        self._lock = eventlet.semaphore.Semaphore()
+        self._reader = None
+
+    def build_socket(self, family=socket.AF_INET):
+        return greensocket.socket(family)
+
+    def connect(self):
+        super(_Upstream, self).connect()
+        self._reader = eventlet.spawn(self._run)
+
+    def close(self):
+        if self._reader:
+            self._reader.kill()
+            self._reader = None
+        super(_Upstream, self).close()
+
+    @property
+    def load(self):
+        return len(self._pending)
+
+    def forward(self, command, value, pin, callback):
+        """
+        Sends command, callback(response, value) is called with the response
+        unless callback is None. Returns the sequence assigned.
+        """
+        with self._lock:
+            self.update_header(command)
+            seq = command.header.sequence
+            m = messages.Message()
+            m.commandBytes = command.SerializeToString()
+            if pin is not None:
+                m.authType = messages.Message.PINAUTH
+                m.pinAuth.pin = pin
+            else:
+                m.authType = messages.Message.HMACAUTH
+                m.hmacAuth.identity = self.identity
+                m.hmacAuth.hmac = calculate_hmac(self.secret, command)
+            if callback:
+                self._pending[seq] = callback
+            try:
+                _send_frame(self.socket, m, value)
+            except Exception:
+                self._pending.pop(seq, None)
+                raise
+        return seq
+
+    def _run(self):
+        try:
+            while True:
+                m, resp, value = self.network_recv()
+                if m.authType == messages.Message.UNSOLICITEDSTATUS:
+                    LOG.warn('Unsolicited status {0} from {1}. {2}'.format(
+                        resp.status.code, self, resp.status.statusMessage))
+                    continue
+                callback = self._pending.pop(resp.header.ackSequence, None)
+                if callback:
+                    callback(resp, value)
+        except Exception as e:
+            LOG.error('Connection to {0} failed. {1}'.format(self, e))
+            self._reader = None
+            pending, self._pending = self._pending, {}
+            for callback in pending.values():
+                callback(_status(messages.Command.Status.CONNECTION_TERMINATED,
+                                 'Proxy lost its connection to the device.'), '')
+            super(_Upstream, self).close()
+
+
+class _Session(object):
+    """
+    Local client connection.
+    """
+
+    def __init__(self, proxy, sock, connection_id):
+        self.proxy = proxy
+        self.socket = sock
+        self.connection_id = connection_id
+        self.identity = None
+        self.secret = None
+        self._lock = eventlet.semaphore.Semaphore()
+        # local batch id -> (upstream, upstream batch id, upstream seq -> local seq)
+        self._batches = {}
+
+    def reply(self, local_seq, resp, value):
+        resp.header.ackSequence = local_seq
+        resp.header.connectionID = self.connection_id
+        m = messages.Message()
+        m.commandBytes = resp.SerializeToString()
+        if self.identity is not None:
+            m.authType = messages.Message.HMACAUTH
+            m.hmacAuth.identity = self.identity
+            m.hmacAuth.hmac = calculate_hmac(self.secret, resp)
+        else:
+            m.authType = messages.Message.PINAUTH
+        with self._lock:
+            try:
+                _send_frame(self.socket, m, value)
+            except Exception as e:
+                LOG.debug('Dropping response for closed session {0}. {1}'.format(self.connection_id, e))
+
+    def handshake(self, upstream):
+        cmd = _status(messages.Command.Status.SUCCESS, '')
+        cmd.header.connectionID = self.connection_id
+        cmd.header.clusterVersion = upstream.cluster_version
+        cmd.body.getLog.configuration.CopyFrom(upstream.config)
+        cmd.body.getLog.limits.CopyFrom(upstream.limits)
+        m = messages.Message()
+        m.authType = messages.Message.UNSOLICITEDSTATUS
+        m.commandBytes = cmd.SerializeToString()
+        with self._lock:
+            _send_frame(self.socket, m, '')
+
+    def _authenticate(self, m):
+        """
+        Returns an error response if the message is not properly signed.
+        """
+        if m.authType == messages.Message.PINAUTH:
+            return None
+        if m.authType != messages.Message.HMACAUTH:
+            return _status(messages.Command.Status.INVALID_REQUEST, 'Unsupported authentication type.')
+        secret = self.proxy.users.get(m.hmacAuth.identity)
+        if secret is None or calculate_hmac(secret, m.commandBytes) != m.hmacAuth.hmac:
+            return _status(messages.Command.Status.HMAC_FAILURE, 'Incorrect HMAC.')
+        self.identity = m.hmacAuth.identity
+        self.secret = secret
+        return None
+
+    def run(self):
+        try:
+            while True:
+                m, value = _recv_frame(self.socket)
+                cmd = messages.Command()
+                cmd.ParseFromString(m.commandBytes)
+                self.dispatch(m, cmd, value)
+        except common.ServerDisconnect:
+            pass
+        except Exception as e:
+            LOG.warn('Session {0} failed. {1}'.format(self.connection_id, e))
+        finally:
+            self.close()
+
+    def dispatch(self, m, cmd, value):
+        local_seq = cmd.header.sequence
+        error = self._authenticate(m)
+        if error:
+            self.reply(local_seq, error, '')
+            return
+
+        header = cmd.header
+        message_type = header.messageType
+        batch = None
+        if header.HasField('batchID'):
+            local_batch = header.batchID
+            if message_type == messages.Command.START_BATCH:
+                upstream = self.proxy.pick()
+                batch = (upstream, upstream.next_batch_id(), {})
+                self._batches[local_batch] = batch
+            else:
+                batch = self._batches.get(local_batch)
+                if message_type in _BATCH_END:
+                    self._batches.pop(local_batch, None)
+            if batch is None:
+                self.reply(local_seq, _status(messages.Command.Status.INVALID_BATCH,
+                                              'Unknown batch.'), '')
+                return
+            upstream, upstream_batch, sequences = batch
+            header.batchID = upstream_batch
+        else:
+            upstream = self.proxy.pick()
+
+        if batch and message_type in _NO_ACK:
+            callback = None
+        else:
+            def callback(resp, value):
+                if batch and message_type in _BATCH_END:
+                    # report the sequences the client used in the batch
+                    b = resp.body.batch
+                    local = [sequences.get(s, s) for s in b.sequence]
+                    del b.sequence[:]
+                    b.sequence.extend(local)
+                    if b.HasField('failedSequence'):
+                        b.failedSequence = sequences.get(b.failedSequence, b.failedSequence)
+                self.reply(local_seq, resp, value)
+
+        pin = m.pinAuth.pin if m.authType == messages.Message.PINAUTH else None
+        try:
+            seq = upstream.forward(cmd, value, pin, callback)
+        except Exception as e:
+            LOG.warn('Forwarding to {0} failed. {1}'.format(upstream, e))
+            if callback:
+                self.reply(local_seq, _status(messages.Command.Status.CONNECTION_TERMINATED,
+                                              'Proxy lost its connection to the device.'), '')
+            return
+        if batch:
+            batch[2][seq] = local_seq
+
+    def close(self):
+        self.proxy.sessions.discard(self)
+        # batches left open would count against the device's limit
+        batches, self._batches = self._batches, {}
+        for upstream, upstream_batch, _ in batches.values():
+            self._abort(upstream, upstream_batch)
+        try:
+            self.socket.close()
+        except socket.error:
+            pass
+
+
+    def _abort(self, upstream, upstream_batch):
+        cmd = messages.Command()
+        cmd.header.messageType = messages.Command.ABORT_BATCH
+        cmd.header.batchID = upstream_batch
+
+        def callback(resp, value):
+            if resp.status.code != messages.Command.Status.SUCCESS:
+                LOG.warn('Aborting batch {0} on {1} failed. {2}'.format(
+                    upstream_batch, upstream, resp.status.statusMessage))
+        try:
+            upstream.forward(cmd, '', None, callback)
+        except Exception as e:
+            LOG.warn('Aborting batch {0} on {1} failed. {2}'.format(upstream_batch, upstream, e))
+
+
+class Proxy(object):
+    """
+    Serves a device to local processes through a UNIX socket, multiplexing
+    all their requests on a fixed pool of device connections.
+
+    Local clients are authenticated against users (identity -> secret,
+    by default the proxy's own identity and secret) and their requests are
+    run with the proxy's identity on the device.
+    """
+
+    def __init__(self, socket_path, hostname=BaseClient.HOSTNAME, port=BaseClient.PORT,
+                 connections=DEFAULT_CONNECTIONS, identity=BaseClient.USER_ID,
+                 secret=BaseClient.CLIENT_SECRET, users=None, **kwargs):
+        """
+        Args:
+            socket_path: UNIX socket to listen on, replaced if it exists.
+            hostname, port: the device.
+            connections: device connections in the pool.
+            identity, secret: credentials used on the device.
+            users: identity -> secret accepted from local clients.
+            kwargs: passed to every device connection (i.e. use_ssl).
+        """
+        self.socket_path = socket_path
+        self.users = users or {identity: secret}
+        self.sessions = set()
+        self.upstreams = [_Upstream(hostname, port, identity=identity, secret=secret,
+                                    socket_timeout=None, **kwargs)
+                          for _ in xrange(connections)]
+        self._ids = itertools.count(1)
+        self._listener = None
+        self._acceptor = None
+
+    def start(self):
+        for u in self.upstreams:
+            u.connect()
+        try:
+            os.unlink(self.socket_path)
+        except OSError as e:
+            if e.errno != errno.ENOENT:
+                raise
+        self._listener = eventlet.listen(self.socket_path, family=socket.AF_UNIX,
+                                         backlog=DEFAULT_BACKLOG)
+        self._acceptor = eventlet.spawn(self._accept)
+
+    def pick(self):
+        """
+        Returns the least loaded device connection, reconnecting broken ones.
+        """
+        for u in self.upstreams:
+            if not u.isConnected:
+                try:
+                    u.connect()
+                except Exception as e:
+                    LOG.warn('Reconnecting to {0} failed. {1}'.format(u, e))
+        connected = [u for u in self.upstreams if u.isConnected] or self.upstreams
+        return min(connected, key=lambda u: u.load)
+
+    def _accept(self):
+        while True:
+            sock, _ = self._listener.accept()
+            session = _Session(self, sock, self._ids.next())
+            try:
+                session.handshake(self.pick())
+            except Exception as e:
+                LOG.warn('Handshake with local client failed. {0}'.format(e))
+                session.close()
+                continue
+            self.sessions.add(session)
+            eventlet.spawn_n(session.run)
+
+    def wait(self):
+        self._acceptor.wait()
+
+    def stop(self):
+        if self._acceptor:
+            self._acceptor.kill()
+            self._acceptor = None
+        if self._listener:
+            self._listener.close()
+            self._listener = None
+            try:
+                os.unlink(self.socket_path)
+            except OSError:
+                pass
+        for s in list(self.sessions):
+            s.close()
+        for u in self.upstreams:
+            u.close()
+
+    ### with statement support ###
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, t, v, tb):
+        self.stop()
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description='Kinetic local connection pooling proxy')
+    parser.add_argument('-H', '--hostname', default=BaseClient.HOSTNAME)
+    parser.add_argument('-P', '--port', type=int, default=BaseClient.PORT)
+    parser.add_argument('-s', '--socket', required=True, help='UNIX socket to listen on')
+    parser.add_argument('-c', '--connections', type=int, default=DEFAULT_CONNECTIONS,
+                        help='device connections to pool')
+    parser.add_argument('-i', '--identity', type=int, default=BaseClient.USER_ID)
+    parser.add_argument('-k', '--secret', default=BaseClient.CLIENT_SECRET)
+    args = parser.parse_args(args)
+
+    logging.basicConfig()
+    p = Proxy(args.socket, args.hostname, args.port, connections=args.connections,
+              identity=args.identity, secret=args.secret)
+    p.start()
+    try:
+        p.wait()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        p.stop()
+
+
+if __name__ == '__main__':
+    main()
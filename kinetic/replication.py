@@ -0,0 +1,521 @@
+# Copyright 2013-2015 Seagate Technology LLC.
+#
+# This Source Code Form is subject to the terms of the Mozilla
+# Public License, v. 2.0. If a copy of the MPL was not
+# distributed with this file, You can obtain one at
+# https://mozilla.org/MP:/2.0/.
+#
+# This program is distributed in the hope that it will be useful,
+# but is provided AS-IS, WITHOUT ANY WARRANTY; including without
+# the implied warranty of MERCHANTABILITY, NON-INFRINGEMENT or
+# FITNESS FOR A PARTICULAR PURPOSE. See the Mozilla Public
+# License for more details.
+#
+# See www.openkinetic.org for more project information
+#
+
+import collections
+import logging
+import math
+import time
+import uuid
+import eventlet
+
+import bulk
+import common
+from cluster import Cluster
+from cluster import DEFAULT_PAGE_SIZE
+from cluster import DEFAULT_VNODES
+
+LOG = logging.getLogger(__name__)
+
+DEFAULT_REPLICAS = 3
+REPAIR_RETRIES = 3
+REPAIR_BACKOFF = 0.1 # seconds, doubled on every retry
+LATENCY_DECAY = 0.2
+FAILURE_PENALTY = 1.0 # seconds, latency sample for a replica that failed
+DEFAULT_HEDGE_PERCENTILE = 0.95
+DEFAULT_HEDGE_DELAY = 0.05 # seconds, until a drive has enough samples
+MIN_HEDGE_DELAY = 0.001 # seconds
+
+
+_UNKNOWN = object()
+
+
+def _call(client, method, *args, **kwargs):
+    f = common.Future()
+    try:
+        getattr(client, method)(f.set_result, f.set_exception, *args, **kwargs)
+    except Exception as e:
+        f.set_exception(e)
+    return f
+
+
+class LatencyHistogram(object):
+    """
+    Latency distribution in logarithmic buckets. Counts are halved every
+    window samples so the distribution follows changes in the device.
+    """
+
+    BASE = 0.00005 # seconds, upper bound of the first bucket
+    GROWTH = 1.25
+    BUCKETS = 64
+    MIN_SAMPLES = 20
+
+    def __init__(self, window=1000):
+        self.window = window
+        self.count = 0
+        self._counts = [0] * self.BUCKETS
+        self._since_decay = 0
+
+    def _bucket(self, seconds):
+        if seconds <= self.BASE:
+            return 0
+        return min(self.BUCKETS - 1, int(math.ceil(math.log(seconds / self.BASE, self.GROWTH))))
+
+    def add(self, seconds):
+        self._counts[self._bucket(seconds)] += 1
+        self.count += 1
+        self._since_decay += 1
+        if self._since_decay >= self.window:
+            self._since_decay = 0
+            self._counts = [c // 2 for c in self._counts]
+            self.count = sum(self._counts)
+
+    def percentile(self, p):
+        """
+        Returns the latency (upper bound of its bucket) below which p of the
+        samples are, None without enough samples.
+        """
+        if self.count < self.MIN_SAMPLES:
+            return None
+        target = p * self.count
+        seen = 0
+        for i, c in enumerate(self._counts):
+            seen += c
+            if seen >= target:
+                return self.BASE * self.GROWTH ** i
+        return self.BASE * self.GROWTH ** (self.BUCKETS - 1)
+
+
+class ReplicatedCluster(Cluster):
+    """
+    :class:`~cluster.Cluster` keeping every key on several devices.
+
+    A key is stored on the first replicas devices of its preference list
+    (see :func:`~cluster.HashRing.preferenceList`). Puts and deletes are sent
+    to all of them at once and complete as soon as write_quorum devices
+    acknowledge; replicas that fail, even after that, are repaired in the
+    background. Every put gets a new_version (a random one if not given), so
+    all replicas of a write share its dbVersion.
+
+    Reads go to the replica with the lowest recent latency. A read that has
+    not completed after the hedge_percentile latency of that drive is sent
+    to the next replica too (a hedge), the first answer is used. With
+    consistent=True the dbVersion of the other replicas is checked too: the
+    version held by a majority of replicas is returned and the replicas
+    that disagree are repaired. Without a majority a
+    :class:`~common.ReplicaConflictException` is raised.
+
+    Repairs are conditional: they only replace the version the replica
+    held when it was found stale, so they never undo a newer write.
+    A conditional write (version given) is not atomic across replicas: if
+    it fails for lack of quorum, the replicas that accepted it keep the new
+    version and are not rolled back.
+
+    Counters: reads, hedges, hedge_wins (hedges answering first), repairs,
+    repair_failures and conflicts.
+    """
+
+    # clientFor only names the primary replica, requests must go through
+    # the cluster
+    routable = False
+
+    def __init__(self, drives=(), replicas=DEFAULT_REPLICAS, write_quorum=None,
+                 vnodes=DEFAULT_VNODES, hedge_percentile=DEFAULT_HEDGE_PERCENTILE,
+                 hedge_delay=DEFAULT_HEDGE_DELAY, **kwargs):
+        """
+        Args:
+            drives: see :class:`~cluster.Cluster`.
+            replicas: copies of every key.
+            write_quorum: acknowledgements a write waits for, a majority of
+                replicas by default.
+            vnodes: see :class:`~cluster.Cluster`.
+            hedge_percentile: percentile of a drive's latency after which
+                reads are hedged, None to disable hedging.
+            hedge_delay: seconds before hedging while a drive has not been
+                measured enough.
+            kwargs: passed to every :class:`~greenclient.Client`.
+        """
+        super(ReplicatedCluster, self).__init__(drives, vnodes, **kwargs)
+        self.replicas = replicas
+        self.write_quorum = write_quorum or replicas // 2 + 1
+        self.hedge_percentile = hedge_percentile
+        self.hedge_delay = hedge_delay
+        self.latency = {}
+        self.histograms = collections.defaultdict(LatencyHistogram)
+        self.reads = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.repairs = 0
+        self.repair_failures = 0
+        self.conflicts = 0
+
+    def replicasFor(self, key):
+        """
+        Returns the names of the drives holding key.
+        """
+        return self.ring.preferenceList(key, self.replicas)
+
+    def _fastest(self, names):
+        # replicas never measured go first so every replica gets measured
+        return sorted(names, key=lambda n: self.latency.get(n, 0))
+
+    def _send(self, name, method, *args, **kwargs):
+        start = time.time()
+        f = _call(self.clients[name], method, *args, **kwargs)
+
+        def measured(f):
+            e = f.exception()
+            if e is None or isinstance(e, common.KineticMessageException):
+                sample = time.time() - start # the device answered
+                self.histograms[name].add(sample)
+            else:
+                sample = FAILURE_PENALTY
+            previous = self.latency.get(name)
+            if previous is None:
+                self.latency[name] = sample
+            else:
+                self.latency[name] = previous + LATENCY_DECAY * (sample - previous)
+
+        f.add_done_callback(measured)
+        return f
+
+    def _wait(self, method, *args, **kwargs):
+        f = common.Future()
+        method(f.set_result, f.set_exception, *args, **kwargs)
+        return f.result()
+
+    ### writes ###
+
+    def _replicate(self, method, key, args, kwargs, repair_kwargs):
+        """
+        Sends the write to every replica, returns a future that completes
+        with the results of the first write_quorum replicas acknowledging.
+        args can also be a function returning the arguments of each replica.
+        """
+        argsFor = args if callable(args) else lambda name: args
+        names = self.replicasFor(key)
+        quorum = min(self.write_quorum, len(names))
+        done = common.Future()
+        acks = []
+        failed = []
+
+        def replied(name, f):
+            e = f.exception()
+            if e is None:
+                acks.append(f.result())
+                if len(acks) == quorum:
+                    done.set_result(list(acks))
+            else:
+                LOG.debug("Write of {0} to {1} failed. {2}".format(repr(key), name, e))
+                failed.append(name)
+                if len(names) - len(failed) == quorum - 1:
+                    done.set_exception(e)
+            if len(acks) + len(failed) == len(names) and len(acks) >= quorum:
+                for n in failed:
+                    self._repair(n, method, key, argsFor(n), repair_kwargs)
+
+        for name in names:
+            self._send(name, method, key, *argsFor(name), **kwargs).add_done_callback(
+                lambda f, name=name: replied(name, f))
+        return done
+
+    def _repair(self, name, method, key, args, kwargs, expected=_UNKNOWN):
+        """
+        Writes the replica name again, only over the version expected (read
+        from the replica if not known). The repair is dropped if another
+        write changed the replica meanwhile.
+        """
+        self.repairs += 1
+        self._repairAttempt(name, method, key, args, kwargs, expected, 0)
+
+    def _repairAttempt(self, name, method, key, args, kwargs, expected, attempt):
+        client = self.clients.get(name)
+        if client is None:
+            return # removed meanwhile
+
+        def retry(e):
+            if attempt + 1 < REPAIR_RETRIES:
+                eventlet.spawn_after(REPAIR_BACKOFF * 2 ** attempt, self._repairAttempt,
+                                     name, method, key, args, kwargs, expected, attempt + 1)
+            else:
+                self.repair_failures += 1
+                LOG.warn("Giving up repairing {0} on {1}. {2}".format(repr(key), name, e))
+
+        def repaired(f):
+            e = f.exception()
+            if e is None:
+                return
+            if isinstance(e, common.KineticMessageException) and e.code == 'VERSION_MISMATCH':
+                LOG.debug("Dropped repair of {0} on {1}, written meanwhile.".format(repr(key), name))
+                return
+            retry(e)
+
+        def read(f):
+            if f.exception() is not None:
+                retry(f.exception())
+            else:
+                self._repairAttempt(name, method, key, args, kwargs, f.result(), attempt)
+
+        if expected is _UNKNOWN:
+            _call(client, 'getVersionAsync', key).add_done_callback(read)
+        elif method == 'deleteAsync' and expected is None:
+            return # already gone
+        elif method == 'putAsync' and expected == kwargs.get('new_version'):
+            return # already written
+        else:
+            _call(client, method, key, *args, **dict(kwargs, version=expected or '')) \
+                .add_done_callback(repaired)
+
+    def putAsync(self, onSuccess, onError, key, data, version='', new_version=None, **kwargs):
+        new_version = new_version or uuid.uuid4().hex
+        # repairs are conditional even when the write is not
+        repair_kwargs = dict(kwargs, new_version=new_version)
+        repair_kwargs.pop('force', None)
+        kwargs = dict(kwargs, version=version, new_version=new_version)
+
+        def written(f):
+            if f.exception():
+                onError(f.exception())
+            else:
+                onSuccess(None)
+
+        self._replicate('putAsync', key, (data,), kwargs, repair_kwargs).add_done_callback(written)
+
+    def deleteAsync(self, onSuccess, onError, key, version='', **kwargs):
+        repair_kwargs = dict(kwargs)
+        repair_kwargs.pop('force', None)
+        kwargs = dict(kwargs, version=version)
+
+        def deleted(f):
+            if f.exception():
+                onError(f.exception())
+            else:
+                onSuccess(any(f.result()))
+
+        self._replicate('deleteAsync', key, (), kwargs, repair_kwargs).add_done_callback(deleted)
+
+    def put(self, key, *args, **kwargs):
+        return self._wait(self.putAsync, key, *args, **kwargs)
+
+    def delete(self, key, *args, **kwargs):
+        return self._wait(self.deleteAsync, key, *args, **kwargs)
+
+    ### reads ###
+
+    @property
+    def hedge_rate(self):
+        return self.hedges / float(self.reads) if self.reads else 0.0
+
+    def _hedgeDelay(self, name):
+        delay = self.histograms[name].percentile(self.hedge_percentile)
+        return max(MIN_HEDGE_DELAY, delay if delay is not None else self.hedge_delay)
+
+    def _first(self, names, method, key, onSuccess, onError, hedge=True):
+        """
+        Reads from the first replica, moving on to the next one if it fails.
+        If hedging, the next replica is also asked once the first one takes
+        longer than usual, and the first answer wins.
+        """
+        remaining = list(names)
+        state = {'done': False, 'outstanding': 0, 'timer': None}
+
+        def cancel():
+            if state['timer']:
+                state['timer'].cancel()
+                state['timer'] = None
+
+        def replied(f, hedged):
+            state['outstanding'] -= 1
+            if state['done']:
+                return # lost the race
+            e = f.exception()
+            if e is None:
+                state['done'] = True
+                cancel()
+                if hedged:
+                    self.hedge_wins += 1
+                onSuccess(f.result())
+            elif remaining:
+                cancel()
+                send(hedged=False)
+            elif state['outstanding'] == 0:
+                state['done'] = True
+                onError(e)
+
+        def expired():
+            state['timer'] = None
+            if not state['done'] and remaining:
+                self.hedges += 1
+                send(hedged=True)
+
+        def send(hedged):
+            name = remaining.pop(0)
+            state['outstanding'] += 1
+            if hedge and remaining and not hedged and self.hedge_percentile:
+                state['timer'] = eventlet.spawn_after(self._hedgeDelay(name), expired)
+            self._send(name, method, key).add_done_callback(
+                lambda f: replied(f, hedged))
+
+        self.reads += 1
+        send(hedged=False)
+
+    def getAsync(self, onSuccess, onError, key, consistent=False):
+        names = self._fastest(self.replicasFor(key))
+        if not consistent:
+            self._first(names, 'getAsync', key, onSuccess, onError)
+            return
+
+        futures = collections.OrderedDict()
+        for n in names:
+            futures[n] = self._send(n, 'getAsync' if not futures else 'getVersionAsync', key)
+        common.Future.all(futures.values()).add_done_callback(
+            lambda _: self._resolve(key, futures, onSuccess, onError))
+
+    def _resolve(self, key, futures, onSuccess, onError):
+        first = futures.keys()[0]
+        versions = {}
+        for n, f in futures.items():
+            if f.exception() is None:
+                r = f.result()
+                if n == first:
+                    r = r.metadata.version if r is not None else None
+                versions[n] = r
+        if not versions:
+            onError(futures[first].exception())
+            return
+
+        version, votes = collections.Counter(versions.values()).most_common(1)[0]
+        if votes * 2 <= len(futures):
+            self.conflicts += 1
+            onError(common.ReplicaConflictException(key, versions))
+            return
+
+        stale = [n for n, v in versions.items() if v != version]
+        if stale:
+            self.conflicts += 1
+
+        def repair(entry):
+            # only if the replica still holds the version just read
+            for n in stale:
+                if entry is None:
+                    self._repair(n, 'deleteAsync', key, (), {}, versions[n])
+                else:
+                    self._repair(n, 'putAsync', key, (entry.value,),
+                                 {'new_version': version}, versions[n])
+            onSuccess(entry)
+
+        if first in versions and versions[first] == version:
+            repair(futures[first].result())
+        elif version is None:
+            repair(None)
+        else:
+            holders = [n for n, v in versions.items() if v == version]
+            self._first(self._fastest(holders), 'getAsync', key, repair, onError, hedge=False)
+
+    def getMetadataAsync(self, onSuccess, onError, key):
+        self._first(self._fastest(self.replicasFor(key)), 'getMetadataAsync', key, onSuccess, onError)
+
+    def getVersionAsync(self, onSuccess, onError, key):
+        self._first(self._fastest(self.replicasFor(key)), 'getVersionAsync', key, onSuccess, onError)
+
+    def get(self, key, consistent=False):
+        return self._wait(self.getAsync, key, consistent=consistent)
+
+    def getMetadata(self, key):
+        return self._wait(self.getMetadataAsync, key)
+
+    def getVersion(self, key):
+        return self._wait(self.getVersionAsync, key)
+
+    ### multi key operations ###
+
+    def getMany(self, keys, **kwargs):
+        return bulk.getMany([self], keys, **kwargs)
+
+    def putMany(self, items, **kwargs):
+        return bulk.putMany([self], items, **kwargs)
+
+    def deleteMany(self, keys, **kwargs):
+        return bulk.deleteMany([self], keys, **kwargs)
+
+    def versionMany(self, keys, **kwargs):
+        return bulk.versionMany([self], keys, **kwargs)
+
+    ### range operations ###
+
+    def getRange(self, startKey, endKey, startKeyInclusive=True, endKeyInclusive=True,
+                 prefetch=64):
+        """
+        Iterates the entries in the range in key order, each read from its
+        fastest replica.
+        """
+        while True:
+            keys = self.getKeyRange(startKey, endKey, startKeyInclusive,
+                                    endKeyInclusive, prefetch)
+            for k in keys:
+                e = self.get(k)
+                if e is not None: # deleted meanwhile
+                    yield e
+            if len(keys) < prefetch:
+                return
+            startKey, startKeyInclusive = keys[-1], False
+
+    def rebalance(self, startKey=None, endKey=None, page_size=DEFAULT_PAGE_SIZE):
+        """
+        Copies the keys in the range to the replicas missing them and removes
+        them from the devices that are no longer replicas, keeping their
+        versions. Returns the number of copies and removals done.
+        """
+        changes = 0
+        for name, c in self.clients.items():
+            start, inclusive = startKey, True
+            while True:
+                keys = c.getKeyRange(start, endKey, inclusive, True, page_size)
+                for k in keys:
+                    changes += self._place(k, name, c)
+                if len(keys) < page_size:
+                    break
+                start, inclusive = keys[-1], False
+        return changes
+
+    def _place(self, key, name, source):
+        owners = self.replicasFor(key)
+        entry = source.get(key)
+        if entry is None:
+            return 0 # deleted meanwhile
+        version = entry.metadata.version or ''
+        changes = 0
+        for o in owners:
+            if o == name or self.clients[o].getVersion(key) is not None:
+                continue
+            try:
+                # only creates it, a write since the membership change wins
+                self.clients[o].put(key, entry.value, version='', new_version=version)
+            except common.KineticMessageException as e:
+                if e.code != 'VERSION_MISMATCH':
+                    raise
+                LOG.debug("Not copying {0} to {1}, written meanwhile.".format(repr(key), o))
+                continue
+            changes += 1
+        if name not in owners:
+            try:
+                source.delete(key, version=version)
+            except common.KineticMessageException as e:
+                if e.code != 'VERSION_MISMATCH':
+                    raise
+                LOG.warn("Not removing {0} from {1}, written meanwhile.".format(repr(key), name))
+                return changes
+            changes += 1
+        return changes
@@ -0,0 +1,254 @@
+# Copyright 2013-2015 Seagate Technology LLC.
+#
+# This Source Code Form is subject to the terms of the Mozilla
+# Public License, v. 2.0. If a copy of the MPL was not
+# distributed with this file, You can obtain one at
+# https://mozilla.org/MP:/2.0/.
+#
+# This program is distributed in the hope that it will be useful,
+# but is provided AS-IS, WITHOUT ANY WARRANTY; including without
+# the implied warranty of MERCHANTABILITY, NON-INFRINGEMENT or
+# FITNESS FOR A PARTICULAR PURPOSE. See the Mozilla Public
+# License for more details.
+#
+# See www.openkinetic.org for more project information
+#
+
+# Value storage shared by every process on a host.
+#
+# The file is divided into slab classes of fixed size slots. An entry goes to
+# the smallest class it fits in, at the slot its key hashes to (so a slot
+# holds at most one entry and a new entry evicts whatever was there).
+#
+#   file header  | class 0 slots | class 1 slots | ...
+#
+#   slot: sequence | key length | value length | version length | tag length
+#         | algorithm | timestamp | key | version | tag | value
+#
+# Writers serialize on a byte range lock of the slot (and an in-process lock,
+# since byte range locks do not exclude the threads of one process) and bump
+# its sequence before and after changing it (odd while being written).
+# Readers take no lock, they copy the slot and retry if the sequence moved
+# meanwhile.
+
+import fcntl
+import logging
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import zlib
+
+from common import Entry
+from common import EntryMetadata
+import common
+
+LOG = logging.getLogger(__name__)
+
+DEFAULT_MAX_BYTES = 64*1024*1024
+DEFAULT_SLOT_SIZES = (4*1024, 64*1024, common.MAX_VALUE_SIZE + 2*common.MAX_KEY_SIZE)
+READ_RETRIES = 3
+
+_MAGIC = 'KSMC'
+_FORMAT = 1
+_HEADER = struct.Struct('>4sHH')
+_CLASS = struct.Struct('>II')
+_HEADER_SIZE = mmap.PAGESIZE
+_SLOT = struct.Struct('>IHIHHid')
+_NO_ALGORITHM = -1
+
+
+def _default_path():
+    base = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+    return os.path.join(base, 'kinetic-cache-%d' % os.getuid())
+
+
+def namespaceOf(client):
+    """
+    Returns the namespace of the device of client: its address (or socket
+    path) and cluster version.
+    """
+    return '{0}@{1}/'.format(client, client.cluster_version or 0)
+
+
+class SharedMemoryStore(object):
+    """
+    Storage for :class:`~cache.ReadCache` in a memory mapped file, so all
+    the processes on a host using the same path share one cache.
+
+    Entries are validated by version and tag like with the default store,
+    so a process reading an entry another one cached still gets the current
+    value. Each device sharing the file has its own namespace.
+    """
+
+    def __init__(self, namespace, path=None, max_bytes=DEFAULT_MAX_BYTES,
+                 slot_sizes=DEFAULT_SLOT_SIZES):
+        """
+        Args:
+            namespace: prefix separating the keys of different devices, or
+                a client whose device the entries come from (see
+                :func:`namespaceOf`).
+            path: file backing the cache, created if it does not exist.
+            max_bytes: size of the slots when creating the file, split
+                evenly among the slab classes.
+            slot_sizes: bytes per slot of each slab class when creating
+                the file. An existing file keeps its own geometry.
+        """
+        if not isinstance(namespace, basestring):
+            namespace = namespaceOf(namespace)
+        self.path = path or _default_path()
+        self.namespace = namespace
+        self._locks = {} # slot -> lock of the threads of this process
+        self.hits = 0
+        self.misses = 0
+        self.collisions = 0
+
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0600)
+        try:
+            fcntl.lockf(fd, fcntl.LOCK_EX)
+            try:
+                if os.fstat(fd).st_size == 0:
+                    self._create(fd, max_bytes, sorted(slot_sizes))
+                self._mm = mmap.mmap(fd, 0)
+            finally:
+                fcntl.lockf(fd, fcntl.LOCK_UN)
+        except:
+            os.close(fd)
+            raise
+        self._fd = fd
+        self._load()
+
+    def _create(self, fd, max_bytes, slot_sizes):
+        if len(slot_sizes) * _CLASS.size + _HEADER.size > _HEADER_SIZE:
+            raise ValueError("Too many slab classes.")
+        per_class = max_bytes // len(slot_sizes)
+        classes = [(size, max(1, per_class // size)) for size in slot_sizes]
+        header = _HEADER.pack(_MAGIC, _FORMAT, len(classes))
+        header += ''.join(_CLASS.pack(*c) for c in classes)
+        os.ftruncate(fd, _HEADER_SIZE + sum(size * count for size, count in classes))
+        os.write(fd, header)
+
+    def _load(self):
+        magic, version, n = _HEADER.unpack_from(self._mm, 0)
+        if magic != _MAGIC or version != _FORMAT:
+            raise ValueError("{0} is not a shared cache file.".format(self.path))
+        self.classes = []
+        offset = _HEADER_SIZE
+        for i in xrange(n):
+            size, count = _CLASS.unpack_from(self._mm, _HEADER.size + i * _CLASS.size)
+            self.classes.append((offset, size, count))
+            offset += size * count
+
+    def _slot(self, cls, name):
+        offset, size, count = cls
+        return offset + (zlib.crc32(name) & 0xffffffff) % count * size
+
+    def _read(self, slot, name):
+        """
+        Returns (version, tag, algorithm, timestamp, value) stored in the
+        slot for name, None if it holds something else.
+        """
+        mm = self._mm
+        for _ in xrange(READ_RETRIES):
+            seq, klen, vlen, verlen, taglen, algorithm, timestamp = _SLOT.unpack_from(mm, slot)
+            if seq & 1:
+                continue # being written
+            if klen != len(name):
+                return None
+            start = slot + _SLOT.size
+            if mm[start:start + klen] != name:
+                return None
+            start += klen
+            version = mm[start:start + verlen]
+            start += verlen
+            tag = mm[start:start + taglen]
+            start += taglen
+            value = mm[start:start + vlen]
+            if struct.unpack_from('>I', mm, slot)[0] == seq:
+                return version, tag, algorithm, timestamp, value
+        return None
+
+    def _write(self, slot, fields, payload):
+        with self._locks.setdefault(slot, threading.Lock()):
+            self._writeLocked(slot, fields, payload)
+
+    def _writeLocked(self, slot, fields, payload):
+        fcntl.lockf(self._fd, fcntl.LOCK_EX, 4, slot)
+        try:
+            seq = struct.unpack_from('>I', self._mm, slot)[0]
+            # odd while the slot is inconsistent
+            struct.pack_into('>I', self._mm, slot, (seq + 1) & 0xffffffff)
+            if payload:
+                start = slot + _SLOT.size
+                self._mm[start:start + len(payload)] = payload
+            _SLOT.pack_into(self._mm, slot, (seq + 1) & 0xffffffff, *fields)
+            struct.pack_into('>I', self._mm, slot, (seq + 2) & 0xffffffff)
+        finally:
+            fcntl.lockf(self._fd, fcntl.LOCK_UN, 4, slot)
+
+    def lookup(self, key):
+        """
+        Returns (entry, timestamp) or None if the key is not stored.
+        """
+        name = self.namespace + key
+        for cls in self.classes:
+            item = self._read(self._slot(cls, name), name)
+            if item:
+                version, tag, algorithm, timestamp, value = item
+                if algorithm == _NO_ALGORITHM:
+                    algorithm = None
+                self.hits += 1
+                return Entry(key, value, EntryMetadata(version, tag, algorithm)), timestamp
+        self.misses += 1
+        return None
+
+    def store(self, key, entry, timestamp):
+        name = self.namespace + key
+        m = entry.metadata
+        version = m.version or ''
+        tag = m.tag or ''
+        value = str(entry.value)
+        n = _SLOT.size + len(name) + len(version) + len(tag) + len(value)
+        target = None
+        for cls in self.classes:
+            if target is None and n <= cls[1]:
+                target = cls
+            else:
+                # do not leave an older copy behind in another class
+                self._clear(self._slot(cls, name), name)
+        if target is None:
+            return
+        slot = self._slot(target, name)
+        if _SLOT.unpack_from(self._mm, slot)[1] and self._read(slot, name) is None:
+            self.collisions += 1 # evicts another key
+        algorithm = _NO_ALGORITHM if m.algorithm is None else m.algorithm
+        self._write(slot, (len(name), len(value), len(version), len(tag), algorithm, timestamp),
+                    name + version + tag + value)
+
+    def _clear(self, slot, name):
+        if self._read(slot, name) is not None:
+            self._write(slot, (0, 0, 0, 0, _NO_ALGORITHM, 0), None)
+
+    def invalidate(self, key):
+        name = self.namespace + key
+        for cls in self.classes:
+            self._clear(self._slot(cls, name), name)
+
+    def clear(self):
+        """
+        Empties the whole file, including the entries of other namespaces.
+        """
+        for offset, size, count in self.classes:
+            for slot in xrange(offset, offset + size * count, size):
+                if _SLOT.unpack_from(self._mm, slot)[1]:
+                    self._write(slot, (0, 0, 0, 0, _NO_ALGORITHM, 0), None)
+
+    def close(self):
+        self._mm.close()
+        os.close(self._fd)
+
+    def __len__(self):
+        return sum(1 for offset, size, count in self.classes
+                     for slot in xrange(offset, offset + size * count, size)
+                     if _SLOT.unpack_from(self._mm, slot)[1])
@@ -0,0 +1,119 @@
+# Copyright 2013-2015 Seagate Technology LLC.
+#
+# This Source Code Form is subject to the terms of the Mozilla
+# Public License, v. 2.0. If a copy of the MPL was not
+# distributed with this file, You can obtain one at
+# https://mozilla.org/MP:/2.0/.
+#
+# This program is distributed in the hope that it will be useful,
+# but is provided AS-IS, WITHOUT ANY WARRANTY; including without
+# the implied warranty of MERCHANTABILITY, NON-INFRINGEMENT or
+# FITNESS FOR A PARTICULAR PURPOSE. See the Mozilla Public
+# License for more details.
+#
+# See www.openkinetic.org for more project information
+#
+
+import errno
+import hashlib
+import mmap
+import os
+
+import common
+
+
+def _map(fd, offset, length):
+    # maps must start on a page boundary, returns the map and where the
+    # range starts in it
+    start = offset - offset % mmap.ALLOCATIONGRANULARITY
+    m = mmap.mmap(fd, length + offset - start, mmap.MAP_SHARED, mmap.PROT_READ, offset=start)
+    return m, offset - start
+
+
+def file_digest(fd, offset, length):
+    """
+    Returns the SHA1 of length bytes of the file fd at offset, hashed over
+    a memory map of the range so the data is never copied into Python.
+    hashlib releases the GIL meanwhile, letting other threads run.
+    """
+    h = hashlib.sha1()
+    if length == 0:
+        return h.digest()
+    m, start = _map(fd, offset, length)
+    try:
+        h.update(buffer(m, start, length))
+    finally:
+        m.close()
+    return h.digest()
+
+
+def file_chunks(fd, offset, length, chunk_size=common.DEFAULT_CHUNK_SIZE):
+    """
+    Yields length bytes of the file fd at offset in chunk_size pieces, read
+    through a memory map so readers sharing fd do not move its position.
+    """
+    if length == 0:
+        return
+    m, start = _map(fd, offset, length)
+    try:
+        for i in xrange(start, start + length, chunk_size):
+            yield m[i:min(i + chunk_size, start + length)]
+    finally:
+        m.close()
+
+
+class StreamValue(object):
+    """
+    Value of length bytes read once from source while it is sent, source
+    being an iterable of strings (i.e. a generator) or a file like object.
+
+    Chunks are hashed as they go out and digest is the SHA1 of the value
+    once sent. The tag travels before the value, so the device gets the
+    tag given to the put ('l337' by default), digest is for the caller to
+    check or record. A source not matching length faults the connection,
+    since the device is still waiting for the value.
+    """
+
+    def __init__(self, source, length, chunk_size=common.DEFAULT_CHUNK_SIZE):
+        self.source = source
+        self.length = length
+        self.chunk_size = chunk_size
+        self.digest = None
+
+    def __len__(self): return self.length
+
+    def _chunks(self):
+        if hasattr(self.source, 'read'):
+            left = self.length
+            while left:
+                data = self.source.read(min(left, self.chunk_size))
+                if not data:
+                    return
+                left -= len(data)
+                yield data
+        else:
+            for data in self.source:
+                yield data
+
+    def send(self, socket):
+        h = hashlib.sha1()
+        sent = 0
+        for data in self._chunks():
+            sent += len(data)
+            if sent > self.length:
+                raise IOError(errno.EMSGSIZE, "Source longer than {0} bytes".format(self.length))
+            h.update(data)
+            socket.sendall(data)
+        if sent < self.length:
+            raise IOError(errno.EPIPE, "Source ended after {0} of {1} bytes".format(sent, self.length))
+        self.digest = h.digest()
+
+    def read(self):
+        """
+        Returns the value read into memory, consuming the source.
+        """
+        data = ''.join(self._chunks())
+        if len(data) != self.length:
+            raise IOError(errno.EPIPE, "Source gave {0} of {1} bytes".format(len(data), self.length))
+        self.digest = hashlib.sha1(data).digest()
+        return data
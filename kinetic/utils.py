@@ -19,10 +19,32 @@
 import struct
 
 from common import KeyRange
+from common import MAX_KEY_SIZE
+
+# greater than any key the device accepts
+LAST_KEY = '\xff' * MAX_KEY_SIZE
+
+def prefixEnd(prefix):
+    """
+    Returns the first key after every key starting with prefix, None if
+    there is none (prefix is empty or all 0xFF bytes).
+    """
+    key = prefix.rstrip('\xff')
+    if not key:
+        return None
+    return key[:-1] + chr(ord(key[-1]) + 1)
+
+def successor(key):
+    """
+    Returns the first key after key.
+    """
+    return key + '\x00'
 
 def buildRange(key):
-    import array
-    inBytes = map(ord,key)
-    inBytes[len(inBytes)-1] = inBytes[len(inBytes)-1]+1
-    keyPlus1 = array.array('B', inBytes).tostring()
-    return KeyRange(key, keyPlus1, True, False)
+    """
+    Returns the :class:`~common.KeyRange` of the keys starting with key.
+    """
+    end = prefixEnd(key)
+    if end is None:
+        return KeyRange(key, LAST_KEY, True, True)
+    return KeyRange(key, end, True, False)
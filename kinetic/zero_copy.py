@@ -17,21 +17,30 @@
 #@author: Ignacio Corderi
 
 
-import traceback
+import collections
+import errno
+import fcntl
 import logging
+import mmap
 import os
-import select
-import fcntl
-import errno
-import os.path
-import socket
-import subprocess
+import threading
 import ctypes
 import ctypes.util
+import eventlet
+from eventlet import tpool
 from eventlet.green import select as green_select
 
+import common
+import streaming
+
 LOG = logging.getLogger(__name__)
 
+MAX_POOLED_PIPES = 16
+# ranges hashed in eventlet's thread pool instead of blocking the hub
+THREADED_DIGEST_SIZE = 64*1024
+# values hashed ahead at once by prehash
+DIGEST_LOOKAHEAD = 4
+
 
 def set_nonblock(fd): #pylint: disable-msg=C0103
     '''Set a file descriptor in non-blocking mode'''
@@ -41,183 +50,134 @@ def set_nonblock(fd): #pylint: disable-msg=C0103
     fcntl.fcntl(fd, fcntl.F_SETFL, flags)
 
 
-def direct_transfer_select(fd_in, off_in, fd_out, off_out, length):
-    LOG.debug("Transfering %s bytes from %s to %s" % (length, fd_in, fd_out))
-    (pipe_r, pipe_w) = os.pipe()
-    pipe_r = os.fdopen(pipe_r)
-    pipe_w = os.fdopen(pipe_w,'w')
-    fd_pipe_r = pipe_r.fileno()
-    fd_pipe_w = pipe_w.fileno()
-
-    LOG.debug("  source(%s) -> pipe(%s, %s) -> dest(%s)" % (fd_in, fd_pipe_w, fd_pipe_r, fd_out))
-
-    set_nonblock(fd_in)
-    set_nonblock(fd_out)
-    set_nonblock(fd_pipe_r)
-    set_nonblock(fd_pipe_w)
-
-    flags = SPLICE_F_MOVE | SPLICE_F_MORE | SPLICE_F_NONBLOCK
+def _fileno(f):
+    return f if isinstance(f, (int, long)) else f.fileno()
 
-    epoll = select.epoll() # TODO: find a proper way to check if the fd's are files
-    fd_in_is_file = False
-    fd_out_is_file = False
 
-    try:
-        epoll.register(fd_in, select.EPOLLIN)
-    except:
-        fd_in_is_file = True
-
-    try:
-        epoll.register(fd_out, select.EPOLLOUT)
-    except:
-        fd_out_is_file = True
-
-    if fd_in_is_file:
-        readers = [fd_pipe_r]
-    else:
-        readers = [fd_in, fd_pipe_r]
-
-    if fd_out_is_file:
-        writers = [fd_pipe_w]
+def _wait(fd, write):
+    # sockets may be non-blocking (i.e. green sockets), files never are
+    if write:
+        green_select.select([], [fd], [])
     else:
-        writers = [fd_pipe_w, fd_out]
-
+        green_select.select([fd], [], [])
+
+
+class PipePool(object):
+    """
+    Non-blocking pipes reused by splice transfers, so a transfer does not
+    pay for creating (and closing) a pipe. Pipes are only returned empty,
+    a transfer that fails closes its pipe.
+    """
+
+    def __init__(self, max_size=MAX_POOLED_PIPES):
+        self.max_size = max_size
+        self.created = 0
+        self._pipes = collections.deque()
+        self._lock = threading.Lock()
+
+    def get(self):
+        with self._lock:
+            if self._pipes:
+                return self._pipes.pop()
+            self.created += 1
+        r, w = os.pipe()
+        set_nonblock(r)
+        set_nonblock(w)
+        return r, w
+
+    def put(self, pipe):
+        with self._lock:
+            if len(self._pipes) < self.max_size:
+                self._pipes.append(pipe)
+                return
+        self.discard(pipe)
+
+    def discard(self, pipe):
+        for fd in pipe:
+            os.close(fd)
+
+    def clear(self):
+        with self._lock:
+            pipes, self._pipes = list(self._pipes), collections.deque()
+        for p in pipes:
+            self.discard(p)
+
+    def __len__(self):
+        return len(self._pipes)
+
+
+pipes = PipePool()
+
+
+def direct_transfer(fd_in, off_in, fd_out, off_out, length):
+    """
+    Moves length bytes from fd_in to fd_out with splice(2) through a pooled
+    pipe. Offsets are only valid for files, None reads or writes at the
+    current position (sockets and pipes).
+    """
+    if LOG.isEnabledFor(logging.DEBUG):
+        LOG.debug("Transfering %s bytes from %s to %s" % (length, fd_in, fd_out))
+    pipe = pipes.get()
+    pipe_r, pipe_w = pipe
+    flags = SPLICE_F_MOVE | SPLICE_F_MORE | SPLICE_F_NONBLOCK
+    done = 0
     try:
-        towrite0 = length
-        towrite1 = length
-
-        ready = []
-
-        while towrite0 > 0 or towrite1 > 0:
-            readable_set, writable_set, _ = green_select.select(readers, writers, [])
-
-            for x in readable_set:
-                ready.append(x)
-                readers.remove(x)
-
-            for x in writable_set:
-                ready.append(x)
-                writers.remove(x)
-
-            # two transfer options
-            if (fd_in_is_file or fd_in in ready) and (fd_pipe_w in ready):
-
-                # transfer from source to pipe
-                try:
-                    done = splice.splice(fd_in, None, fd_pipe_w, None, towrite0, flags)
-                    LOG.debug('> Source -> pipe %s bytes' % done)
-                    towrite0 -= done
-                except IOError as ioex:
-                    if ioex.errno in [errno.EAGAIN, errno.EWOULDBLOCK]: continue
-                    else: raise
-
-                # reset
-                if not fd_in_is_file:
-                    ready.remove(fd_in)
-                    readers.append(fd_in)
-
-                ready.remove(fd_pipe_w)
-                writers.append(fd_pipe_w)
-
-            if (fd_pipe_r in ready) and (fd_out_is_file or fd_out in ready):
-
-                # transfer from pipe to destination
+        while done < length:
+            # fill the (empty) pipe from the source
+            try:
+                n = splice(fd_in, None if off_in is None else off_in + done,
+                           pipe_w, None, length - done, flags)
+            except IOError as ex:
+                if ex.errno != errno.EAGAIN:
+                    raise
+                _wait(fd_in, False)
+                continue
+            if n == 0:
+                raise IOError(errno.EPIPE, "Source ended after {0} of {1} bytes".format(done, length))
+            # then drain it to the destination
+            while n:
                 try:
-                    done = splice.splice(fd_pipe_r, None, fd_out, None, towrite1, flags)
-                    LOG.debug('> pipe -> dest %s bytes' % done)
-                    towrite1 -= done
-                except IOError as ioex:
-                    if ioex.errno in [errno.EAGAIN, errno.EWOULDBLOCK]: continue
-                    else: raise
-
-                # reset
-                if not fd_out_is_file:
-                    ready.remove(fd_out)
-                    writers.append(fd_out)
-
-                ready.remove(fd_pipe_r)
-                readers.append(fd_pipe_r)
-
-    except Exception as ex:
-        traceback.print_exc()
+                    m = splice(pipe_r, None, fd_out, None if off_out is None else off_out + done,
+                               n, flags)
+                except IOError as ex:
+                    if ex.errno != errno.EAGAIN:
+                        raise
+                    _wait(fd_out, True)
+                    continue
+                n -= m
+                done += m
+    except:
+        pipes.discard(pipe) # may still hold data
         raise
+    pipes.put(pipe)
 
 
-def direct_transfer_epoll(fd_in, off_in, fd_out, off_out, length):
-    LOG.debug("Transfering %s bytes from %s to %s" % (length, fd_in, fd_out))
-    (pipe_r, pipe_w) = os.pipe()
-    pipe_r = os.fdopen(pipe_r)
-    pipe_w = os.fdopen(pipe_w,'w')
-    fd_pipe_r = pipe_r.fileno()
-    fd_pipe_w = pipe_w.fileno()
-
-    LOG.debug("  source(%s) -> pipe(%s, %s) -> dest(%s)" % (fd_in, fd_pipe_w, fd_pipe_r, fd_out))
-
-    set_nonblock(fd_in)
-    set_nonblock(fd_out)
-    set_nonblock(fd_pipe_r)
-    set_nonblock(fd_pipe_w)
-
-    flags = SPLICE_F_MOVE | SPLICE_F_MORE | SPLICE_F_NONBLOCK
-
-    try:
-        towrite0 = length
-        towrite1 = length
+# kept for backwards compatibility
+direct_transfer_select = direct_transfer
+direct_transfer_epoll = direct_transfer
 
-        epoll = select.epoll()
-        fd_in_is_file = False
-        fd_out_is_file = False
 
+def send_file(fd_in, offset, length, fd_out):
+    """
+    Sends length bytes of the file fd_in starting at offset to fd_out with
+    sendfile(2), the file position is not changed. Falls back to splice
+    when the source does not support sendfile.
+    """
+    sent = 0
+    while sent < length:
         try:
-            epoll.register(fd_in, select.EPOLLIN) # handle EPOLLHUP
-        except:
-            fd_in_is_file = True
-
-        try:
-            epoll.register(fd_out, select.EPOLLOUT) # handle EPOLLHUP
-        except:
-            fd_out_is_file = True
-
-        epoll.register(fd_pipe_r, select.EPOLLIN)
-        epoll.register(fd_pipe_w, select.EPOLLOUT)
-
-
-        while towrite0 > 0 or towrite1 > 0:
-            events = epoll.poll()
-
-            events_dict = {fd: evt for (fd, evt) in events}
-
-            # two transfer options
-            if (fd_in_is_file or fd_in in events_dict) and fd_pipe_w in events_dict:
-
-                # transfer from source to pipe
-                try:
-                    done = splice(fd_in, None, fd_pipe_w, None, towrite0, flags)
-                    LOG.debug('> Source -> pipe %s bytes' % done)
-                    towrite0 -= done
-                except IOError as ioex:
-                    if ioex.errno in [errno.EAGAIN, errno.EWOULDBLOCK]:
-                        continue
-
-            if fd_pipe_r in events_dict and (fd_out_is_file or fd_out in events_dict):
-
-                # transfer from pipe to destination
-                try:
-                    done = splice(fd_pipe_r, None, fd_out, None, towrite1, flags)
-                    LOG.debug('> pipe -> dest %s bytes' % done)
-                    towrite1 -= done
-                except IOError as ioex:
-                    if ioex.errno in [errno.EAGAIN, errno.EWOULDBLOCK]: continue
-                    else: raise
-
-        epoll.close()
-
-    except Exception as ex:
-        traceback.print_exc()
-        raise
-
-
-direct_transfer = direct_transfer_epoll
+            n = sendfile(fd_out, fd_in, offset + sent, length - sent)
+        except IOError as ex:
+            if ex.errno == errno.EAGAIN:
+                _wait(fd_out, True)
+                continue
+            if sent == 0 and ex.errno in (errno.EINVAL, errno.ENOSYS):
+                direct_transfer(fd_in, offset, fd_out, None, length)
+                return
+            raise
+        if n == 0:
+            raise IOError(errno.EPIPE, "File ended after {0} of {1} bytes".format(sent, length))
+        sent += n
 
 
 def forwardto(defered_value, target_fd):
@@ -226,18 +186,217 @@ def forwardto(defered_value, target_fd):
     defered_value.set() # signal we are done reading
 
 
-class ZeroCopyValue():
+class ZeroCopyValue(object):
+    """
+    Value sent from a file (object or descriptor) straight to the socket by
+    the kernel, without copying it into Python.
 
-    def __init__(self, fd, offset, length):
+    length defaults to the rest of the file after offset. offset None means
+    the current position of a non seekable source (i.e. a pipe), which is
+    then spliced. Over TLS the value is read and sent normally since the
+    socket encrypts in user space.
+
+    Puts are tagged with the SHA1 of the range, computed over a memory map
+    of the file when the put is built (see :func:`~streaming.file_digest`),
+    unless checksum is False or the source is not seekable. Ranges of
+    THREADED_DIGEST_SIZE bytes or more are hashed in eventlet's thread pool,
+    so other greenthreads keep running meanwhile. digest holds the SHA1 when
+    computed ahead (see :func:`prehash`).
+    """
+
+    def __init__(self, fd, offset=0, length=None, checksum=True):
         self.fd = fd
         self.offset = offset
+        if length is None:
+            length = os.fstat(_fileno(fd)).st_size - (offset or 0)
         self.length = length
+        self.checksum = checksum
+        self.digest = None
 
     def __len__(self): return self.length
 
+    def fileno(self):
+        return _fileno(self.fd)
+
+    def integrity(self):
+        """
+        Returns the (tag, algorithm) of the value, None if not computed.
+        """
+        if not self.checksum or self.offset is None:
+            return None
+        digest = self.digest
+        if digest is None and self.length >= THREADED_DIGEST_SIZE:
+            digest = tpool.execute(streaming.file_digest, self.fileno(), self.offset, self.length)
+        elif digest is None:
+            digest = streaming.file_digest(self.fileno(), self.offset, self.length)
+        return digest, common.IntegrityAlgorithms.SHA1
+
     def send(self, socket):
-        # If source is a file then offset is valid, otherwise is has to be None
-        direct_transfer(self.fd.fileno(), self.offset, socket.fileno(), None, self.length)
+        if hasattr(socket, 'cipher'):
+            self._send_buffered(socket)
+        elif self.offset is None:
+            direct_transfer(self.fileno(), None, socket.fileno(), None, self.length)
+        else:
+            send_file(self.fileno(), self.offset, self.length, socket.fileno())
+
+    def _send_buffered(self, socket):
+        for data in self._chunks():
+            socket.sendall(data)
+
+    def _chunks(self, chunk_size=64*1024):
+        fd = self.fileno()
+        if self.offset is not None:
+            for data in streaming.file_chunks(fd, self.offset, self.length, chunk_size):
+                yield data
+            return
+        left = self.length
+        while left:
+            data = os.read(fd, min(left, chunk_size))
+            if not data:
+                raise IOError(errno.EPIPE, "File ended before {0} bytes".format(self.length))
+            left -= len(data)
+            yield data
+
+    def read(self):
+        """
+        Returns the value read into memory.
+        """
+        return ''.join(self._chunks())
+
+
+def prehash(values, lookahead=DIGEST_LOOKAHEAD):
+    """
+    Yields values (:class:`ZeroCopyValue`) with their digest computed,
+    hashing up to lookahead of them at once so the pre-pass of a value runs
+    in parallel with the ones before it and with their sends.
+    """
+    pending = collections.deque()
+
+    def hashed(value):
+        integrity = value.integrity()
+        if integrity is not None:
+            value.digest = integrity[0]
+        return value
+
+    for value in values:
+        pending.append(eventlet.spawn(hashed, value))
+        if len(pending) > lookahead:
+            yield pending.popleft().wait()
+    while pending:
+        yield pending.popleft().wait()
+
+
+def make_sink(target, offset=None):
+    """
+    Returns the sink receiving a value into target, a writable buffer
+    (:class:`BufferSink`) or a file (:class:`FileSink`).
+    """
+    if not isinstance(target, (int, long)) and not hasattr(target, 'fileno'):
+        if isinstance(target, mmap.mmap):
+            return BufferSink(target, offset)
+        try:
+            view = memoryview(target)
+        except TypeError:
+            view = None
+        if view is not None:
+            return BufferSink(target, offset, view)
+    return FileSink(target, offset)
+
+
+class BufferSink(object):
+    """
+    Receives a value from the socket into a writable buffer (bytearray,
+    memoryview, mmap, uint8 numpy array...) at offset, 0 if None.
+
+    Buffers are received into directly, mmaps in chunks. If the value does
+    not fit, it is read and discarded and the get fails with ValueError.
+    """
+
+    def __init__(self, target, offset=None, view=None):
+        self.target = target
+        self.offset = offset or 0
+        if view is not None:
+            if view.readonly:
+                raise TypeError("Buffer is read only.")
+            if view.ndim != 1 or view.itemsize != 1:
+                raise TypeError("Buffer must be one dimensional bytes.")
+        self.view = view
+
+    def receive(self, client, length, chunk_size=64*1024):
+        """
+        Moves the next length bytes of client's socket to the buffer.
+        Returns length or the exception to fail the get with.
+        """
+        end = self.offset + length
+        if end > len(self.target):
+            client.skip(length)
+            return ValueError("Buffer of {0} bytes too small for {1} bytes at {2}.".format(
+                              len(self.target), length, self.offset))
+        if self.view is not None:
+            client.read_into(self.view[self.offset:end])
+        else:
+            pos = self.offset
+            while pos < end:
+                data = client.fast_read(min(end - pos, chunk_size))
+                self.target[pos:pos + len(data)] = str(data)
+                pos += len(data)
+        return length
+
+
+class FileSink(object):
+    """
+    Receives a value from the socket straight into a file (object or
+    descriptor) by the kernel, see :func:`~baseasync.BaseAsync.get_into`.
+
+    offset None writes at the current position of the target and moves
+    it past the value. Over TLS, or for targets without a descriptor (any
+    object with write), the value is read and written in chunks instead.
+    The value is taken off the socket while the response is received, so
+    failing to write it faults the connection.
+    """
+
+    def __init__(self, target, offset=None):
+        self.target = target
+        self.offset = offset
+        if isinstance(target, (int, long)) or hasattr(target, 'fileno'):
+            self.fd = _fileno(target)
+            os.fstat(self.fd) # fail on bad descriptors before sending
+        else:
+            self.fd = None
+
+    def receive(self, client, length):
+        """
+        Moves the next length bytes of client's socket to the target.
+        Returns length.
+        """
+        socket = client.socket
+        if hasattr(self.target, 'flush'):
+            # anything buffered goes first
+            self.target.flush()
+        if self.fd is None or hasattr(socket, 'cipher'):
+            self._receive_buffered(client, length)
+        else:
+            direct_transfer(socket.fileno(), None, self.fd, self.offset, length)
+        return length
+
+    def _receive_buffered(self, client, length, chunk_size=64*1024):
+        if self.fd is None:
+            write = self.target.write
+            if self.offset is not None:
+                self.target.seek(self.offset)
+        else:
+            fd = self.fd
+            def write(data):
+                view = memoryview(data)
+                while view:
+                    view = view[os.write(fd, view):]
+            if self.offset is not None:
+                os.lseek(fd, self.offset, os.SEEK_SET)
+        left = length
+        while left:
+            data = client.fast_read(min(left, chunk_size))
+            write(data)
+            left -= len(data)
 
 
 def make_splice():
@@ -307,9 +466,37 @@ def make_splice():
     return splice
 
 
-# Build and export wrapper
+def make_sendfile():
+    '''Set up a sendfile(2) wrapper'''
+
+    libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+    c_sendfile = libc.sendfile64 if hasattr(libc, 'sendfile64') else libc.sendfile
+
+    # ssize_t sendfile(int out_fd, int in_fd, off_t *offset, size_t count)
+    c_off_t = ctypes.c_int64
+    c_sendfile.argtypes = [ctypes.c_int, ctypes.c_int, ctypes.POINTER(c_off_t), ctypes.c_size_t]
+    c_sendfile.restype = ctypes.c_ssize_t
+
+    def sendfile(fd_out, fd_in, offset, count):
+        '''Wrapper for sendfile(2), raises IOError like splice'''
+        c_offset = ctypes.byref(c_off_t(offset)) if offset is not None else None
+        while True:
+            res = c_sendfile(fd_out, fd_in, c_offset, count)
+            if res == -1:
+                errno_ = ctypes.get_errno()
+                if errno_ == errno.EINTR:
+                    continue
+                raise IOError(errno_, os.strerror(errno_))
+            return res
+
+    return sendfile
+
+
+# Build and export wrappers
 splice = make_splice() #pylint: disable-msg=C0103
 del make_splice
+sendfile = make_sendfile() #pylint: disable-msg=C0103
+del make_sendfile
 
 
 # From bits/fcntl.h
@@ -15,10 +15,12 @@ setup(
     packages=find_packages(exclude=['test']),
     requires = requires,
     install_requires=requires,
+    extras_require = {'erasure': ['numpy']},
 
     # features
     entry_points = {
-        'console_scripts': [ 'kineticc = kinetic.cmd:main' ],
+        'console_scripts': [ 'kineticc = kinetic.cmd:main',
+                             'kinetic-proxy = kinetic.proxy:main' ],
     },
 
     # copyright
@@ -16,8 +16,11 @@
 
 #@author: Paul Dardeau
 
+import gc
 import unittest
 
+import eventlet
+
 from kinetic import Client
 from kinetic import batch
 from kinetic import common
@@ -60,6 +63,8 @@ class BatchTestCase(BaseTestCase):
     def test_batch_commit_is_completed(self):
         key1 = self.buildKey('test_batch_commit_is_completed_1')
         key2 = self.buildKey('test_batch_commit_is_completed_2')
+        # the delete would abort the commit if key2 did not exist
+        self.client.put(key2, '')
         self.assertFalse(self.batch.is_completed())
         self.batch.put(key1, '')
         self.batch.delete(key2)
@@ -91,6 +96,15 @@ class BatchTestCase(BaseTestCase):
         # commit with no operations in batch
         self.assertRaises(common.BatchAbortedException, self.batch.commit())
 
+    def test_rejected_commit_raises(self):
+        key1 = self.buildKey('key_should_not_exist_1')
+        key2 = self.buildKey('key_should_not_exist_2')
+        self.batch.put(key1, '')
+        self.batch.delete(key2)
+        self.assertRaises(common.BatchAbortedException, self.batch.commit)
+        self.assertTrue(self.batch.is_completed())
+        self.assertEqual(self.client.get(key1), None)
+
     def test_batch_commit(self):
         key = self.buildKey('key_should_exist')
         self.batch.put(key, '')
@@ -209,6 +223,114 @@ class BatchTestCase(BaseTestCase):
         self.assertRaises(common.BatchCompletedException, self.batch.delete, *args)
 
 
+class AsyncBatchTestCase(BaseTestCase):
+
+    def setUp(self):
+        super(AsyncBatchTestCase, self).setUp()
+        self.client = Client(self.host, self.port)
+        self.client.connect()
+
+    def tearDown(self):
+        super(AsyncBatchTestCase, self).tearDown()
+        self.client.close()
+
+    def test_async_batch_commit(self):
+        key1 = self.buildKey('test_async_batch_commit_1')
+        key2 = self.buildKey('test_async_batch_commit_2')
+        self.client.put(key2, '')
+        b = self.client.begin_batch_async()
+        b.put(key1, '')
+        b.delete(key2)
+        self.assertEquals(len(b), 2)
+        self.assertEquals(b.commit().result(), 2)
+        self.assertTrue(b.is_completed())
+        self.assertIsNotNone(self.client.get(key1))
+        self.assertEqual(self.client.get(key2), None)
+
+    def test_async_batch_abort(self):
+        key = self.buildKey('test_async_batch_abort')
+        b = self.client.begin_batch_async()
+        b.put(key, '')
+        b.abort().result()
+        self.assertTrue(b.is_completed())
+        self.assertEqual(self.client.get(key), None)
+
+    def test_async_batch_rejected_commit(self):
+        slots = self.client._batch_slots.balance
+        key1 = self.buildKey('test_async_batch_rejected_commit_1')
+        key2 = self.buildKey('test_async_batch_rejected_commit_2')
+        b = self.client.begin_batch_async()
+        b.put(key1, '')
+        # the device rejects the commit since key2 does not exist
+        b.delete(key2)
+        self.assertRaises(common.BatchAbortedException, b.commit().result)
+        self.assertEqual(self.client._batch_slots.balance, slots)
+        self.assertEqual(self.client.get(key1), None)
+
+    def test_async_batch_split(self):
+        keys = [self.buildKey('test_async_batch_split_%d' % i) for i in range(5)]
+        b = self.client.begin_batch_async(max_operations=2)
+        for k in keys:
+            b.put(k, 'value')
+        self.assertEquals(b.commit().result(), 5)
+        for k in keys:
+            self.assertEquals(self.client.get(k).value, 'value')
+
+    def test_async_batch_empty_commit(self):
+        b = self.client.begin_batch_async()
+        self.assertEquals(b.commit().result(), 0)
+
+    def test_async_batch_reuse_after_commit(self):
+        key = self.buildKey('test_async_batch_reuse_after_commit')
+        b = self.client.begin_batch_async()
+        b.put(key, '')
+        b.commit().result()
+        self.assertRaises(common.BatchCompletedException, b.put, key, '')
+
+    def test_async_batch_with(self):
+        key = self.buildKey('test_async_batch_with')
+        with self.client.begin_batch_async() as b:
+            b.put(key, 'value')
+        self.assertTrue(b.is_completed())
+        self.assertEquals(self.client.get(key).value, 'value')
+
+        try:
+            with self.client.begin_batch_async() as b:
+                b.delete(key)
+                raise ValueError()
+        except ValueError:
+            pass
+        self.assertTrue(b.is_completed())
+        self.assertEquals(self.client.get(key).value, 'value')
+
+    def test_async_batch_dropped(self):
+        slots = self.client._batch_slots.balance
+        for i in range(slots + 1):
+            b = self.client.begin_batch_async()
+            b.put(self.buildKey(i), 'value')
+            del b
+            gc.collect()
+        with eventlet.Timeout(5):
+            b = self.client.begin_batch_async()
+            b.put(self.buildKey('last'), 'value')
+            self.assertEquals(b.commit().result(), 1)
+        eventlet.sleep(0.1)
+        self.assertEquals(self.client._batch_slots.balance, slots)
+        self.assertEqual(self.client.get(self.buildKey(0)), None)
+
+    def test_async_batch_start_failed(self):
+        slots = self.client._batch_slots.balance
+
+        def startBatchAsync(onSuccess, onError, **kwargs):
+            onError(common.KineticException('start failed'))
+        self.client.startBatchAsync = startBatchAsync
+        b = self.client.begin_batch_async()
+        b.put(self.buildKey(1), 'value')
+        self.assertEquals(self.client._batch_slots.balance, slots)
+        self.assertRaises(common.KineticException, b.commit().result)
+        self.assertEquals(self.client._batch_slots.balance, slots)
+
+
 if __name__ == '__main__':
     unittest.main()
 
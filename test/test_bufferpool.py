@@ -0,0 +1,110 @@
+# Copyright 2013-2015 Seagate Technology LLC.
+#
+# This Source Code Form is subject to the terms of the Mozilla
+# Public License, v. 2.0. If a copy of the MPL was not
+# distributed with this file, You can obtain one at
+# https://mozilla.org/MP:/2.0/.
+#
+# This program is distributed in the hope that it will be useful,
+# but is provided AS-IS, WITHOUT ANY WARRANTY; including without
+# the implied warranty of MERCHANTABILITY, NON-INFRINGEMENT or
+# FITNESS FOR A PARTICULAR PURPOSE. See the Mozilla Public
+# License for more details.
+#
+# See www.openkinetic.org for more project information
+#
+
+import os
+import unittest
+
+from kinetic import BufferPool
+from kinetic import Client
+from kinetic import ReadCoalescing
+from kinetic.bufferpool import PooledBuffer
+from base import BaseTestCase
+
+
+class BufferPoolTestCase(unittest.TestCase):
+
+    def test_size_classes(self):
+        pool = BufferPool(min_size=1024)
+        self.assertEqual(pool.sizeClass(1), 1024)
+        self.assertEqual(pool.sizeClass(1024), 1024)
+        self.assertEqual(pool.sizeClass(1025), 2048)
+        self.assertEqual(pool.sizeClass(300000), 512 * 1024)
+
+    def test_reuse(self):
+        pool = BufferPool(min_size=1024)
+        b = pool.acquire(1500)
+        self.assertEqual(len(b), 1500)
+        self.assertEqual(len(b.view), 1500)
+        b.release()
+        self.assertTrue(b.released)
+        b.release() # only once
+        with pool.acquire(2000) as b2:
+            self.assertEqual(len(b2), 2000)
+        stats = pool.stats()
+        self.assertEqual(stats['allocations'], 1)
+        self.assertEqual(stats['reuses'], 1)
+        self.assertEqual(stats['releases'], 2)
+        self.assertEqual(stats['pooled_bytes'], 2048)
+        self.assertEqual(stats['in_use_bytes'], 0)
+        self.assertEqual(stats['free_blocks'], {2048: 1})
+
+    def test_max_bytes(self):
+        pool = BufferPool(min_size=1024, max_bytes=2048)
+        buffers = [pool.acquire(1024) for _ in range(3)]
+        self.assertEqual(pool.stats()['in_use_bytes'], 3072)
+        for b in buffers:
+            b.release()
+        stats = pool.stats()
+        self.assertEqual(stats['dropped'], 1)
+        self.assertEqual(stats['pooled_bytes'], 2048)
+        self.assertEqual(stats['allocated_bytes'], 2048)
+        pool.clear()
+        self.assertEqual(pool.stats()['allocated_bytes'], 0)
+
+
+class PooledReceiveTestCase(BaseTestCase):
+
+    def setUp(self):
+        super(PooledReceiveTestCase, self).setUp()
+        self.pool = BufferPool(min_size=4096)
+        self.client = Client(self.host, self.port, buffer_pool=self.pool)
+        self.client.connect()
+        self.data = os.urandom(100000)
+        self.client.put(self.buildKey(1), self.data)
+
+    def test_pooled_get(self):
+        for i in range(5):
+            entry = self.client.get(self.buildKey(1))
+            self.assertTrue(isinstance(entry.value, PooledBuffer))
+            self.assertEqual(entry.value.view.tobytes(), self.data)
+            self.assertEqual(str(entry.value), self.data)
+            entry.value.release()
+        stats = self.pool.stats()
+        self.assertEqual(stats['allocations'], 1)
+        self.assertEqual(stats['reuses'], 4)
+
+    def test_small_values_not_pooled(self):
+        self.client.put(self.buildKey(2), 'small')
+        self.assertEqual(self.client.get(self.buildKey(2)).value, 'small')
+        self.assertEqual(self.pool.stats()['allocations'], 0)
+
+    def test_coalesced_copies(self):
+        self.client.close()
+        self.client = Client(self.host, self.port, buffer_pool=self.pool,
+                             coalesce_reads=ReadCoalescing.COPY)
+        self.client.connect()
+        values = []
+        for i in range(3):
+            self.client.getAsync(lambda e: values.append(e.value), self.fail, self.buildKey(1))
+        self.client.wait()
+        self.assertEqual(len(values), 3)
+        for v in values:
+            self.assertEqual(v, self.data)
+        self.assertEqual(self.pool.stats()['allocations'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
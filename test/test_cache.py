@@ -0,0 +1,376 @@
+# Copyright 2013-2015 Seagate Technology LLC.
+#
+# This Source Code Form is subject to the terms of the Mozilla
+# Public License, v. 2.0. If a copy of the MPL was not
+# distributed with this file, You can obtain one at
+# https://mozilla.org/MP:/2.0/.
+#
+# This program is distributed in the hope that it will be useful,
+# but is provided AS-IS, WITHOUT ANY WARRANTY; including without
+# the implied warranty of MERCHANTABILITY, NON-INFRINGEMENT or
+# FITNESS FOR A PARTICULAR PURPOSE. See the Mozilla Public
+# License for more details.
+#
+# See www.openkinetic.org for more project information
+#
+
+import os
+import tempfile
+import unittest
+
+from kinetic import Client
+from kinetic import Entry
+from kinetic import ReadCache
+from kinetic import NegativeCache
+from kinetic import VersionCache
+from kinetic import KineticMessageException
+from kinetic.cache import BloomFilter
+from kinetic.cache import LRUStore
+from kinetic.common import DeferedValue
+from kinetic.common import EntryMetadata
+from kinetic.sharedcache import SharedMemoryStore
+from base import BaseTestCase
+
+
+class ReadCacheTestCase(BaseTestCase):
+
+    def setUp(self):
+        super(ReadCacheTestCase, self).setUp()
+        self.cache = ReadCache()
+        self.client = Client(self.host, self.port, cache=self.cache)
+        self.client.connect()
+        self.other = Client(self.host, self.port)
+        self.other.connect()
+
+    def tearDown(self):
+        super(ReadCacheTestCase, self).tearDown()
+        self.client.close()
+        self.other.close()
+
+    def test_get_after_put_hits(self):
+        key = self.buildKey(1)
+        self.client.put(key, 'value')
+        self.assertEqual(self.client.get(key).value, 'value')
+        self.assertEqual(self.cache.hits, 1)
+        self.assertEqual(self.cache.revalidations, 1)
+        self.assertEqual(self.cache.misses, 0)
+
+    def test_get_caches(self):
+        key = self.buildKey(1)
+        self.other.put(key, 'value')
+        self.assertEqual(self.client.get(key).value, 'value')
+        self.assertEqual(self.cache.misses, 1)
+        self.assertEqual(self.client.get(key).value, 'value')
+        self.assertEqual(self.cache.hits, 1)
+
+    def test_deferred_value_not_cached(self):
+        key = self.buildKey(1)
+        self.client.put(key, 'value')
+        self.cache.update(key, DeferedValue(None, 5), EntryMetadata('1'))
+        self.assertEqual(len(self.cache.store), 0)
+
+    def test_revalidation_detects_change(self):
+        key = self.buildKey(1)
+        self.client.put(key, 'value')
+        self.other.put(key, 'value2')
+        self.assertEqual(self.client.get(key).value, 'value2')
+        self.assertEqual(self.cache.hits, 0)
+        self.assertEqual(self.client.get(key).value, 'value2')
+        self.assertEqual(self.cache.hits, 1)
+
+    def test_revalidation_detects_delete(self):
+        key = self.buildKey(1)
+        self.client.put(key, 'value')
+        self.other.delete(key)
+        self.assertEqual(self.client.get(key), None)
+
+    def test_delete_invalidates(self):
+        key = self.buildKey(1)
+        self.client.put(key, 'value')
+        self.client.delete(key)
+        self.assertEqual(len(self.cache.store), 0)
+        self.assertEqual(self.client.get(key), None)
+
+    def test_revalidate_after(self):
+        key = self.buildKey(1)
+        self.cache.revalidate_after = 60
+        self.client.put(key, 'value')
+        self.assertEqual(self.client.get(key).value, 'value')
+        self.assertEqual(self.cache.hits, 1)
+        self.assertEqual(self.cache.revalidations, 0)
+
+    def test_getAsync(self):
+        key = self.buildKey(1)
+        self.client.put(key, 'value')
+        self.assertEqual(self.client.getMany([key])[0].value, 'value')
+        self.assertEqual(self.cache.hits, 1)
+
+
+class NegativeCacheTestCase(BaseTestCase):
+
+    def setUp(self):
+        super(NegativeCacheTestCase, self).setUp()
+        self.cache = NegativeCache(ttl=60, inner=ReadCache())
+        self.client = Client(self.host, self.port, cache=self.cache)
+        self.client.connect()
+        self.other = Client(self.host, self.port)
+        self.other.connect()
+
+    def tearDown(self):
+        super(NegativeCacheTestCase, self).tearDown()
+        self.client.close()
+        self.other.close()
+
+    def test_missing_key(self):
+        key = self.buildKey(1)
+        self.assertEqual(self.client.get(key), None)
+        self.assertEqual(self.cache.hits, 0)
+        self.assertEqual(self.client.get(key), None)
+        self.assertEqual(self.cache.hits, 1)
+
+    def test_put_after_missing(self):
+        key = self.buildKey(1)
+        self.assertEqual(self.client.get(key), None)
+        self.client.put(key, 'value')
+        self.assertEqual(self.client.get(key).value, 'value')
+        self.assertEqual(self.cache.inner.hits, 1)
+
+    def test_delete(self):
+        key = self.buildKey(1)
+        self.client.put(key, 'value')
+        self.client.delete(key)
+        self.assertEqual(self.client.get(key), None)
+        self.assertEqual(self.cache.hits, 1)
+
+    def test_expired(self):
+        key = self.buildKey(1)
+        self.cache.ttl = 0
+        self.assertEqual(self.client.get(key), None)
+        self.other.put(key, 'value')
+        self.assertEqual(self.client.get(key).value, 'value')
+
+    def test_sweep(self):
+        self.other.put(self.buildKey(1), 'value')
+        self.other.put(self.buildKey(2), 'value')
+        self.cache.sweep(self.client, self.buildKey(0), self.buildKey(9), capacity=100)
+        self.assertEqual(self.client.get(self.buildKey(1)).value, 'value')
+        self.assertEqual(self.client.get(self.buildKey(5)), None)
+        self.assertEqual(self.cache.bloom_hits, 1)
+        # kept current with this client's writes
+        self.client.put(self.buildKey(5), 'value')
+        self.assertEqual(self.client.get(self.buildKey(5)).value, 'value')
+
+
+class VersionCacheTestCase(BaseTestCase):
+
+    def setUp(self):
+        super(VersionCacheTestCase, self).setUp()
+        self.cache = VersionCache()
+        self.client = Client(self.host, self.port, cache=self.cache)
+        self.client.connect()
+        self.other = Client(self.host, self.port)
+        self.other.connect()
+
+    def tearDown(self):
+        super(VersionCacheTestCase, self).tearDown()
+        self.client.close()
+        self.other.close()
+
+    def test_remembers_versions(self):
+        key = self.buildKey(1)
+        self.client.put(key, 'value', new_version='1')
+        self.assertEqual(self.cache.version(key), '1')
+        self.other.put(key, 'value', version='1', new_version='2')
+        self.client.get(key)
+        self.assertEqual(self.cache.version(key), '2')
+        self.client.delete(key, version='2')
+        self.assertEqual(self.cache.version(key), None)
+
+    def test_casPut(self):
+        key = self.buildKey(1)
+        v1 = self.client.casPut(key, 'value1')
+        self.assertEqual(self.client.getVersion(key), v1)
+        misses = self.cache.misses
+        v2 = self.client.casPut(key, 'value2', new_version='2')
+        self.assertEqual(v2, '2')
+        self.assertEqual(self.cache.misses, misses)
+        self.assertEqual(self.client.get(key).value, 'value2')
+
+    def test_casPut_retries_on_mismatch(self):
+        key = self.buildKey(1)
+        self.client.casPut(key, 'value1')
+        self.other.put(key, 'other', force=True, new_version='x')
+        self.client.casPut(key, 'value2')
+        self.assertEqual(self.client.get(key).value, 'value2')
+
+    def test_casPut_gives_up(self):
+        key = self.buildKey(1)
+        self.client.casPut(key, 'value1')
+        self.other.put(key, 'other', force=True, new_version='x')
+        self.assertRaises(KineticMessageException, self.client.casPut, key, 'value2', retries=0)
+
+    def test_casPut_function(self):
+        key = self.buildKey(1)
+        increment = lambda e: str(int(e.value) + 1) if e else '1'
+        self.client.casPut(key, increment)
+        self.other.put(key, '10', force=True, new_version='x')
+        self.client.casPut(key, increment)
+        self.assertEqual(self.client.get(key).value, '11')
+
+
+class BloomFilterTestCase(unittest.TestCase):
+
+    def test_no_false_negatives(self):
+        bloom = BloomFilter(1000, 0.01)
+        for i in range(1000):
+            bloom.add('key%d' % i)
+        for i in range(1000):
+            self.assertTrue('key%d' % i in bloom)
+
+    def test_error_rate(self):
+        bloom = BloomFilter(1000, 0.01)
+        for i in range(1000):
+            bloom.add('key%d' % i)
+        false_positives = sum(1 for i in range(10000) if 'other%d' % i in bloom)
+        self.assertTrue(false_positives < 300)
+
+
+class LRUStoreTestCase(unittest.TestCase):
+
+    def test_evicts_least_recently_used(self):
+        store = LRUStore(max_bytes=10)
+        store.store('a', Entry('a', '1234'), 0)
+        store.store('b', Entry('b', '1234'), 0)
+        store.lookup('a')
+        store.store('c', Entry('c', '1234'), 0)
+        self.assertEqual(store.lookup('b'), None)
+        self.assertNotEqual(store.lookup('a'), None)
+        self.assertNotEqual(store.lookup('c'), None)
+        self.assertEqual(store.size, 10)
+
+    def test_too_big(self):
+        store = LRUStore(max_bytes=10)
+        store.store('a', Entry('a', 'x' * 10), 0)
+        self.assertEqual(len(store), 0)
+
+
+class SharedMemoryStoreTestCase(unittest.TestCase):
+
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp()
+        os.close(fd)
+        os.unlink(self.path)
+        self.store = SharedMemoryStore('test', self.path, max_bytes=64 * 1024,
+                                       slot_sizes=(256, 4096))
+
+    def tearDown(self):
+        self.store.close()
+        os.unlink(self.path)
+
+    def entry(self, key, value, version='1'):
+        return Entry(key, value, EntryMetadata(version, 'tag', 1))
+
+    def test_store_lookup(self):
+        self.store.store('a', self.entry('a', 'value'), 10)
+        entry, ts = self.store.lookup('a')
+        self.assertEqual(entry.value, 'value')
+        self.assertEqual(entry.metadata.version, '1')
+        self.assertEqual(entry.metadata.tag, 'tag')
+        self.assertEqual(entry.metadata.algorithm, 1)
+        self.assertEqual(ts, 10)
+        self.assertEqual(self.store.lookup('b'), None)
+
+    def test_shared(self):
+        other = SharedMemoryStore('test', self.path)
+        try:
+            self.assertEqual(other.classes, self.store.classes)
+            self.store.store('a', self.entry('a', 'value'), 0)
+            self.assertEqual(other.lookup('a')[0].value, 'value')
+            other.store('a', self.entry('a', 'x' * 1000, '2'), 0)
+            entry, _ = self.store.lookup('a')
+            self.assertEqual(entry.value, 'x' * 1000)
+            self.assertEqual(entry.metadata.version, '2')
+            other.invalidate('a')
+            self.assertEqual(self.store.lookup('a'), None)
+        finally:
+            other.close()
+
+    def test_moves_between_classes(self):
+        self.store.store('a', self.entry('a', 'x' * 1000), 0)
+        self.store.store('a', self.entry('a', 'small', '2'), 0)
+        self.assertEqual(len(self.store), 1)
+        self.assertEqual(self.store.lookup('a')[0].value, 'small')
+
+    def test_too_big(self):
+        self.store.store('a', self.entry('a', 'x' * 5000), 0)
+        self.assertEqual(len(self.store), 0)
+
+    def test_namespace(self):
+        other = SharedMemoryStore('other:8123', self.path)
+        try:
+            self.store.store('a', self.entry('a', 'value'), 0)
+            self.assertEqual(other.lookup('a'), None)
+        finally:
+            other.close()
+
+    def test_client_namespace(self):
+        a = SharedMemoryStore(Client('localhost', 8123), self.path)
+        b = SharedMemoryStore(Client('localhost', 8124), self.path)
+        try:
+            self.assertEqual(a.namespace, 'localhost:8123@0/')
+            a.store('a', self.entry('a', 'value'), 0)
+            self.assertEqual(b.lookup('a'), None)
+        finally:
+            a.close()
+            b.close()
+
+    def test_clear(self):
+        for i in range(10):
+            self.store.store('key%d' % i, self.entry('key%d' % i, 'value'), 0)
+        self.assertTrue(len(self.store) > 0)
+        self.store.clear()
+        self.assertEqual(len(self.store), 0)
+
+
+class SharedReadCacheTestCase(BaseTestCase):
+
+    def setUp(self):
+        super(SharedReadCacheTestCase, self).setUp()
+        fd, self.path = tempfile.mkstemp()
+        os.close(fd)
+        os.unlink(self.path)
+        self.stores = []
+        self.clients = []
+        for _ in range(2):
+            client = Client(self.host, self.port)
+            client.connect()
+            store = SharedMemoryStore(client, self.path, max_bytes=1024 * 1024)
+            client.cache = ReadCache(store=store)
+            self.stores.append(store)
+            self.clients.append(client)
+
+    def tearDown(self):
+        super(SharedReadCacheTestCase, self).tearDown()
+        for c in self.clients:
+            c.close()
+        for s in self.stores:
+            s.close()
+        os.unlink(self.path)
+
+    def test_shared_between_clients(self):
+        key = self.buildKey(1)
+        self.clients[0].put(key, 'value', new_version='1')
+        self.assertEqual(self.clients[1].get(key).value, 'value')
+        self.assertEqual(self.clients[1].cache.hits, 1)
+
+    def test_stale_entry(self):
+        key = self.buildKey(1)
+        self.clients[0].put(key, 'value', new_version='1')
+        self.clients[1].cache.store.invalidate(key)
+        self.clients[1].cache.store.store(key, Entry(key, 'old', EntryMetadata('0')), 0)
+        self.assertEqual(self.clients[0].get(key).value, 'value')
+        self.assertEqual(self.clients[0].cache.hits, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -17,8 +17,10 @@
 #@author: Ignacio Corderi
 
 import unittest
+import eventlet
 
 from kinetic import Client
+from kinetic import Compressor
 from kinetic import KeyRange
 from kinetic import KineticMessageException
 from base import BaseTestCase
@@ -208,6 +210,86 @@ class KineticBasicTestCase(BaseTestCase):
             self.assertEqual(x.value, expectedValues[i])
             i += 1
 
+    def test_deleteRange(self):
+        self.setUpRangeTests()
+        deleted, failed = self.client.deleteRange(self.buildKey(3),self.buildKey(6))
+        self.assertEqual(deleted, 4)
+        self.assertEqual(failed, {})
+        xs = self.client.getKeyRange(self.buildKey(1),self.buildKey(9))
+        expected = [self.buildKey(1),self.buildKey(2),self.buildKey(7),self.buildKey(8),self.buildKey(9)]
+        self.assertEqual(xs, expected)
+
+    def test_deleteRange_multiple_batches(self):
+        self.setUpRangeTests()
+        progress = []
+        deleted, failed = self.client.deleteRange(self.buildKey(1),self.buildKey(9),
+            batch_size=2, max_batches=2, onProgress=lambda d, f: progress.append(d))
+        self.assertEqual(deleted, 9)
+        self.assertEqual(failed, {})
+        self.assertEqual(max(progress), 9)
+        self.assertEqual(self.client.getKeyRange(self.buildKey(1),self.buildKey(9)), [])
+
+    def test_deleteRange_batch_size_limit(self):
+        self.setUpRangeTests()
+        self.client.limits.maxOperationCountPerBatch = 4
+        progress = []
+        deleted, failed = self.client.deleteRange(self.buildKey(1),self.buildKey(9),
+            batch_size=100, max_batches=1, onProgress=lambda d, f: progress.append(d))
+        self.assertEqual(deleted, 9)
+        self.assertEqual(progress, [4, 8, 9])
+
+    def test_deleteRange_empty(self):
+        deleted, failed = self.client.deleteRange(self.buildKey(1),self.buildKey(9))
+        self.assertEqual(deleted, 0)
+        self.assertEqual(failed, {})
+
+    def test_getMany(self):
+        self.setUpRangeTests()
+        keys = [self.buildKey(3), self.buildKey('missing'), self.buildKey(1)]
+        xs = self.client.getMany(keys)
+        self.assertEqual(xs[0].value, "test_value_3")
+        self.assertEqual(xs[1], None)
+        self.assertEqual(xs[2].value, "test_value_1")
+
+    def test_getMany_as_dict(self):
+        self.setUpRangeTests()
+        keys = [self.buildKey(i) for i in range(9, 0, -1)]
+        xs = self.client.getMany(keys, as_dict=True, window=2)
+        self.assertEqual(xs.keys(), keys)
+        self.assertEqual(xs[self.buildKey(5)].value, "test_value_5")
+
+    def test_getMany_stream(self):
+        self.setUpRangeTests()
+        keys = (self.buildKey(i) for i in range(1, 10))
+        xs = self.client.getMany(keys, stream=True)
+        for i, (key, entry) in enumerate(xs):
+            self.assertEqual(key, self.buildKey(i + 1))
+            self.assertEqual(entry.value, "test_value_%d" % (i + 1))
+
+    def test_putMany(self):
+        items = [(self.buildKey(i), "test_value_%d" % i) for i in range(5)]
+        self.assertEqual(self.client.putMany(items), [None] * 5)
+        for k, v in items:
+            self.assertEqual(self.client.get(k).value, v)
+
+    def test_putMany_errors(self):
+        self.client.put(self.buildKey(1), "test_value", new_version="1")
+        items = [(self.buildKey(0), "test_value"), (self.buildKey(1), "test_value")]
+        xs = self.client.putMany(items)
+        self.assertEqual(xs[0], None)
+        self.assertTrue(isinstance(xs[1], KineticMessageException))
+
+    def test_deleteMany(self):
+        self.client.put(self.buildKey(1), "test_value")
+        xs = self.client.deleteMany([self.buildKey(1), self.buildKey(2)])
+        self.assertEqual(xs, [True, False])
+        self.assertEqual(self.client.get(self.buildKey(1)), None)
+
+    def test_versionMany(self):
+        self.client.put(self.buildKey(1), "test_value", new_version="1")
+        xs = self.client.versionMany([self.buildKey(1), self.buildKey(2)])
+        self.assertEqual(xs, ["1", None])
+
     def test_value_too_big(self):
         self.assertRaises(common.KineticClientException, self.client.put, self.buildKey(1), 'x' * (common.MAX_VALUE_SIZE + 1))
 
@@ -217,5 +299,97 @@ class KineticBasicTestCase(BaseTestCase):
     def test_noop(self):
         self.client.noop()
 
+
+class ReadCoalescingTestCase(BaseTestCase):
+
+    def setUp(self):
+        super(ReadCoalescingTestCase, self).setUp()
+        self.client = Client(self.host, self.port, coalesce_reads=common.ReadCoalescing.COPY)
+        self.client.connect()
+
+    def tearDown(self):
+        super(ReadCoalescingTestCase, self).tearDown()
+        self.client.close()
+
+    def getAsync(self, method, key, **kwargs):
+        f = common.Future()
+        getattr(self.client, method)(f.set_result, f.set_exception, key, **kwargs)
+        return f
+
+    def test_concurrent_gets_share_request(self):
+        self.client.put(self.buildKey(1), "test_value")
+        fs = [self.getAsync('getAsync', self.buildKey(1)) for _ in range(5)]
+        xs = [f.result() for f in fs]
+        self.assertEqual(self.client.coalesced_reads, 4)
+        self.assertEqual([x.value for x in xs], ["test_value"] * 5)
+        # every caller owns its value
+        xs[0].value[0] = ord('T')
+        self.assertEqual(xs[1].value, "test_value")
+
+    def test_readonly(self):
+        self.client.coalesce_reads = common.ReadCoalescing.READONLY
+        self.client.put(self.buildKey(1), "test_value")
+        fs = [self.getAsync('getAsync', self.buildKey(1)) for _ in range(3)]
+        xs = [f.result() for f in fs]
+        self.assertEqual(self.client.coalesced_reads, 2)
+        self.assertTrue(isinstance(xs[0].value, str))
+        self.assertTrue(xs[0].value is xs[1].value is xs[2].value)
+        # the entries are the callers' own
+        self.assertFalse(xs[0] is xs[1] or xs[1] is xs[2] or xs[0].metadata is xs[1].metadata)
+
+    def test_decoded_values(self):
+        self.client.compression = Compressor()
+        self.client.put(self.buildKey(1), "test_value" * 100)
+        fs = [self.getAsync('getAsync', self.buildKey(1)) for _ in range(3)]
+        xs = [f.result() for f in fs]
+        self.assertEqual(self.client.coalesced_reads, 2)
+        self.assertEqual([x.value for x in xs], ["test_value" * 100] * 3)
+        xs[0].metadata.version = 'changed'
+        self.assertFalse(xs[0] is xs[1] or xs[1] is xs[2])
+        self.assertNotEqual(xs[1].metadata.version, 'changed')
+
+    def test_different_arguments_not_shared(self):
+        self.client.put(self.buildKey(1), "test_value")
+        f1 = self.getAsync('getAsync', self.buildKey(1), timeout=1000)
+        f2 = self.getAsync('getAsync', self.buildKey(1), timeout=1000)
+        f3 = self.getAsync('getAsync', self.buildKey(1), timeout=2000)
+        f4 = self.getAsync('getAsync', self.buildKey(1), priority=common.Priority.HIGHEST)
+        self.assertEqual([f.result().value for f in [f1, f2, f3, f4]], ["test_value"] * 4)
+        self.assertEqual(self.client.coalesced_reads, 1)
+
+    def test_missing_key(self):
+        fs = [self.getAsync('getAsync', self.buildKey(1)) for _ in range(3)]
+        self.assertEqual([f.result() for f in fs], [None] * 3)
+        self.assertEqual(self.client.coalesced_reads, 2)
+
+    def test_different_operations_not_shared(self):
+        self.client.put(self.buildKey(1), "test_value", new_version="1")
+        f1 = self.getAsync('getAsync', self.buildKey(1))
+        f2 = self.getAsync('getVersionAsync', self.buildKey(1))
+        f3 = self.getAsync('getMetadataAsync', self.buildKey(1))
+        f4 = self.getAsync('getVersionAsync', self.buildKey(1))
+        self.assertEqual(f1.result().value, "test_value")
+        self.assertEqual(f2.result(), "1")
+        self.assertEqual(f3.result().metadata.version, "1")
+        self.assertEqual(f4.result(), "1")
+        self.assertEqual(self.client.coalesced_reads, 1)
+
+    def test_put_detaches_readers(self):
+        self.client.put(self.buildKey(1), "test_value")
+        f1 = self.getAsync('getAsync', self.buildKey(1))
+        put = common.Future()
+        self.client.putAsync(put.set_result, put.set_exception, self.buildKey(1), "test_value_2", force=True)
+        f2 = self.getAsync('getAsync', self.buildKey(1))
+        self.assertEqual(f1.result().value, "test_value")
+        self.assertEqual(f2.result().value, "test_value_2")
+        self.assertEqual(self.client.coalesced_reads, 0)
+
+    def test_blocking_gets(self):
+        self.client.put(self.buildKey(1), "test_value")
+        pool = eventlet.greenpool.GreenPool()
+        xs = list(pool.imap(self.client.get, [self.buildKey(1)] * 10))
+        self.assertEqual([x.value for x in xs], ["test_value"] * 10)
+        self.assertTrue(self.client.coalesced_reads > 0)
+
 if __name__ == '__main__':
     unittest.main()
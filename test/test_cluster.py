@@ -0,0 +1,181 @@
+# Copyright 2013-2015 Seagate Technology LLC.
+#
+# This Source Code Form is subject to the terms of the Mozilla
+# Public License, v. 2.0. If a copy of the MPL was not
+# distributed with this file, You can obtain one at
+# https://mozilla.org/MP:/2.0/.
+#
+# This program is distributed in the hope that it will be useful,
+# but is provided AS-IS, WITHOUT ANY WARRANTY; including without
+# the implied warranty of MERCHANTABILITY, NON-INFRINGEMENT or
+# FITNESS FOR A PARTICULAR PURPOSE. See the Mozilla Public
+# License for more details.
+#
+# See www.openkinetic.org for more project information
+#
+
+import collections
+import unittest
+
+from kinetic import Cluster
+from kinetic.cluster import HashRing
+from base import MultiSimulatorTestCase
+
+
+class HashRingTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.ring = HashRing()
+        for node in ('a', 'b', 'c', 'd'):
+            self.ring.add(node)
+        self.keys = ['key%d' % i for i in range(10000)]
+
+    def test_balanced(self):
+        counts = collections.Counter(self.ring.lookup(k) for k in self.keys)
+        self.assertEqual(len(counts), 4)
+        for n in counts.values():
+            self.assertTrue(1800 < n < 3200, counts)
+
+    def test_weights(self):
+        self.ring.add('e', weight=2)
+        counts = collections.Counter(self.ring.lookup(k) for k in self.keys)
+        self.assertTrue(counts['e'] > 1.5 * counts['a'], counts)
+
+    def test_add_moves_only_to_new_node(self):
+        before = dict((k, self.ring.lookup(k)) for k in self.keys)
+        self.ring.add('e')
+        moved = [k for k in self.keys if self.ring.lookup(k) != before[k]]
+        self.assertTrue(all(self.ring.lookup(k) == 'e' for k in moved))
+        self.assertTrue(len(moved) < 0.3 * len(self.keys))
+
+    def test_remove_moves_only_removed_keys(self):
+        before = dict((k, self.ring.lookup(k)) for k in self.keys)
+        self.ring.remove('b')
+        for k in self.keys:
+            if before[k] != 'b':
+                self.assertEqual(self.ring.lookup(k), before[k])
+            else:
+                self.assertNotEqual(self.ring.lookup(k), 'b')
+
+    def test_preferenceList(self):
+        for k in self.keys[:100]:
+            nodes = self.ring.preferenceList(k, 3)
+            self.assertEqual(len(set(nodes)), 3)
+            self.assertEqual(nodes[0], self.ring.lookup(k))
+        self.assertEqual(len(self.ring.preferenceList('key', 10)), 4)
+
+
+class HookedClient(object):
+    # runs the hook of a key before putting it
+
+    def __init__(self, client, hooks):
+        self.client = client
+        self.hooks = hooks
+
+    def put(self, key, *args, **kwargs):
+        hook = self.hooks.pop(key, None)
+        if hook:
+            hook()
+        return self.client.put(key, *args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+
+class ClusterTestCase(MultiSimulatorTestCase):
+
+    def setUp(self):
+        super(ClusterTestCase, self).setUp()
+        self.cluster = Cluster([('localhost', port) for port in self.ports])
+        self.cluster.connect()
+
+    def tearDown(self):
+        self.cluster.close()
+        super(ClusterTestCase, self).tearDown()
+
+    def test_put_get_delete(self):
+        for i in range(20):
+            self.cluster.put(self.buildKey(i), 'value%d' % i)
+        for i in range(20):
+            key = self.buildKey(i)
+            self.assertEqual(self.cluster.get(key).value, 'value%d' % i)
+            # stored only on its own drive
+            for name, c in self.cluster.clients.items():
+                self.assertEqual(c.get(key) is not None,
+                                 name == self.cluster.ring.lookup(key))
+        self.assertTrue(self.cluster.delete(self.buildKey(0)))
+        self.assertEqual(self.cluster.get(self.buildKey(0)), None)
+
+    def test_many(self):
+        items = [(self.buildKey(i), 'value%d' % i) for i in range(50)]
+        self.cluster.putMany(items)
+        xs = self.cluster.getMany([k for k, _ in items])
+        self.assertEqual([x.value for x in xs], [v for _, v in items])
+
+    def test_ranges(self):
+        keys = sorted(self.buildKey('%02d' % i) for i in range(30))
+        for k in keys:
+            self.cluster.put(k, 'value')
+        self.assertEqual(self.cluster.getKeyRange(keys[0], keys[-1]), keys)
+        self.assertEqual(self.cluster.getKeyRange(keys[0], keys[-1], maxReturned=5), keys[:5])
+        self.assertEqual(self.cluster.getKeyRange(keys[0], keys[-1], maxReturned=5, reverse=True),
+                         keys[::-1][:5])
+        self.assertEqual([e.key for e in self.cluster.getRange(keys[0], keys[-1], prefetch=4)], keys)
+
+    def test_ranges_on_several_devices(self):
+        keys = sorted(self.buildKey('%02d' % i) for i in range(5))
+        for k in keys:
+            self.cluster.put(k, 'value')
+        # a copy left on another device
+        owner = self.cluster.ring.lookup(keys[2])
+        other = [c for n, c in self.cluster.clients.items() if n != owner][0]
+        other.put(keys[2], 'stale', force=True)
+        try:
+            self.assertEqual(self.cluster.getKeyRange(keys[0], keys[-1]), keys)
+            entries = list(self.cluster.getRange(keys[0], keys[-1], prefetch=2))
+            self.assertEqual([e.key for e in entries], keys)
+            self.assertEqual([str(e.value) for e in entries], ['value'] * 5)
+        finally:
+            other.delete(keys[2], force=True)
+
+    def test_rebalance(self):
+        name = self.cluster.ring.lookup(self.buildKey(0))
+        self.cluster.ring.remove(name)
+        keys = [self.buildKey(i) for i in range(20)]
+        for k in keys:
+            self.cluster.put(k, 'value', new_version='1')
+        self.cluster.ring.add(name)
+        moved = self.cluster.rebalance()
+        self.assertEqual(moved, sum(1 for k in keys if self.cluster.ring.lookup(k) == name))
+        for k in keys:
+            entry = self.cluster.get(k)
+            self.assertEqual(entry.value, 'value')
+            self.assertEqual(entry.metadata.version, '1')
+
+    def test_rebalance_keeps_newer_write(self):
+        name = self.cluster.ring.lookup(self.buildKey(0))
+        self.cluster.ring.remove(name)
+        keys = [self.buildKey(i) for i in range(20)]
+        for k in keys:
+            self.cluster.put(k, 'value', new_version='1')
+        sources = dict((k, self.cluster.clients[self.cluster.ring.lookup(k)]) for k in keys)
+        self.cluster.ring.add(name)
+        moving = [k for k in keys if self.cluster.ring.lookup(k) == name]
+        target = self.cluster.clients[name]
+        # written to the new owner before the move
+        target.put(moving[0], 'newer', new_version='2')
+        # changed on the old owner while it is copied
+        changed = {moving[1]: lambda: sources[moving[1]].put(
+            moving[1], 'changed', force=True, new_version='3')}
+        self.cluster.clients[name] = HookedClient(target, changed)
+
+        self.assertEqual(self.cluster.rebalance(), len(moving) - 2)
+        self.assertEqual(target.get(moving[0]).value, 'newer')
+        self.assertEqual(sources[moving[1]].get(moving[1]).value, 'changed')
+        for k in moving[2:]:
+            self.assertEqual(target.get(k).value, 'value')
+            self.assertEqual(sources[k].get(k), None)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+# Copyright 2013-2015 Seagate Technology LLC.
+#
+# This Source Code Form is subject to the terms of the Mozilla
+# Public License, v. 2.0. If a copy of the MPL was not
+# distributed with this file, You can obtain one at
+# https://mozilla.org/MP:/2.0/.
+#
+# This program is distributed in the hope that it will be useful,
+# but is provided AS-IS, WITHOUT ANY WARRANTY; including without
+# the implied warranty of MERCHANTABILITY, NON-INFRINGEMENT or
+# FITNESS FOR A PARTICULAR PURPOSE. See the Mozilla Public
+# License for more details.
+#
+# See www.openkinetic.org for more project information
+#
+
+import unittest
+
+from kinetic import Client
+from kinetic import WriteCombiner
+from kinetic import common
+from base import BaseTestCase
+
+
+class WriteCombinerTestCase(BaseTestCase):
+
+    def setUp(self):
+        super(WriteCombinerTestCase, self).setUp()
+        self.client = Client(self.host, self.port)
+        self.client.connect()
+
+    def tearDown(self):
+        super(WriteCombinerTestCase, self).tearDown()
+        self.client.close()
+
+    def test_put_delete(self):
+        key1 = self.buildKey(1)
+        key2 = self.buildKey(2)
+        self.client.put(key2, 'value')
+        with WriteCombiner(self.client) as combiner:
+            f1 = combiner.put(key1, 'value')
+            f2 = combiner.delete(key2)
+        self.assertEqual(f1.result(), None)
+        self.assertEqual(f2.result(), True)
+        self.assertEqual(self.client.get(key1).value, 'value')
+        self.assertEqual(self.client.get(key2), None)
+
+    def test_window_timeout(self):
+        key = self.buildKey(1)
+        combiner = WriteCombiner(self.client, max_delay=0.01)
+        combiner.put(key, 'value').result()
+        self.assertEqual(self.client.get(key).value, 'value')
+
+    def test_window_size(self):
+        keys = [self.buildKey(i) for i in range(5)]
+        combiner = WriteCombiner(self.client, max_delay=60, max_operations=2)
+        futures = [combiner.put(k, 'value') for k in keys]
+        # the first two groups are already on their way
+        futures[1].result()
+        combiner.close()
+        for k in keys:
+            self.assertEqual(self.client.get(k).value, 'value')
+
+    def test_collapse_same_key(self):
+        key = self.buildKey(1)
+        combiner = WriteCombiner(self.client, max_delay=60)
+        f1 = combiner.put(key, 'value1')
+        f2 = combiner.put(key, 'value2')
+        combiner.close()
+        self.assertEqual(f1.result(), None)
+        self.assertEqual(f2.result(), None)
+        self.assertEqual(self.client.get(key).value, 'value2')
+
+    def test_rejected_write(self):
+        key = self.buildKey(1)
+        combiner = WriteCombiner(self.client)
+        f1 = combiner.put(self.buildKey('x' * (common.MAX_KEY_SIZE + 1)), 'value')
+        f2 = combiner.put(key, 'value')
+        combiner.close()
+        self.assertRaises(common.KineticClientException, f1.result)
+        self.assertEqual(f2.result(), None)
+
+
+if __name__ == '__main__':
+    unittest.main()
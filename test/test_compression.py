@@ -0,0 +1,145 @@
+# Copyright 2013-2015 Seagate Technology LLC.
+#
+# This Source Code Form is subject to the terms of the Mozilla
+# Public License, v. 2.0. If a copy of the MPL was not
+# distributed with this file, You can obtain one at
+# https://mozilla.org/MP:/2.0/.
+#
+# This program is distributed in the hope that it will be useful,
+# but is provided AS-IS, WITHOUT ANY WARRANTY; including without
+# the implied warranty of MERCHANTABILITY, NON-INFRINGEMENT or
+# FITNESS FOR A PARTICULAR PURPOSE. See the Mozilla Public
+# License for more details.
+#
+# See www.openkinetic.org for more project information
+#
+
+import json
+import os
+import unittest
+
+from kinetic import Client
+from kinetic import CompressionPolicy
+from kinetic import Compressor
+from kinetic import compression
+from kinetic import common
+from kinetic import dictionary
+from kinetic.common import KineticClientException
+from base import BaseTestCase
+
+
+def records(count):
+    return json.dumps([{'id': i, 'name': 'record %d' % i, 'tags': ['a', 'b']}
+                       for i in range(count)])
+
+
+class CompressorTestCase(unittest.TestCase):
+
+    def test_round_trip(self):
+        data = records(100)
+        for codec in compression.CODECS:
+            c = Compressor(CompressionPolicy(codec))
+            stored = c.encode('key', data)
+            self.assertTrue(stored.startswith(compression.MAGIC))
+            self.assertTrue(len(stored) < len(data) / 2)
+            self.assertEqual(c.decode(stored), data)
+            self.assertEqual(c.decode(bytearray(stored)), data)
+            stats = c.stats[codec]
+            self.assertEqual((stats.compressed, stats.decoded), (1, 2))
+            self.assertTrue(stats.ratio > 2)
+
+    def test_skipped(self):
+        c = Compressor(CompressionPolicy(min_size=100, sample_size=1000))
+        # too small
+        self.assertEqual(c.decode(c.encode('key', 'x' * 50)), 'x' * 50)
+        # the sample does not compress
+        noise = os.urandom(100000)
+        stored = c.encode('key', noise)
+        self.assertEqual(len(stored), len(noise) + 4)
+        self.assertEqual(c.decode(stored), noise)
+        self.assertEqual(c.stats['zlib'].skipped, 2)
+        self.assertEqual(c.stats['zlib'].compressed, 0)
+        self.assertEqual(c.stats['none'].bytes_in, 100050)
+
+    def test_max_value_size(self):
+        c = Compressor()
+        noise = 'x' + os.urandom(common.MAX_VALUE_SIZE - 1)
+        # no room for the header, stored as is
+        stored = c.encode('key', noise)
+        self.assertEqual(stored, noise)
+        self.assertEqual(c.decode(stored), noise)
+        self.assertEqual(len(c.encode('key', noise[4:])), common.MAX_VALUE_SIZE)
+        # would read back as encoded
+        self.assertRaises(KineticClientException, c.encode, 'key', compression.MAGIC + noise[3:])
+
+    def test_prefixes(self):
+        c = Compressor(CompressionPolicy('zlib'),
+                       {'logs/': CompressionPolicy('bz2'), 'logs/raw/': CompressionPolicy(None)})
+        self.assertEqual(c.policyFor('data').codec, 'zlib')
+        self.assertEqual(c.policyFor('logs/x').codec, 'bz2')
+        self.assertEqual(c.policyFor('logs/raw/x').codec, None)
+        data = records(50)
+        self.assertEqual(c.encode('logs/raw/x', data), compression.MAGIC + '\0' + data)
+        c.encode('logs/x', data)
+        self.assertEqual(c.stats['bz2'].compressed, 1)
+
+    def test_reserved_keys(self):
+        c = Compressor(CompressionPolicy('zlib', min_size=0))
+        key = dictionary.RESERVED_PREFIX + 'x'
+        value = compression.MAGIC + '\0' + records(50)
+        self.assertEqual(c.encode(key, value), value)
+        self.assertEqual(c.decode(value, key), value)
+        self.assertEqual(c.decode(value), records(50))
+        self.assertEqual(c.stats['none'].bytes_in, 0)
+
+    def test_plain_values(self):
+        c = Compressor()
+        self.assertEqual(c.decode('plain value'), 'plain value')
+        self.assertEqual(c.decode(''), '')
+        self.assertRaises(KineticClientException, c.decode, compression.MAGIC + '\x7fdata')
+
+    def test_unknown_codec(self):
+        self.assertRaises(ValueError, CompressionPolicy, 'snappy')
+
+
+class CompressedClientTestCase(BaseTestCase):
+
+    def setUp(self):
+        super(CompressedClientTestCase, self).setUp()
+        self.compressor = Compressor()
+        self.client = Client(self.host, self.port, compression=self.compressor)
+        self.client.connect()
+        self.raw = Client(self.host, self.port)
+        self.raw.connect()
+
+    def tearDown(self):
+        super(CompressedClientTestCase, self).tearDown()
+        self.raw.close()
+
+    def test_put_get(self):
+        data = records(200)
+        self.client.put(self.buildKey(1), data)
+        self.assertEqual(self.client.get(self.buildKey(1)).value, data)
+        stored = self.raw.get(self.buildKey(1)).value
+        self.assertTrue(len(stored) < len(data) / 2)
+        self.assertEqual(self.compressor.decode(stored), data)
+
+    def test_async_and_next(self):
+        data = records(100)
+        self.client.putAsync(lambda _: None, self.fail, self.buildKey(1), data)
+        self.client.putAsync(lambda _: None, self.fail, self.buildKey(2), bytearray(data))
+        self.client.wait()
+        values = []
+        self.client.getAsync(lambda e: values.append(e.value), self.fail, self.buildKey(1))
+        self.client.wait()
+        self.assertEqual(values, [data])
+        self.assertEqual(self.client.getNext(self.buildKey(1)).value, data)
+
+    def test_uncompressed_values(self):
+        self.raw.put(self.buildKey(1), 'written without compression')
+        self.assertEqual(self.client.get(self.buildKey(1)).value, 'written without compression')
+        self.assertEqual(self.client.getMetadata(self.buildKey(1)).value, '')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,147 @@
+# Copyright 2013-2015 Seagate Technology LLC.
+#
+# This Source Code Form is subject to the terms of the Mozilla
+# Public License, v. 2.0. If a copy of the MPL was not
+# distributed with this file, You can obtain one at
+# https://mozilla.org/MP:/2.0/.
+#
+# This program is distributed in the hope that it will be useful,
+# but is provided AS-IS, WITHOUT ANY WARRANTY; including without
+# the implied warranty of MERCHANTABILITY, NON-INFRINGEMENT or
+# FITNESS FOR A PARTICULAR PURPOSE. See the Mozilla Public
+# License for more details.
+#
+# See www.openkinetic.org for more project information
+#
+
+import json
+import random
+import unittest
+import zlib
+
+from kinetic import Client
+from kinetic import CompressionPolicy
+from kinetic import Compressor
+from kinetic import DictionaryStore
+from kinetic import dictionary
+from kinetic.common import KineticClientException
+from base import BaseTestCase
+
+
+def record(rnd, i):
+    return json.dumps({'id': i, 'user': 'user%d' % rnd.randint(1, 10000),
+                       'status': rnd.choice(['active', 'disabled', 'pending']),
+                       'created': '2026-10-%02dT%02d:00:00Z' % (rnd.randint(1, 28), rnd.randint(0, 23)),
+                       'address': {'city': rnd.choice(['Springfield', 'Shelbyville']),
+                                   'street': '%d Main Street' % rnd.randint(1, 999)}})
+
+
+def records(count, seed=0):
+    rnd = random.Random(seed)
+    return [record(rnd, i) for i in range(count)]
+
+
+class TrainTestCase(unittest.TestCase):
+
+    def test_train(self):
+        d = dictionary.train(records(300), size=2048)
+        self.assertTrue(0 < len(d) <= 2048)
+        self.assertTrue('"status": "' in d)
+        self.assertRaises(ValueError, dictionary.train, [], size=64 * 1024)
+
+    def test_better_than_plain_zlib(self):
+        primed = dictionary._Primed(dictionary.train(records(300)), 6)
+        values = records(50, seed=1)
+        with_dict = sum(len(primed.compress(v)) for v in values)
+        plain = sum(len(zlib.compress(v, 6)) for v in values)
+        self.assertTrue(with_dict * 2 < plain)
+        for v in values:
+            self.assertEqual(primed.decompress(primed.compress(v)), v)
+
+
+class DictionaryStoreTestCase(BaseTestCase):
+
+    def setUp(self):
+        super(DictionaryStoreTestCase, self).setUp()
+        self.client = Client(self.host, self.port)
+        self.client.connect()
+        self.name = self.buildKey('records')
+
+    def tearDown(self):
+        # dictionaries are outside the test keys
+        prefix = dictionary.DICTIONARY_PREFIX + self.name
+        for k in self.client.getKeyRange(prefix, prefix + '\xff'):
+            self.client.delete(k, force=True)
+        super(DictionaryStoreTestCase, self).tearDown()
+
+    def compressing(self, store):
+        c = Client(self.host, self.port, compression=Compressor(CompressionPolicy('zdict', dictionary=store)))
+        c.connect()
+        return c
+
+    def test_publish_versions(self):
+        store = DictionaryStore(self.client, self.name)
+        self.assertEqual(store.versions(), [])
+        self.assertEqual(store.publish('first'), 1)
+        # another writer got version 2 first
+        self.client.put(store.key(2), 'second', new_version='1')
+        self.assertEqual(store.publish('third'), 3)
+        self.assertEqual(store.current, 3)
+        other = DictionaryStore(self.client, self.name)
+        self.assertEqual(other.load(), 3)
+        self.assertEqual(other.dictionary(2), 'second')
+
+    def test_nested_names(self):
+        store = DictionaryStore(self.client, self.name)
+        nested = DictionaryStore(self.client, self.name + '/nested')
+        self.assertEqual(nested.publish('nested'), 1)
+        self.assertEqual(store.versions(), [])
+        self.assertEqual(store.publish('outer'), 1)
+        self.assertEqual(nested.publish('nested again'), 2)
+        self.assertEqual(store.versions(), [1])
+        self.assertEqual(nested.versions(), [1, 2])
+
+    def test_compressed_values(self):
+        store = DictionaryStore(self.client, self.name)
+        c = self.compressing(store)
+        values = records(20, seed=1)
+        # no dictionary yet
+        c.put(self.buildKey(0), values[0])
+        self.assertEqual(len(self.client.get(self.buildKey(0)).value), len(values[0]) + 4)
+
+        store.train(records(300))
+        for i, v in enumerate(values):
+            c.put(self.buildKey(i), v)
+        for i, v in enumerate(values):
+            self.assertEqual(c.get(self.buildKey(i)).value, v)
+        stored = sum(len(self.client.get(self.buildKey(i)).value) for i in range(20))
+        self.assertTrue(stored * 2 < sum(len(v) for v in values))
+        stats = c.compression.stats['zdict']
+        self.assertEqual(stats.compressed, 20)
+        self.assertEqual(stats.decoded, 20)
+        c.close()
+
+    def test_old_versions_readable(self):
+        store = DictionaryStore(self.client, self.name)
+        c = self.compressing(store)
+        store.train(records(300, seed=2))
+        value = records(1, seed=3)[0]
+        c.put(self.buildKey(1), value)
+        store.train(records(300, seed=4))
+        c.put(self.buildKey(2), value)
+        c.close()
+
+        # a new client only knows the name, versions are read when needed
+        reader = self.compressing(DictionaryStore(self.client, self.name))
+        self.assertEqual(reader.get(self.buildKey(1)).value, value)
+        self.assertEqual(reader.get(self.buildKey(2)).value, value)
+        reader.close()
+
+        plain = Client(self.host, self.port, compression=Compressor())
+        plain.connect()
+        self.assertRaises(KineticClientException, plain.get, self.buildKey(1))
+        plain.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+# Copyright 2013-2015 Seagate Technology LLC.
+#
+# This Source Code Form is subject to the terms of the Mozilla
+# Public License, v. 2.0. If a copy of the MPL was not
+# distributed with this file, You can obtain one at
+# https://mozilla.org/MP:/2.0/.
+#
+# This program is distributed in the hope that it will be useful,
+# but is provided AS-IS, WITHOUT ANY WARRANTY; including without
+# the implied warranty of MERCHANTABILITY, NON-INFRINGEMENT or
+# FITNESS FOR A PARTICULAR PURPOSE. See the Mozilla Public
+# License for more details.
+#
+# See www.openkinetic.org for more project information
+#
+
+import unittest
+
+from kinetic import Client
+from kinetic import DurableWriter
+from kinetic import KineticMessageException
+from kinetic.common import Synchronization
+from base import BaseTestCase
+
+
+class DurableWriterTestCase(BaseTestCase):
+
+    def setUp(self):
+        super(DurableWriterTestCase, self).setUp()
+        self.client = Client(self.host, self.port)
+        self.client.connect()
+
+    def tearDown(self):
+        super(DurableWriterTestCase, self).tearDown()
+        self.client.close()
+
+    def test_put_delete(self):
+        key1 = self.buildKey(1)
+        key2 = self.buildKey(2)
+        self.client.put(key2, 'value')
+        with DurableWriter(self.client) as writer:
+            f1 = writer.put(key1, 'value')
+            f2 = writer.delete(key2)
+            f3 = writer.delete(self.buildKey(3))
+        self.assertEqual(f1.result(), None)
+        self.assertEqual(f2.result(), True)
+        self.assertEqual(f3.result(), False)
+        self.assertEqual(self.client.get(key1).value, 'value')
+        self.assertEqual(self.client.get(key2), None)
+
+    def test_flushes_coalesced(self):
+        keys = [self.buildKey(i) for i in range(20)]
+        writer = DurableWriter(self.client, max_delay=60, max_operations=5)
+        futures = [writer.put(k, 'value') for k in keys]
+        writer.flush()
+        writer.close()
+        for f in futures:
+            self.assertEqual(f.result(), None)
+        self.assertEqual(writer.writes, 20)
+        self.assertTrue(0 < writer.flushes < 20)
+
+    def test_synchronization(self):
+        sent = []
+        putAsync = self.client.putAsync
+
+        def recording(*args, **kwargs):
+            sent.append(kwargs['synchronization'])
+            return putAsync(*args, **kwargs)
+        self.client.putAsync = recording
+        with DurableWriter(self.client) as writer:
+            writer.put(self.buildKey(1), 'value')
+            writer.put(self.buildKey(2), 'value', synchronization=Synchronization.WRITETHROUGH)
+        self.assertEqual(sent, [Synchronization.WRITEBACK, Synchronization.WRITETHROUGH])
+
+    def test_failed_write(self):
+        key = self.buildKey(1)
+        self.client.put(key, 'value', new_version='1')
+        writer = DurableWriter(self.client)
+        f = writer.put(key, 'value2', version='2')
+        writer.close()
+        self.assertRaises(KineticMessageException, f.result)
+        self.assertEqual(self.client.get(key).value, 'value')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,225 @@
+# Copyright 2013-2015 Seagate Technology LLC.
+#
+# This Source Code Form is subject to the terms of the Mozilla
+# Public License, v. 2.0. If a copy of the MPL was not
+# distributed with this file, You can obtain one at
+# https://mozilla.org/MP:/2.0/.
+#
+# This program is distributed in the hope that it will be useful,
+# but is provided AS-IS, WITHOUT ANY WARRANTY; including without
+# the implied warranty of MERCHANTABILITY, NON-INFRINGEMENT or
+# FITNESS FOR A PARTICULAR PURPOSE. See the Mozilla Public
+# License for more details.
+#
+# See www.openkinetic.org for more project information
+#
+
+import itertools
+import os
+import tempfile
+import unittest
+import eventlet
+
+from kinetic import ErasureCodedCluster
+from kinetic.common import KineticClientException
+from kinetic.common import KineticException
+from kinetic.erasure import ReedSolomon
+from kinetic.zero_copy import ZeroCopyValue
+from base import MultiSimulatorTestCase
+
+
+class FlakyClient(object):
+    # fails the next put, then runs hook before the one after
+
+    def __init__(self, client, hook):
+        self.client = client
+        self.hook = hook
+        self.failed = False
+
+    def putAsync(self, onSuccess, onError, *args, **kwargs):
+        if not self.failed:
+            self.failed = True
+            onError(KineticException('Lost the put.'))
+            return
+        hook, self.hook = self.hook, None
+        if hook:
+            hook()
+        self.client.putAsync(onSuccess, onError, *args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+
+class RacingClient(object):
+    # runs hook before the next put
+
+    def __init__(self, client, hook):
+        self.client = client
+        self.hook = hook
+
+    def _run(self):
+        hook, self.hook = self.hook, None
+        if hook:
+            hook()
+
+    def putAsync(self, *args, **kwargs):
+        self._run()
+        self.client.putAsync(*args, **kwargs)
+
+    def put(self, *args, **kwargs):
+        self._run()
+        return self.client.put(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+
+class ReedSolomonTestCase(unittest.TestCase):
+
+    def test_any_k_fragments(self):
+        rs = ReedSolomon(4, 2)
+        data = os.urandom(1001)
+        fragments = rs.encode(data)
+        self.assertEqual(len(fragments), 6)
+        self.assertEqual(''.join(fragments[:4])[:1001], data)
+        for indexes in itertools.combinations(range(6), 4):
+            available = dict((i, fragments[i]) for i in indexes)
+            self.assertEqual(rs.decode(available, len(data)), data)
+
+    def test_too_few_fragments(self):
+        rs = ReedSolomon(3, 2)
+        fragments = rs.encode('value')
+        self.assertRaises(ValueError, rs.decode, {0: fragments[0], 4: fragments[4]}, 5)
+
+    def test_empty(self):
+        rs = ReedSolomon(2, 1)
+        self.assertEqual(rs.decode({1: '', 2: ''}, 0), '')
+
+
+class ErasureCodedClusterTestCase(MultiSimulatorTestCase):
+
+    PORTS = (9010, 9020, 9030)
+
+    def setUp(self):
+        super(ErasureCodedClusterTestCase, self).setUp()
+        self.cluster = ErasureCodedCluster([('localhost', port) for port in self.ports],
+                                           data_fragments=2, parity_fragments=1)
+        self.cluster.connect()
+
+    def tearDown(self):
+        self.cluster.close()
+        super(ErasureCodedClusterTestCase, self).tearDown()
+
+    def fragments(self, key):
+        return [self.cluster.clients[n] for n in self.cluster.replicasFor(key)]
+
+    def test_put_get(self):
+        key = self.buildKey(1)
+        value = os.urandom(10000)
+        self.cluster.put(key, value)
+        eventlet.sleep(0.1)
+        for c in self.fragments(key):
+            self.assertTrue(len(c.get(key).value) < 6000)
+        entry = self.cluster.get(key)
+        self.assertEqual(entry.value, value)
+        self.assertEqual(entry.metadata.version, self.cluster.getVersion(key))
+        self.assertEqual(self.cluster.degraded_reads, 0)
+        self.assertEqual(self.cluster.get(self.buildKey(2)), None)
+
+    def test_put_from_file(self):
+        key = self.buildKey(1)
+        value = os.urandom(10000)
+        with tempfile.TemporaryFile() as f:
+            f.write(value)
+            f.flush()
+            self.cluster.put(key, ZeroCopyValue(f, 1000))
+        self.assertEqual(self.cluster.get(key).value, value[1000:])
+
+    def test_degraded_read(self):
+        key = self.buildKey(1)
+        self.cluster.put(key, 'value' * 100)
+        eventlet.sleep(0.1)
+        self.fragments(key)[0].delete(key, force=True)
+        self.assertEqual(self.cluster.get(key).value, 'value' * 100)
+        self.assertEqual(self.cluster.degraded_reads, 1)
+
+    def test_stale_fragment(self):
+        key = self.buildKey(1)
+        self.cluster.put(key, 'old', new_version='1')
+        eventlet.sleep(0.1)
+        stale = self.fragments(key)[1]
+        old = stale.get(key).value
+        self.cluster.put(key, 'new value', version='1', new_version='2')
+        eventlet.sleep(0.1)
+        stale.put(key, old, new_version='1', force=True)
+        entry = self.cluster.get(key)
+        self.assertEqual(entry.value, 'new value')
+        self.assertEqual(entry.metadata.version, '2')
+
+    def test_repair_keeps_newer_write(self):
+        cluster = ErasureCodedCluster([('localhost', port) for port in self.ports],
+                                      data_fragments=2, parity_fragments=1, write_quorum=2)
+        cluster.connect()
+        try:
+            key = self.buildKey(1)
+            cluster.put(key, 'old', new_version='1')
+            eventlet.sleep(0.1)
+            name = cluster.replicasFor(key)[0]
+            client = cluster.clients[name]
+            # written again before the repair of the lost fragment gets there
+            cluster.clients[name] = FlakyClient(
+                client, lambda: client.put(key, 'newer', force=True, new_version='x'))
+            cluster.put(key, 'new value', new_version='2', force=True)
+            eventlet.sleep(0.5)
+            self.assertEqual(client.get(key).value, 'newer')
+            self.assertEqual(cluster.repair_failures, 0)
+        finally:
+            cluster.close()
+
+    def test_not_enough_drives(self):
+        cluster = ErasureCodedCluster([('localhost', port) for port in self.ports],
+                                      data_fragments=3, parity_fragments=1)
+        self.assertRaises(KineticClientException, cluster.put, self.buildKey(1), 'value')
+
+    def test_delete_and_many(self):
+        items = [(self.buildKey(i), 'value%d' % i) for i in range(10)]
+        self.cluster.putMany(items)
+        self.assertEqual([e.value for e in self.cluster.getMany([k for k, _ in items])],
+                         [v for _, v in items])
+        self.assertTrue(self.cluster.delete(items[0][0], force=True))
+        self.assertEqual(self.cluster.get(items[0][0]), None)
+
+    def test_rebalance(self):
+        key = self.buildKey(1)
+        names = self.cluster.replicasFor(key)
+        self.cluster.put(key, 'value', new_version='1')
+        eventlet.sleep(0.1)
+        # swap the fragments of two drives
+        a, b = [self.cluster.clients[n] for n in names[:2]]
+        va, vb = a.get(key).value, b.get(key).value
+        a.put(key, vb, new_version='1', force=True)
+        b.put(key, va, new_version='1', force=True)
+        self.assertEqual(self.cluster.rebalance(), 1)
+        self.assertEqual(a.get(key).value, va)
+        self.assertEqual(self.cluster.get(key).value, 'value')
+
+    def test_rebalance_keeps_newer_write(self):
+        key = self.buildKey(1)
+        names = self.cluster.replicasFor(key)
+        self.cluster.put(key, 'value', new_version='1')
+        eventlet.sleep(0.1)
+        a, b = [self.cluster.clients[n] for n in names[:2]]
+        va, vb = a.get(key).value, b.get(key).value
+        a.put(key, vb, new_version='1', force=True)
+        b.put(key, va, new_version='1', force=True)
+        # written again while the rebalance rewrites the fragments
+        self.cluster.clients[names[0]] = RacingClient(
+            a, lambda: self.cluster.put(key, 'newer', version='1', new_version='2'))
+        self.cluster.rebalance()
+        eventlet.sleep(0.1)
+        self.assertEqual([c.getVersion(key) for c in self.fragments(key)], ['2'] * 3)
+        self.assertEqual(self.cluster.get(key).value, 'newer')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,141 @@
+# Copyright 2013-2015 Seagate Technology LLC.
+#
+# This Source Code Form is subject to the terms of the Mozilla
+# Public License, v. 2.0. If a copy of the MPL was not
+# distributed with this file, You can obtain one at
+# https://mozilla.org/MP:/2.0/.
+#
+# This program is distributed in the hope that it will be useful,
+# but is provided AS-IS, WITHOUT ANY WARRANTY; including without
+# the implied warranty of MERCHANTABILITY, NON-INFRINGEMENT or
+# FITNESS FOR A PARTICULAR PURPOSE. See the Mozilla Public
+# License for more details.
+#
+# See www.openkinetic.org for more project information
+#
+
+import datetime
+import random
+import unittest
+
+from kinetic import buildRange
+from kinetic import keycodec
+from kinetic import utils
+from base import BaseTestCase
+
+
+class UTC(datetime.tzinfo):
+
+    def __init__(self, hours=0):
+        self.offset = datetime.timedelta(hours=hours)
+
+    def utcoffset(self, dt): return self.offset
+
+    def dst(self, dt): return datetime.timedelta(0)
+
+
+def values(rnd):
+    return [None, 0, 1, -1, 255, 256, -255, -256, 2 ** 63 - 1, -2 ** 63, 2 ** 64 - 1,
+            -(2 ** 64 - 1), rnd.randint(-2 ** 40, 2 ** 40), '', 'a', 'a\x00', 'a\x00b', 'a\xff',
+            '\x00', u'', u'a', u'\xe9', u'a\x00', datetime.datetime(1900, 1, 1),
+            datetime.datetime(1970, 1, 1), datetime.datetime(2026, 10, 19, 12, 30, 0, 250)]
+
+
+def typed(t):
+    # what tuple comparison would be with elements ordered by type code
+    order = {type(None): 0, str: 1, unicode: 2, int: 3, long: 3, datetime.datetime: 4}
+    return [(order[type(v)], v) for v in t]
+
+
+class RangeTestCase(unittest.TestCase):
+
+    def test_prefix_end(self):
+        self.assertEqual(utils.prefixEnd('abc'), 'abd')
+        self.assertEqual(utils.prefixEnd('ab\xff'), 'ac')
+        self.assertEqual(utils.prefixEnd('a\xff\xff'), 'b')
+        self.assertEqual(utils.prefixEnd('\xff\xff'), None)
+        self.assertEqual(utils.prefixEnd(''), None)
+        self.assertEqual(utils.successor('a'), 'a\x00')
+
+    def test_build_range_overflow(self):
+        r = buildRange('a\xff')
+        self.assertEqual((r.startKey, r.endKey, r.endKeyInclusive), ('a\xff', 'b', False))
+        r = buildRange('\xff')
+        self.assertEqual(r.endKey, utils.LAST_KEY)
+        self.assertTrue(r.endKeyInclusive)
+
+
+class KeyCodecTestCase(unittest.TestCase):
+
+    def test_round_trip(self):
+        rnd = random.Random(0)
+        for v in values(rnd):
+            self.assertEqual(keycodec.unpack(keycodec.pack((v,))), (v,))
+        t = (u'users', 42, 'id\x00', None, datetime.datetime(2026, 1, 1))
+        key = keycodec.pack(t, prefix='app/')
+        self.assertTrue(key.startswith('app/'))
+        self.assertEqual(keycodec.unpack(key, prefix='app/'), t)
+        self.assertRaises(ValueError, keycodec.unpack, key, 'other/')
+
+    def test_order(self):
+        rnd = random.Random(1)
+        vs = values(rnd)
+        tuples = [tuple(rnd.choice(vs) for _ in range(rnd.randint(0, 3))) for _ in range(2000)]
+        by_key = sorted(tuples, key=keycodec.pack)
+        self.assertEqual([typed(t) for t in by_key], sorted(typed(t) for t in tuples))
+
+    def test_timestamps(self):
+        naive = datetime.datetime(2026, 10, 19, 12, 0)
+        aware = datetime.datetime(2026, 10, 19, 14, 0, tzinfo=UTC(2))
+        self.assertEqual(keycodec.pack((naive,)), keycodec.pack((aware,)))
+        self.assertEqual(keycodec.unpack(keycodec.pack((aware,))), (naive,))
+
+    def test_unsupported(self):
+        self.assertRaises(TypeError, keycodec.pack, (1.5,))
+        self.assertRaises(ValueError, keycodec.pack, (2 ** 64,))
+        self.assertRaises(ValueError, keycodec.unpack, '\x01abc')
+        self.assertRaises(ValueError, keycodec.unpack, '\xfe')
+
+    def test_tuple_range(self):
+        r = keycodec.tupleRange(('a',))
+        inside = [('a',), ('a', 1), ('a', '\xff\xff'), ('a', None)]
+        outside = [(), ('a\x00',), ('a\xff',), ('b',), ('',), (u'a',)]
+        for t in inside:
+            self.assertTrue(r.startKey <= keycodec.pack(t) < r.endKey, t)
+        for t in outside:
+            self.assertFalse(r.startKey <= keycodec.pack(t) < r.endKey, t)
+
+    def test_pack_many(self):
+        rnd = random.Random(2)
+        rows = [(i, 'user%d' % i, -i * 1000003, rnd.choice([None, 'a\x00', u'\xe9', 7]),
+                 datetime.datetime(2026, 1, 1) + datetime.timedelta(seconds=i)) for i in range(500)]
+        keys = keycodec.packMany(rows, prefix='p/')
+        self.assertEqual(keys, [keycodec.pack(r, 'p/') for r in rows])
+        self.assertEqual(keycodec.unpackMany(keys, prefix='p/'), rows)
+        # integers too large for 64 bit columns, rows of different lengths
+        rows = [(2 ** 64 - 1, ''), (1, 'a'), (0,), ()]
+        self.assertEqual(keycodec.packMany(rows), [keycodec.pack(r) for r in rows])
+        self.assertEqual(keycodec.packMany([]), [])
+
+
+class KeyRangeTestCase(BaseTestCase):
+
+    def test_range_queries(self):
+        prefix = self.buildKey('index/')
+        rows = [(u'orders', 1, -5), (u'orders', 1, 3), (u'orders', 2, 0), (u'orders', 255, 1),
+                (u'orders', 256, 1), (u'orders\x00', 1, 1), (u'users', -1, 1)]
+        for key in keycodec.packMany(rows, prefix):
+            self.client.put(key, 'x')
+
+        r = keycodec.tupleRange((u'orders',), prefix)
+        self.assertEqual(keycodec.unpackMany(r.getFrom(self.client), prefix), rows[:5])
+        r = keycodec.tupleRange((u'orders', 1), prefix)
+        self.assertEqual(keycodec.unpackMany(r.getFrom(self.client), prefix), rows[:2])
+        # resumes after the last key of a page
+        first = keycodec.pack(rows[0], prefix)
+        keys = self.client.getKeyRange(utils.successor(first), r.endKey, True, False)
+        self.assertEqual(keycodec.unpackMany(keys, prefix), rows[1:2])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,252 @@
+# Copyright 2013-2015 Seagate Technology LLC.
+#
+# This Source Code Form is subject to the terms of the Mozilla
+# Public License, v. 2.0. If a copy of the MPL was not
+# distributed with this file, You can obtain one at
+# https://mozilla.org/MP:/2.0/.
+#
+# This program is distributed in the hope that it will be useful,
+# but is provided AS-IS, WITHOUT ANY WARRANTY; including without
+# the implied warranty of MERCHANTABILITY, NON-INFRINGEMENT or
+# FITNESS FOR A PARTICULAR PURPOSE. See the Mozilla Public
+# License for more details.
+#
+# See www.openkinetic.org for more project information
+#
+
+import hashlib
+import mmap
+import os
+import tempfile
+import unittest
+from StringIO import StringIO
+import eventlet
+
+from kinetic import Client
+from kinetic import Compressor
+from kinetic import common
+from kinetic import largeobject
+from base import BaseTestCase
+
+
+class DelayedClient(object):
+    # fails the put of the first key and delays the others
+
+    def __init__(self, client, delay):
+        self.client = client
+        self.delay = delay
+        self.failed = False
+
+    def putAsync(self, onSuccess, onError, *args, **kwargs):
+        if not self.failed:
+            self.failed = True
+            onError(common.KineticClientException("Put failed."))
+        else:
+            eventlet.spawn_after(self.delay, self.client.putAsync, onSuccess, onError,
+                                 *args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+
+class LargeObjectTestCase(BaseTestCase):
+
+    def setUp(self):
+        super(LargeObjectTestCase, self).setUp()
+        self.clients = [Client(self.host, self.port) for _ in range(2)]
+        for c in self.clients:
+            c.connect()
+        self.client = self.clients[0]
+
+    def tearDown(self):
+        super(LargeObjectTestCase, self).tearDown()
+        for c in self.clients:
+            c.close()
+
+    def test_put_get(self):
+        key = self.buildKey(1)
+        data = os.urandom(common.MAX_VALUE_SIZE * 2 + 100)
+        manifest = largeobject.putLarge(self.clients, key, data)
+        self.assertEqual(manifest.chunks, 3)
+        self.assertEqual(largeobject.getLarge(self.clients, key), data)
+        self.assertEqual(str(bytearray().join(largeobject.iterLarge(self.clients, key))), data)
+
+    def test_stream_source(self):
+        key = self.buildKey(1)
+        data = os.urandom(10000)
+        manifest = largeobject.putLarge(self.clients, key, StringIO(data), chunk_size=999)
+        self.assertEqual(manifest.size, 10000)
+        self.assertEqual(manifest.chunks, 11)
+        self.assertEqual(largeobject.getLarge(self.clients, key), data)
+
+    def test_file_source(self):
+        key = self.buildKey(1)
+        data = os.urandom(10000)
+        with tempfile.TemporaryFile() as f:
+            f.write(data)
+            f.seek(100)
+            manifest = largeobject.putLarge(self.clients, key, f, chunk_size=999)
+            self.assertEqual(f.tell(), 10000)
+        self.assertEqual(manifest.size, 9900)
+        self.assertEqual(largeobject.getLarge(self.clients, key), data[100:])
+        # chunks sent from the file are tagged with their SHA1
+        m = self.client.getMetadata(manifest.chunkKey(key, 1)).metadata
+        self.assertEqual(m.algorithm, common.IntegrityAlgorithms.SHA1)
+        self.assertEqual(m.tag, hashlib.sha1(data[1099:2098]).digest())
+
+    def test_get_into(self):
+        key = self.buildKey(1)
+        data = os.urandom(5000)
+        largeobject.putLarge(self.clients, key, data, chunk_size=1000)
+        buf = bytearray(5010)
+        self.assertEqual(largeobject.getLargeInto(self.clients, key, buf, offset=10), 5000)
+        self.assertEqual(str(buf[10:]), data)
+        self.assertRaises(ValueError, largeobject.getLargeInto, self.clients, key, bytearray(100))
+        with tempfile.TemporaryFile() as f:
+            largeobject.getLargeInto(self.clients, key, f.fileno(), offset=3)
+            f.seek(3)
+            self.assertEqual(f.read(), data)
+            m = mmap.mmap(f.fileno(), 5003)
+            m[:] = '\0' * 5003
+            largeobject.getLargeInto(self.clients, key, m)
+            self.assertEqual(m[:5000], data)
+            m.close()
+        f = StringIO()
+        largeobject.getLargeInto(self.clients, key, f)
+        self.assertEqual(f.getvalue(), data)
+
+    def test_replace_removes_old_chunks(self):
+        key = self.buildKey(1)
+        old = largeobject.putLarge(self.clients, key, 'a' * 3000, chunk_size=1000)
+        largeobject.putLarge(self.clients, key, 'b' * 1500, chunk_size=1000)
+        self.assertEqual(largeobject.getLarge(self.clients, key), 'b' * 1500)
+        for k in old.chunkKeys(key):
+            self.assertEqual(self.client.get(k), None)
+
+    def test_manifest_version(self):
+        key = self.buildKey(1)
+        largeobject.putLarge(self.clients, key, 'a' * 3000, chunk_size=1000, new_version='1')
+        self.assertRaises(common.KineticMessageException, largeobject.putLarge,
+                          self.clients, key, 'b' * 3000, chunk_size=1000, version='2')
+        # failed upload left no chunks behind
+        keys = self.client.getKeyRange(key + '/', key + '/\xff')
+        self.assertEqual(len(keys), 3)
+        self.assertEqual(largeobject.getLarge(self.clients, key), 'a' * 3000)
+
+    def test_failed_upload_waits_for_chunks(self):
+        key = self.buildKey(1)
+        clients = [DelayedClient(self.client, 0.05)]
+        self.assertRaises(common.KineticClientException, largeobject.putLarge,
+                          clients, key, 'a' * 3000, chunk_size=1000)
+        eventlet.sleep(0.1)
+        # the chunks still being written when the first one failed are gone
+        self.assertEqual(self.client.getKeyRange(key, key + '/\xff'), [])
+
+    def test_delete(self):
+        key = self.buildKey(1)
+        manifest = largeobject.putLarge(self.clients, key, 'a' * 3000, chunk_size=1000)
+        self.assertTrue(largeobject.deleteLarge(self.clients, key))
+        self.assertEqual(largeobject.getLarge(self.clients, key), None)
+        self.assertEqual(self.client.get(manifest.chunkKey(key, 0)), None)
+        self.assertFalse(largeobject.deleteLarge(self.clients, key))
+
+    def test_update_in_batch(self):
+        key = self.buildKey(1)
+        data = bytearray(os.urandom(5000))
+        manifest = largeobject.putLarge(self.clients, key, str(data), chunk_size=1000)
+        data[2500:2510] = 'x' * 10
+        self.assertEqual(largeobject.updateLarge(self.clients, key, str(data)), 1)
+        self.assertEqual(largeobject.getLarge(self.clients, key), str(data))
+        # the changed chunk went under a new key, the one it replaces is gone
+        keys = largeobject.getManifest(self.clients, key).chunkKeys(key)
+        old = manifest.chunkKeys(key)
+        self.assertEqual([i for i in range(5) if keys[i] != old[i]], [2])
+        self.assertEqual(self.client.get(old[2]), None)
+        # shrinking removes the chunks past the end
+        self.assertEqual(largeobject.updateLarge(self.clients, key, str(data[:2100])), 1)
+        self.assertEqual(largeobject.getLarge(self.clients, key), str(data[:2100]))
+        self.assertEqual(len(self.client.getKeyRange(key + '/', key + '/\xff')), 3)
+
+    def test_update_keeps_old_readers(self):
+        key = self.buildKey(1)
+        data = bytearray(os.urandom(5000))
+        largeobject.putLarge(self.clients, key, str(data), chunk_size=1000)
+        old = largeobject.getManifest(self.clients, key)
+        chunks = [self.client.get(k) for k in old.chunkKeys(key)[:3]]
+        data[1500:1510] = 'x' * 10
+        b = self.client.begin_batch
+        committed = []
+
+        def begin_batch():
+            # a reader of the old manifest, before the replaced chunk is removed
+            batch = b()
+            commit = batch.commit
+
+            def check():
+                commit()
+                committed.append([self.client.get(k) for k in old.chunkKeys(key)[:3]])
+            batch.commit = check
+            return batch
+        self.client.begin_batch = begin_batch
+        try:
+            self.assertEqual(largeobject.updateLarge(self.clients, key, str(data)), 1)
+        finally:
+            del self.client.begin_batch
+        self.assertEqual([c.value for c in committed[0]], [c.value for c in chunks])
+
+    def test_update_compressed(self):
+        key = self.buildKey(1)
+        clients = [Client(self.host, self.port, compression=Compressor()) for _ in range(2)]
+        for c in clients:
+            c.connect()
+        try:
+            data = bytearray(''.join('line %d of a compressible object\n' % i for i in range(340)))
+            manifest = largeobject.putLarge(clients, key, str(data), chunk_size=1000)
+            self.assertEqual(manifest.chunks, 12)
+            # stored compressed, tagged as given
+            stored = self.client.get(manifest.chunkKey(key, 0))
+            self.assertTrue(len(stored.value) < 1000)
+            self.assertEqual(stored.metadata.tag, hashlib.sha1(data[:1000]).digest())
+            data[5000:5005] = 'xxxxx'
+            self.assertEqual(largeobject.updateLarge(clients, key, str(data)), 1)
+            self.assertEqual(largeobject.getLarge(clients, key), str(data))
+        finally:
+            for c in clients:
+                c.close()
+
+    def test_update_copy_on_write(self):
+        key = self.buildKey(1)
+        data = bytearray(os.urandom(5000))
+        largeobject.putLarge(self.clients, key, str(data), chunk_size=1000)
+        self.client.limits.maxOperationCountPerBatch = 0 # no batches
+        data[10:20] = 'x' * 10
+        data += 'y' * 1500
+        self.assertEqual(largeobject.updateLarge(self.clients, key, StringIO(str(data))), 3)
+        manifest = largeobject.getManifest(self.clients, key)
+        self.assertEqual(sorted(manifest.overrides), [0, 5, 6])
+        self.assertEqual(largeobject.getLarge(self.clients, key), str(data))
+        self.assertEqual(len(self.client.getKeyRange(key + '/', key + '/\xff')), 7)
+
+    def test_update_version(self):
+        key = self.buildKey(1)
+        largeobject.putLarge(self.clients, key, 'a' * 3000, chunk_size=1000, new_version='1')
+        self.assertEqual(largeobject.updateLarge(self.clients, key, 'a' * 2000 + 'b' * 1000,
+                                                 new_version='2'), 1)
+        self.assertEqual(largeobject.getManifest(self.clients, key).version, '2')
+        self.assertRaises(common.KineticException, largeobject.updateLarge, self.clients, key,
+                          'c' * 3000, version='1', new_version='3')
+        self.assertEqual(largeobject.getLarge(self.clients, key), 'a' * 2000 + 'b' * 1000)
+
+    def test_update_missing(self):
+        key = self.buildKey(1)
+        self.assertEqual(largeobject.updateLarge(self.clients, key, 'a' * 3000, chunk_size=1000), 3)
+        self.assertEqual(largeobject.getLarge(self.clients, key), 'a' * 3000)
+
+    def test_not_a_manifest(self):
+        key = self.buildKey(1)
+        self.client.put(key, 'value')
+        self.assertRaises(common.KineticClientException, largeobject.getLarge, self.clients, key)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,127 @@
+# Copyright 2013-2015 Seagate Technology LLC.
+#
+# This Source Code Form is subject to the terms of the Mozilla
+# Public License, v. 2.0. If a copy of the MPL was not
+# distributed with this file, You can obtain one at
+# https://mozilla.org/MP:/2.0/.
+#
+# This program is distributed in the hope that it will be useful,
+# but is provided AS-IS, WITHOUT ANY WARRANTY; including without
+# the implied warranty of MERCHANTABILITY, NON-INFRINGEMENT or
+# FITNESS FOR A PARTICULAR PURPOSE. See the Mozilla Public
+# License for more details.
+#
+# See www.openkinetic.org for more project information
+#
+
+import os
+import tempfile
+import unittest
+import eventlet
+
+from kinetic import Client
+from kinetic import KineticMessageException
+import kinetic.kinetic_pb2 as messages
+from kinetic.proxy import Proxy
+from base import BaseTestCase
+
+
+class ProxyTestCase(BaseTestCase):
+
+    def setUp(self):
+        super(ProxyTestCase, self).setUp()
+        self.path = os.path.join(tempfile.mkdtemp(), 'kinetic.sock')
+        self.proxy = Proxy(self.path, self.host, self.port, connections=2)
+        self.proxy.start()
+        self.client = self.connect()
+
+    def tearDown(self):
+        super(ProxyTestCase, self).tearDown()
+        self.client.close()
+        self.proxy.stop()
+        os.rmdir(os.path.dirname(self.path))
+
+    def connect(self, **kwargs):
+        c = Client(socket_path=self.path, **kwargs)
+        c.connect()
+        return c
+
+    def test_handshake(self):
+        self.assertEqual(self.client.limits.maxKeySize,
+                         self.proxy.upstreams[0].limits.maxKeySize)
+        self.assertEqual(str(self.client), self.path)
+
+    def test_put_get(self):
+        self.client.put(self.buildKey(1), 'test_value')
+        self.assertEqual(self.client.get(self.buildKey(1)).value, 'test_value')
+        self.client.delete(self.buildKey(1))
+        self.assertEqual(self.client.get(self.buildKey(1)), None)
+
+    def test_errors(self):
+        self.client.put(self.buildKey(1), 'test_value', new_version='1')
+        self.assertRaises(KineticMessageException, self.client.put,
+                          self.buildKey(1), 'test_value', new_version='2')
+
+    def test_many_clients(self):
+        clients = [self.connect() for _ in range(4)]
+        try:
+            pool = eventlet.greenpool.GreenPool()
+
+            def work(i):
+                c = clients[i % len(clients)]
+                c.put(self.buildKey(i), 'test_value_%d' % i)
+                return c.get(self.buildKey(i)).value
+
+            xs = list(pool.imap(work, range(40)))
+            self.assertEqual(xs, ['test_value_%d' % i for i in range(40)])
+        finally:
+            for c in clients:
+                c.close()
+
+    def test_batch(self):
+        other = self.connect()
+        try:
+            b1 = self.client.begin_batch()
+            b2 = other.begin_batch()
+            b1.put(self.buildKey(1), 'test_value_1')
+            b2.put(self.buildKey(2), 'test_value_2')
+            b1.commit()
+            b2.abort()
+        finally:
+            other.close()
+        self.assertEqual(self.client.get(self.buildKey(1)).value, 'test_value_1')
+        self.assertEqual(self.client.get(self.buildKey(2)), None)
+
+    def test_disconnect_in_batch(self):
+        aborted = []
+        for upstream in self.proxy.upstreams:
+            def forward(cmd, value, pin, callback, forward=upstream.forward):
+                if cmd.header.messageType == messages.Command.ABORT_BATCH:
+                    aborted.append(cmd.header.batchID)
+                return forward(cmd, value, pin, callback)
+            upstream.forward = forward
+        limit = self.client.limits.maxBatchCountPerDevice
+        for i in range(limit + 1):
+            c = self.connect()
+            b = c.begin_batch()
+            b.put(self.buildKey(i), 'test_value')
+            c.close()
+        eventlet.sleep(0.1)
+        # the abandoned batches were aborted on the device
+        self.assertEqual(len(aborted), limit + 1)
+        b = self.client.begin_batch()
+        b.put(self.buildKey('last'), 'test_value')
+        b.commit()
+        self.assertEqual(self.client.get(self.buildKey('last')).value, 'test_value')
+        self.assertEqual(self.client.get(self.buildKey(0)), None)
+
+    def test_wrong_secret(self):
+        c = self.connect(secret='wrong')
+        try:
+            self.assertRaises(KineticMessageException, c.noop)
+        finally:
+            c.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,276 @@
+# Copyright 2013-2015 Seagate Technology LLC.
+#
+# This Source Code Form is subject to the terms of the Mozilla
+# Public License, v. 2.0. If a copy of the MPL was not
+# distributed with this file, You can obtain one at
+# https://mozilla.org/MP:/2.0/.
+#
+# This program is distributed in the hope that it will be useful,
+# but is provided AS-IS, WITHOUT ANY WARRANTY; including without
+# the implied warranty of MERCHANTABILITY, NON-INFRINGEMENT or
+# FITNESS FOR A PARTICULAR PURPOSE. See the Mozilla Public
+# License for more details.
+#
+# See www.openkinetic.org for more project information
+#
+
+import os
+import unittest
+import eventlet
+
+from kinetic import ReplicatedCluster
+from kinetic import largeobject
+from kinetic import KineticMessageException
+from kinetic.common import ReplicaConflictException
+from kinetic.replication import LatencyHistogram
+from base import MultiSimulatorTestCase
+
+
+class SlowClient(object):
+    # delays the reads of a client
+
+    def __init__(self, client, delay):
+        self.client = client
+        self.delay = delay
+
+    def getAsync(self, onSuccess, onError, *args, **kwargs):
+        eventlet.spawn_after(self.delay, self.client.getAsync, onSuccess, onError,
+                             *args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+
+class RacingClient(object):
+    # runs hook before the next put
+
+    def __init__(self, client, hook):
+        self.client = client
+        self.hook = hook
+
+    def _run(self):
+        hook, self.hook = self.hook, None
+        if hook:
+            hook()
+
+    def putAsync(self, *args, **kwargs):
+        self._run()
+        self.client.putAsync(*args, **kwargs)
+
+    def put(self, *args, **kwargs):
+        self._run()
+        return self.client.put(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+
+class LatencyHistogramTestCase(unittest.TestCase):
+
+    def test_percentile(self):
+        h = LatencyHistogram()
+        self.assertEqual(h.percentile(0.5), None)
+        for i in range(90):
+            h.add(0.001)
+        for i in range(10):
+            h.add(0.1)
+        self.assertTrue(0.001 <= h.percentile(0.5) < 0.00125)
+        self.assertTrue(0.001 <= h.percentile(0.9) < 0.00125)
+        self.assertTrue(0.1 <= h.percentile(0.95) < 0.125)
+
+    def test_decay(self):
+        h = LatencyHistogram(window=100)
+        for i in range(100):
+            h.add(0.1)
+        self.assertTrue(h.percentile(0.5) >= 0.1)
+        for i in range(400):
+            h.add(0.001)
+        self.assertTrue(h.percentile(0.9) < 0.00125)
+
+
+class ReplicatedClusterTestCase(MultiSimulatorTestCase):
+
+    PORTS = (9010, 9020, 9030)
+
+    def setUp(self):
+        super(ReplicatedClusterTestCase, self).setUp()
+        self.cluster = ReplicatedCluster([('localhost', port) for port in self.ports])
+        self.cluster.connect()
+
+    def tearDown(self):
+        self.cluster.close()
+        super(ReplicatedClusterTestCase, self).tearDown()
+
+    def replicas(self, key):
+        return [self.cluster.clients[n] for n in self.cluster.replicasFor(key)]
+
+    def test_put_writes_every_replica(self):
+        key = self.buildKey(1)
+        self.cluster.put(key, 'value')
+        eventlet.sleep(0.1)
+        versions = set(c.getVersion(key) for c in self.replicas(key))
+        self.assertEqual(len(versions), 1)
+        self.assertTrue(versions.pop())
+        self.assertEqual(self.cluster.get(key).value, 'value')
+
+    def test_quorum_with_replica_down(self):
+        key = self.buildKey(1)
+        down = self.replicas(key)[2]
+        down.close()
+        self.cluster.put(key, 'value')
+        self.assertEqual(self.cluster.get(key).value, 'value')
+        self.assertEqual(self.cluster.repairs, 1)
+
+    def test_no_quorum(self):
+        key = self.buildKey(1)
+        for c in self.replicas(key)[1:]:
+            c.close()
+        self.assertRaises(Exception, self.cluster.put, key, 'value')
+
+    def test_version_mismatch(self):
+        key = self.buildKey(1)
+        self.cluster.put(key, 'value', new_version='1')
+        self.assertRaises(KineticMessageException, self.cluster.put, key, 'value',
+                          version='2', new_version='3')
+        self.cluster.put(key, 'value2', version='1', new_version='2')
+        self.assertEqual(self.cluster.getVersion(key), '2')
+
+    def test_delete(self):
+        key = self.buildKey(1)
+        self.cluster.put(key, 'value', new_version='1')
+        self.assertTrue(self.cluster.delete(key, version='1'))
+        eventlet.sleep(0.1)
+        for c in self.replicas(key):
+            self.assertEqual(c.get(key), None)
+        self.assertFalse(self.cluster.delete(key, force=True))
+
+    def test_forced_writes(self):
+        key = self.buildKey(1)
+        self.cluster.put(key, 'value', new_version='1')
+        self.cluster.put(key, 'value2', new_version='2', force=True)
+        self.assertEqual(self.cluster.getVersion(key), '2')
+        self.assertTrue(self.cluster.delete(key, force=True))
+        self.assertEqual(self.cluster.get(key), None)
+
+    def test_consistent_get_repairs(self):
+        key = self.buildKey(1)
+        self.cluster.put(key, 'value', new_version='1')
+        eventlet.sleep(0.1)
+        stale = self.replicas(key)[0]
+        stale.put(key, 'other', force=True, new_version='x')
+        # fastest is the stale one
+        self.cluster.latency = dict((n, 1.0) for n in self.cluster.clients)
+        self.cluster.latency[self.cluster.replicasFor(key)[0]] = 0
+        entry = self.cluster.get(key, consistent=True)
+        self.assertEqual(entry.value, 'value')
+        self.assertEqual(self.cluster.conflicts, 1)
+        eventlet.sleep(0.1)
+        self.assertEqual(stale.get(key).value, 'value')
+
+    def test_repair_keeps_newer_write(self):
+        key = self.buildKey(1)
+        self.cluster.put(key, 'value', new_version='1')
+        eventlet.sleep(0.1)
+        name = self.cluster.replicasFor(key)[0]
+        stale = self.cluster.clients[name]
+        stale.put(key, 'other', force=True, new_version='x')
+        # written again before the repair gets there
+        self.cluster.clients[name] = RacingClient(
+            stale, lambda: stale.put(key, 'newer', force=True, new_version='y'))
+        self.assertEqual(self.cluster.get(key, consistent=True).value, 'value')
+        eventlet.sleep(0.1)
+        self.assertEqual(stale.get(key).value, 'newer')
+        self.assertEqual(self.cluster.repair_failures, 0)
+
+    def test_rebalance_keeps_newer_write(self):
+        keys = [self.buildKey(i) for i in range(5)]
+        name = self.cluster.replicasFor(keys[0])[0]
+        self.cluster.ring.remove(name)
+        for k in keys:
+            self.cluster.put(k, 'value', new_version='1')
+        self.cluster.ring.add(name)
+        # written to the new replica while the rebalance copies it
+        client = self.cluster.clients[name]
+        self.cluster.clients[name] = RacingClient(
+            client, lambda: client.put(keys[0], 'newer', new_version='2'))
+        self.cluster.rebalance(keys[0], keys[0])
+        self.assertEqual(client.get(keys[0]).value, 'newer')
+        self.cluster.rebalance()
+        for k in keys[1:]:
+            self.assertEqual(client.get(k).value, 'value')
+
+    def test_conflict(self):
+        key = self.buildKey(1)
+        for i, c in enumerate(self.replicas(key)):
+            c.put(key, 'value', force=True, new_version=str(i))
+        self.assertRaises(ReplicaConflictException, self.cluster.get, key, consistent=True)
+
+    def test_many_and_ranges(self):
+        items = [(self.buildKey('%02d' % i), 'value%d' % i) for i in range(20)]
+        self.cluster.putMany(items)
+        self.assertEqual([e.value for e in self.cluster.getMany([k for k, _ in items])],
+                         [v for _, v in items])
+        keys = [k for k, _ in items]
+        self.assertEqual(self.cluster.getKeyRange(keys[0], keys[-1]), keys)
+        self.assertEqual([e.key for e in self.cluster.getRange(keys[0], keys[-1], prefetch=7)], keys)
+
+    def test_large_objects(self):
+        key = self.buildKey(1)
+        data = bytearray(os.urandom(5000))
+        largeobject.putLarge(self.cluster, key, str(data), chunk_size=1000)
+        data[2500:2510] = 'x' * 10
+        self.assertEqual(largeobject.updateLarge(self.cluster, key, str(data)), 1)
+        self.assertEqual(largeobject.getLarge(self.cluster, key), str(data))
+        eventlet.sleep(0.1)
+        # the manifest and every chunk went to all of their replicas
+        keys = [key] + largeobject.getManifest(self.cluster, key).chunkKeys(key)
+        for k in keys:
+            for c in self.replicas(k):
+                self.assertNotEqual(c.get(k), None)
+        self.assertTrue(largeobject.deleteLarge(self.cluster, key))
+        eventlet.sleep(0.1)
+        for c in self.cluster.clients.values():
+            self.assertEqual(c.getKeyRange(key, key + '/\xff'), [])
+
+    def test_latency(self):
+        key = self.buildKey(1)
+        self.cluster.put(key, 'value')
+        eventlet.sleep(0.1)
+        self.assertEqual(set(self.cluster.latency), set(self.cluster.replicasFor(key)))
+        self.assertEqual(set(self.cluster.histograms), set(self.cluster.replicasFor(key)))
+
+    def test_hedged_read(self):
+        key = self.buildKey(1)
+        self.cluster.put(key, 'value')
+        eventlet.sleep(0.1)
+        names = self.cluster._fastest(self.cluster.replicasFor(key))
+        self.cluster.clients[names[0]] = SlowClient(self.cluster.clients[names[0]], 1.0)
+        self.cluster.hedge_delay = 0.01
+        self.assertEqual(self.cluster.get(key).value, 'value')
+        self.assertEqual(self.cluster.reads, 1)
+        self.assertEqual(self.cluster.hedges, 1)
+        self.assertEqual(self.cluster.hedge_wins, 1)
+        self.assertEqual(self.cluster.hedge_rate, 1.0)
+
+    def test_no_hedge_when_fast(self):
+        key = self.buildKey(1)
+        self.cluster.put(key, 'value')
+        self.cluster.hedge_delay = 1.0
+        for i in range(5):
+            self.assertEqual(self.cluster.get(key).value, 'value')
+        self.assertEqual(self.cluster.reads, 5)
+        self.assertEqual(self.cluster.hedges, 0)
+
+    def test_hedging_disabled(self):
+        key = self.buildKey(1)
+        self.cluster.put(key, 'value')
+        eventlet.sleep(0.1)
+        names = self.cluster._fastest(self.cluster.replicasFor(key))
+        self.cluster.clients[names[0]] = SlowClient(self.cluster.clients[names[0]], 0.2)
+        self.cluster.hedge_percentile = None
+        self.assertEqual(self.cluster.get(key).value, 'value')
+        self.assertEqual(self.cluster.hedges, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
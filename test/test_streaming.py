@@ -0,0 +1,141 @@
+# Copyright 2013-2015 Seagate Technology LLC.
+#
+# This Source Code Form is subject to the terms of the Mozilla
+# Public License, v. 2.0. If a copy of the MPL was not
+# distributed with this file, You can obtain one at
+# https://mozilla.org/MP:/2.0/.
+#
+# This program is distributed in the hope that it will be useful,
+# but is provided AS-IS, WITHOUT ANY WARRANTY; including without
+# the implied warranty of MERCHANTABILITY, NON-INFRINGEMENT or
+# FITNESS FOR A PARTICULAR PURPOSE. See the Mozilla Public
+# License for more details.
+#
+# See www.openkinetic.org for more project information
+#
+
+import hashlib
+import mmap
+import os
+import tempfile
+import unittest
+from StringIO import StringIO
+
+import eventlet
+
+from kinetic import Client
+from kinetic import common
+from kinetic import streaming
+from kinetic import zero_copy
+from kinetic.streaming import StreamValue
+from kinetic.zero_copy import ZeroCopyValue
+from base import BaseTestCase
+
+
+class FileDigestTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.data = os.urandom(3 * mmap.ALLOCATIONGRANULARITY)
+        self.file = tempfile.TemporaryFile()
+        self.file.write(self.data)
+        self.file.flush()
+
+    def tearDown(self):
+        self.file.close()
+
+    def test_digest(self):
+        fd = self.file.fileno()
+        for offset, length in [(0, len(self.data)), (1, 100), (mmap.ALLOCATIONGRANULARITY + 7, 5000),
+                               (10, 0)]:
+            self.assertEqual(streaming.file_digest(fd, offset, length),
+                             hashlib.sha1(self.data[offset:offset + length]).digest())
+
+    def test_chunks(self):
+        chunks = list(streaming.file_chunks(self.file.fileno(), 5, 10000, 3000))
+        self.assertEqual([len(c) for c in chunks], [3000, 3000, 3000, 1000])
+        self.assertEqual(''.join(chunks), self.data[5:10005])
+
+    def test_prehash(self):
+        fd = self.file.fileno()
+        values = [ZeroCopyValue(fd, offset, 2000) for offset in range(0, 12000, 2000)]
+        hashed = []
+        for value in zero_copy.prehash(iter(values), lookahead=2):
+            hashed.append(value)
+            self.assertEqual(value.digest, hashlib.sha1(self.data[value.offset:value.offset + 2000]).digest())
+            self.assertEqual(value.integrity()[0], value.digest)
+        self.assertEqual(hashed, values)
+        unchecked = ZeroCopyValue(fd, 0, 100, checksum=False)
+        self.assertEqual(list(zero_copy.prehash([unchecked])), [unchecked])
+        self.assertEqual(unchecked.digest, None)
+
+    def test_large_digest_yields(self):
+        # over the threshold, well under a whole value
+        data = os.urandom(4 * zero_copy.THREADED_DIGEST_SIZE)
+        self.assertTrue(len(data) < common.MAX_VALUE_SIZE)
+        ticks = []
+        done = []
+
+        def tick():
+            while not done:
+                ticks.append(1)
+                eventlet.sleep(0)
+        with tempfile.TemporaryFile() as f:
+            f.write(data)
+            f.flush()
+            ticker = eventlet.spawn(tick)
+            tag, _ = ZeroCopyValue(f).integrity()
+            # other greenthreads ran while hashing
+            hashing_ticks = len(ticks)
+            done.append(True)
+            ticker.wait()
+        self.assertEqual(tag, hashlib.sha1(data).digest())
+        self.assertTrue(hashing_ticks > 0)
+
+
+class StreamingPutTestCase(BaseTestCase):
+
+    def setUp(self):
+        super(StreamingPutTestCase, self).setUp()
+        self.client = Client(self.host, self.port)
+        self.client.connect()
+        self.data = os.urandom(200000)
+
+    def test_generator(self):
+        def produce():
+            for i in xrange(0, len(self.data), 7000):
+                yield self.data[i:i + 7000]
+        value = StreamValue(produce(), len(self.data))
+        self.client.put(self.buildKey(1), value)
+        self.assertEqual(value.digest, hashlib.sha1(self.data).digest())
+        self.assertEqual(self.client.get(self.buildKey(1)).value, self.data)
+
+    def test_file_like(self):
+        source = StringIO(self.data + 'trailing')
+        value = StreamValue(source, len(self.data), chunk_size=1000)
+        self.client.put(self.buildKey(1), value, tag=hashlib.sha1(self.data).digest(),
+                        algorithm=common.IntegrityAlgorithms.SHA1)
+        self.assertEqual(value.digest, hashlib.sha1(self.data).digest())
+        self.assertEqual(source.read(), 'trailing')
+        self.assertEqual(self.client.get(self.buildKey(1)).value, self.data)
+
+    def test_short_source_faults(self):
+        # on its own client, faulted clients can't be used anymore
+        c = Client(self.host, self.port)
+        c.connect()
+        self.assertRaises(Exception, c.put, self.buildKey(1), StreamValue(iter(['abc']), 10))
+        self.assertTrue(c.faulted)
+
+    def test_file_tagged(self):
+        with tempfile.TemporaryFile() as f:
+            f.write(self.data)
+            f.flush()
+            self.client.put(self.buildKey(1), ZeroCopyValue(f, 1000, 50000))
+            self.client.put(self.buildKey(2), ZeroCopyValue(f, checksum=False))
+        m = self.client.getMetadata(self.buildKey(1)).metadata
+        self.assertEqual(m.algorithm, common.IntegrityAlgorithms.SHA1)
+        self.assertEqual(m.tag, hashlib.sha1(self.data[1000:51000]).digest())
+        self.assertEqual(self.client.getMetadata(self.buildKey(2)).metadata.tag, 'l337')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,213 @@
+# Copyright 2013-2015 Seagate Technology LLC.
+#
+# This Source Code Form is subject to the terms of the Mozilla
+# Public License, v. 2.0. If a copy of the MPL was not
+# distributed with this file, You can obtain one at
+# https://mozilla.org/MP:/2.0/.
+#
+# This program is distributed in the hope that it will be useful,
+# but is provided AS-IS, WITHOUT ANY WARRANTY; including without
+# the implied warranty of MERCHANTABILITY, NON-INFRINGEMENT or
+# FITNESS FOR A PARTICULAR PURPOSE. See the Mozilla Public
+# License for more details.
+#
+# See www.openkinetic.org for more project information
+#
+
+import mmap
+import os
+import tempfile
+import unittest
+
+from kinetic import Client
+from kinetic import zero_copy
+from kinetic.zero_copy import ZeroCopyValue
+from base import BaseTestCase
+
+
+def open_fds():
+    return len(os.listdir('/proc/self/fd'))
+
+
+class ZeroCopyPutTestCase(BaseTestCase):
+
+    def setUp(self):
+        super(ZeroCopyPutTestCase, self).setUp()
+        self.client = Client(self.host, self.port)
+        self.client.connect()
+        self.data = os.urandom(300000)
+        self.file = tempfile.TemporaryFile()
+        self.file.write(self.data)
+        self.file.flush()
+
+    def tearDown(self):
+        super(ZeroCopyPutTestCase, self).tearDown()
+        self.file.close()
+
+    def test_put_file(self):
+        self.client.put(self.buildKey(1), ZeroCopyValue(self.file))
+        self.assertEqual(self.client.get(self.buildKey(1)).value, self.data)
+
+    def test_offset_and_length(self):
+        self.client.put(self.buildKey(1), ZeroCopyValue(self.file.fileno(), 1000, 5000))
+        self.assertEqual(self.client.get(self.buildKey(1)).value, self.data[1000:6000])
+        # the file position is untouched
+        self.assertEqual(self.file.tell(), len(self.data))
+
+    def test_async_pipelined(self):
+        done = []
+        for i in range(10):
+            self.client.putAsync(lambda r: done.append(r), self.fail, self.buildKey(i),
+                                 ZeroCopyValue(self.file, i * 1000, 20000))
+        self.client.wait()
+        self.assertEqual(len(done), 10)
+        for i in range(10):
+            self.assertEqual(self.client.get(self.buildKey(i)).value,
+                             self.data[i * 1000:i * 1000 + 20000])
+
+    def test_splice_from_pipe(self):
+        r, w = os.pipe()
+        try:
+            os.write(w, self.data[:30000])
+            self.client.put(self.buildKey(1), ZeroCopyValue(r, None, 30000))
+        finally:
+            os.close(r)
+            os.close(w)
+        self.assertEqual(self.client.get(self.buildKey(1)).value, self.data[:30000])
+
+    def test_pipes_reused(self):
+        zero_copy.pipes.clear()
+        r, w = os.pipe()
+        try:
+            os.write(w, 'x' * 100)
+            self.client.put(self.buildKey(1), ZeroCopyValue(r, None, 50))
+            before = open_fds()
+            created = zero_copy.pipes.created
+            self.client.put(self.buildKey(2), ZeroCopyValue(r, None, 50))
+            self.assertEqual(open_fds(), before)
+            self.assertEqual(zero_copy.pipes.created, created)
+        finally:
+            os.close(r)
+            os.close(w)
+        self.assertEqual(self.client.get(self.buildKey(2)).value, 'x' * 50)
+
+
+class GetIntoTestCase(BaseTestCase):
+
+    def setUp(self):
+        super(GetIntoTestCase, self).setUp()
+        self.client = Client(self.host, self.port)
+        self.client.connect()
+        self.data = os.urandom(300000)
+        self.client.put(self.buildKey(1), self.data)
+        self.file = tempfile.TemporaryFile()
+
+    def tearDown(self):
+        super(GetIntoTestCase, self).tearDown()
+        self.file.close()
+
+    def read(self):
+        self.file.seek(0)
+        return self.file.read()
+
+    def test_get_into_file(self):
+        entry = self.client.get_into(self.buildKey(1), self.file)
+        self.assertEqual(entry.key, self.buildKey(1))
+        self.assertEqual(entry.value, len(self.data))
+        self.assertTrue(entry.metadata.tag)
+        self.assertEqual(self.read(), self.data)
+
+    def test_offset(self):
+        self.file.write('header')
+        self.client.get_into(self.buildKey(1), self.file.fileno(), 1000)
+        content = self.read()
+        self.assertEqual(content[:6], 'header')
+        self.assertEqual(content[1000:], self.data)
+
+    def test_not_found(self):
+        self.assertEqual(self.client.get_into(self.buildKey(2), self.file), None)
+        self.assertEqual(self.read(), '')
+
+    def test_pipelined_with_gets(self):
+        self.client.put(self.buildKey(2), 'small')
+        results = []
+        for i in range(5):
+            self.client.get_into_async(results.append, self.fail, self.buildKey(1),
+                                       self.file, i * len(self.data))
+            self.client.getAsync(results.append, self.fail, self.buildKey(2))
+        self.client.wait()
+        self.assertEqual(len(results), 10)
+        self.assertEqual([r.value for r in results[1::2]], ['small'] * 5)
+        self.assertEqual(self.read(), self.data * 5)
+
+    def test_to_pipe(self):
+        self.client.put(self.buildKey(2), self.data[:30000])
+        r, w = os.pipe()
+        try:
+            self.client.get_into(self.buildKey(2), w)
+            self.assertEqual(os.read(r, 65536), self.data[:30000])
+        finally:
+            os.close(r)
+            os.close(w)
+        # the connection is still usable
+        self.assertEqual(self.client.get(self.buildKey(1)).value, self.data)
+
+    def test_object_without_descriptor(self):
+        class Collector(object):
+            def __init__(self):
+                self.chunks = []
+            def write(self, data):
+                self.chunks.append(str(data))
+        target = Collector()
+        self.client.get_into(self.buildKey(1), target)
+        self.assertEqual(''.join(target.chunks), self.data)
+
+    def test_bytearray(self):
+        buf = bytearray(len(self.data) + 10)
+        entry = self.client.get_into(self.buildKey(1), buf, 10)
+        self.assertEqual(entry.value, len(self.data))
+        self.assertEqual(buf[:10], '\0' * 10)
+        self.assertEqual(buf[10:], self.data)
+
+    def test_memoryview_and_mmap(self):
+        buf = bytearray(len(self.data))
+        self.client.get_into(self.buildKey(1), memoryview(buf))
+        self.assertEqual(buf, self.data)
+        m = mmap.mmap(-1, len(self.data) + 5)
+        try:
+            self.client.get_into(self.buildKey(1), m, 5)
+            self.assertEqual(m[5:], self.data)
+        finally:
+            m.close()
+
+    def test_buffer_too_small(self):
+        buf = bytearray(1000)
+        self.assertRaises(ValueError, self.client.get_into, self.buildKey(1), buf)
+        self.assertRaises(ValueError, self.client.get_into, self.buildKey(1),
+                          bytearray(len(self.data)), 1)
+        # the value was drained
+        self.assertEqual(self.client.get(self.buildKey(1)).value, self.data)
+
+    def test_read_only_buffer(self):
+        self.assertRaises(TypeError, self.client.get_into, self.buildKey(1), 'x' * len(self.data))
+
+    def test_failed_send(self):
+        errors = []
+        self.client.faulted = True
+        try:
+            self.client.get_into_async(self.fail, errors.append, self.buildKey(1), bytearray(10))
+        finally:
+            self.client.faulted = False
+        self.assertEqual(len(errors), 1)
+        self.assertEqual(self.client._unsent_sinks, {})
+
+    def test_bad_descriptor(self):
+        r, w = os.pipe()
+        os.close(r)
+        os.close(w)
+        self.assertRaises(OSError, self.client.get_into, self.buildKey(1), w)
+        self.assertEqual(self.client.get(self.buildKey(1)).value, self.data)
+
+
+if __name__ == '__main__':
+    unittest.main()